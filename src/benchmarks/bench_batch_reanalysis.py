@@ -0,0 +1,152 @@
+# src/benchmarks/bench_batch_reanalysis.py
+"""Переанализ приемов пищи против локальной заглушки Batch API.
+
+Проверяет, что пиковая память не растет с числом приемов пищи и что
+задание, прерванное посреди работы, продолжается без потерь - в том
+числе после падения между созданием batch и его записью в базу, без
+повторной оплаты пачки.
+
+Запуск из каталога src: python -m benchmarks.bench_batch_reanalysis [число_приемов_пищи]
+"""
+import os
+import sys
+import json
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from types import SimpleNamespace
+from database.db_manager import DatabaseManager
+from services.batch_reanalysis import BatchReanalysisJob, MealSource
+
+FAKE_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 2000
+
+
+class StubBatchAPI:
+    """Минимальная реализация files и batches, хранящая данные на диске"""
+
+    def __init__(self, directory, polls_until_done=2):
+        self.directory = directory
+        self.polls_until_done = polls_until_done
+        self.batches_state = {}
+        self.counter = 0
+        self.files = SimpleNamespace(
+            create=self._create_file,
+            with_streaming_response=SimpleNamespace(content=self._content)
+        )
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve, list=self._list)
+
+    def _new_id(self, prefix):
+        self.counter += 1
+        return f"{prefix}-{self.counter}"
+
+    def _create_file(self, file, purpose):
+        file_id = self._new_id('file')
+        with open(os.path.join(self.directory, file_id), 'wb') as stored:
+            for line in file:
+                stored.write(line)
+        return SimpleNamespace(id=file_id)
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = self._new_id('batch')
+        self.batches_state[batch_id] = {'input': input_file_id, 'polls': 0, 'output': None}
+        return SimpleNamespace(id=batch_id, status='validating', output_file_id=None)
+
+    def _list(self, limit):
+        return [SimpleNamespace(id=batch_id, input_file_id=state['input'], status='in_progress')
+                for batch_id, state in self.batches_state.items()]
+
+    def _retrieve(self, batch_id):
+        state = self.batches_state[batch_id]
+        state['polls'] += 1
+        if state['polls'] < self.polls_until_done:
+            return SimpleNamespace(id=batch_id, status='in_progress', output_file_id=None)
+        if state['output'] is None:
+            state['output'] = self._new_id('file')
+            with open(os.path.join(self.directory, state['input']), encoding='utf-8') as requests, \
+                    open(os.path.join(self.directory, state['output']), 'w', encoding='utf-8') as output:
+                for line in requests:
+                    request = json.loads(line)
+                    dish = request['body']['messages'][1]['content'][1]['text']
+                    output.write(json.dumps({
+                        'custom_id': request['custom_id'],
+                        'response': {'status_code': 200, 'body': {
+                            'choices': [{'message': {'content': f"Переанализ: {dish}"}}]
+                        }},
+                        'error': None
+                    }, ensure_ascii=False) + "\n")
+        return SimpleNamespace(id=batch_id, status='completed', output_file_id=state['output'])
+
+    @contextmanager
+    def _content(self, file_id):
+        with open(os.path.join(self.directory, file_id), encoding='utf-8') as stored:
+            yield SimpleNamespace(iter_lines=lambda: (line.rstrip("\n") for line in stored))
+
+
+class FakeBot:
+    def get_file(self, file_id):
+        return SimpleNamespace(file_path=file_id)
+
+    def download_file(self, file_path):
+        return FAKE_JPEG
+
+
+class Interrupted(Exception):
+    pass
+
+
+def run(meals, interrupt_after_chunks=None, crash_before_recording=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        db.connection.executemany(
+            "INSERT INTO meals (user_id, created_at, file_ids, dish, analysis) VALUES (?, 0, ?, ?, '')",
+            ((i % 100, f"file{i}", f"блюдо {i}") for i in range(meals))
+        )
+        db.connection.commit()
+        api = StubBatchAPI(tmp)
+        job = BatchReanalysisJob(db, api, MealSource(db, FakeBot()), chunk_size=250, sleep=lambda s: None)
+
+        job_id = None
+        if interrupt_after_chunks:
+            # Падение перед отправкой очередной пачки или сразу после создания ее batch
+            target, name = (db, 'set_batch_chunk_batch') if crash_before_recording else (job, 'submit')
+            original = getattr(target, name)
+            def crash(*args):
+                if len(api.batches_state) >= interrupt_after_chunks:
+                    raise Interrupted()
+                return original(*args)
+            setattr(target, name, crash)
+            try:
+                job.run()
+            except Interrupted:
+                job_id = db.connection.execute("SELECT MAX(id) FROM batch_jobs").fetchone()[0]
+            setattr(target, name, original)
+
+        tracemalloc.start()
+        job.run(job_id)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        done = db.connection.execute(
+            "SELECT COUNT(*) FROM meals WHERE analysis LIKE 'Переанализ:%'"
+        ).fetchone()[0]
+        status = db.get_batch_job(job_id or 1)[2]
+        db.connection.close()
+        return done, peak, len(api.batches_state), status
+
+
+def main():
+    meals = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for count in (meals // 5, meals):
+        done, peak, _, _ = run(count)
+        print(f"{count:6d} приемов пищи: обновлено {done}, пик памяти {peak / 1024:.0f} КБ")
+    chunks = -(-meals // 250)
+    done, _, batches, status = run(meals, interrupt_after_chunks=3)
+    print(f"С прерыванием после 3 пачек и продолжением: обновлено {done} из {meals}, "
+          f"batch {batches} на {chunks} пачек, задание {status}")
+    done, _, batches, status = run(meals, interrupt_after_chunks=3, crash_before_recording=True)
+    print(f"С падением до записи batch и продолжением: обновлено {done} из {meals}, "
+          f"batch {batches} на {chunks} пачек, задание {status}")
+
+
+if __name__ == "__main__":
+    main()
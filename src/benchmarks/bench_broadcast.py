@@ -0,0 +1,116 @@
+# src/benchmarks/bench_broadcast.py
+"""Рассылка на 100k получателей через локальную заглушку Telegram.
+
+Заглушка проверяет лимиты так же, как Telegram (30 сообщений/с на бота,
+1 сообщение/с в чат) и отвечает 429 с retry_after. Время виртуальное,
+поэтому прогон занимает секунды, а не час.
+
+Запуск из каталога src: python -m benchmarks.bench_broadcast [число_пользователей]
+"""
+import os
+import sys
+import time
+import tempfile
+from collections import deque, Counter
+from telebot.apihelper import ApiTelegramException
+from database.db_manager import DatabaseManager
+from services.broadcast import BroadcastService
+from services.rate_limiter import RateLimiter
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeTelegram:
+    """Заглушка send_message с лимитами Telegram"""
+
+    GLOBAL_LIMIT = 30
+
+    def __init__(self, clock, blocked=()):
+        self.clock = clock
+        self.blocked = set(blocked)
+        self.window = deque()
+        self.last_per_chat = {}
+        self.delivered = Counter()
+        self.flood_errors = 0
+
+    def _flood(self, retry_after):
+        self.flood_errors += 1
+        raise ApiTelegramException('sendMessage', None, {
+            'error_code': 429,
+            'description': 'Too Many Requests',
+            'parameters': {'retry_after': retry_after},
+        })
+
+    def send_message(self, chat_id, text, **kwargs):
+        now = self.clock.time()
+        while self.window and now - self.window[0] >= 1:
+            self.window.popleft()
+        if len(self.window) >= self.GLOBAL_LIMIT:
+            self._flood(1)
+        if now - self.last_per_chat.get(chat_id, -1) < 1:
+            self._flood(1)
+        if chat_id in self.blocked:
+            raise ApiTelegramException('sendMessage', None, {
+                'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'
+            })
+        self.window.append(now)
+        self.last_per_chat[chat_id] = now
+        self.delivered[chat_id] += 1
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        db.connection.executemany(
+            "INSERT INTO users (user_id, free_generations) VALUES (?, ?)",
+            ((user_id, user_id % 3) for user_id in range(1, users + 1))
+        )
+        db.connection.commit()
+
+        clock = VirtualClock()
+        telegram = FakeTelegram(clock, blocked=range(1, users + 1, 1000))
+        limiter = RateLimiter(global_rate=25, per_chat_rate=1, clock=clock.time, sleep=clock.sleep)
+        service = BroadcastService(telegram, db, rate_limiter=limiter)
+
+        broadcast_id = db.create_broadcast("Новые тарифы!", 'all')
+
+        # Прерываем рассылку на середине и продолжаем, как после перезапуска
+        original_send = service.send
+        def send_and_interrupt(chat_id, text):
+            if chat_id == users // 2:
+                service.stop()
+            return original_send(chat_id, text)
+        service.send = send_and_interrupt
+
+        started = time.perf_counter()
+        service.run(broadcast_id)
+        service.stop_event.clear()
+        service.send = original_send
+        sent, failed = service.run(broadcast_id)
+        elapsed = time.perf_counter() - started
+
+        duplicates = sum(1 for count in telegram.delivered.values() if count > 1)
+        print(f"Получателей: {users}, доставлено: {sent}, не доставлено: {failed}")
+        print(f"Дубликатов: {duplicates}, ответов 429: {telegram.flood_errors}")
+        print(f"Виртуальное время: {clock.now:.0f} с ({sent / clock.now:.1f} сообщений/с)")
+        print(f"Реальное время прогона: {elapsed:.2f} с")
+
+        zero_balance = db.create_broadcast("Пополни баланс", 'zero_balance')
+        clock.now += 1
+        zero_sent, zero_failed = service.run(zero_balance)
+        print(f"Сегмент zero_balance: отправлено {zero_sent + zero_failed}")
+        db.connection.close()
+
+
+if __name__ == "__main__":
+    main()
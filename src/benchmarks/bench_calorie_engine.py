@@ -0,0 +1,70 @@
+# src/benchmarks/bench_calorie_engine.py
+"""Скалярный и векторный расчет нормы калорий на 1M синтетических профилей.
+
+С флагом --db дополнительно создается временная база с профилями
+и замеряется полный пересчет recompute_all.
+
+Запуск из каталога src: python -m benchmarks.bench_calorie_engine [число_профилей] [--db]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from database.db_manager import DatabaseManager
+from services.calorie_engine import (
+    calculate_daily_calories, calculate_daily_calories_batch, recompute_all,
+    ACTIVITY_MULTIPLIERS, GOAL_ADJUSTMENTS
+)
+
+
+def synthetic_profiles(count, seed=42):
+    rng = np.random.default_rng(seed)
+    activities = np.array(list(ACTIVITY_MULTIPLIERS), dtype=object)
+    goals = np.array(list(GOAL_ADJUSTMENTS), dtype=object)
+    return (
+        rng.uniform(40, 150, count).round(1),
+        rng.uniform(150, 200, count).round(1),
+        rng.integers(16, 80, count),
+        activities[rng.integers(0, len(activities), count)].tolist(),
+        goals[rng.integers(0, len(goals), count)].tolist(),
+    )
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    count = int(args[0]) if args else 1000000
+    weights, heights, ages, activities, goals = synthetic_profiles(count)
+
+    started = time.perf_counter()
+    batch = calculate_daily_calories_batch(weights, heights, ages, activities, goals)
+    batch_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scalar = [
+        calculate_daily_calories(float(w), float(h), int(a), act, goal)
+        for w, h, a, act, goal in zip(weights.tolist(), heights.tolist(), ages.tolist(), activities, goals)
+    ]
+    scalar_time = time.perf_counter() - started
+
+    mismatches = int(np.count_nonzero(batch != np.array(scalar)))
+    print(f"Профилей: {count}")
+    print(f"Скалярно: {scalar_time:.2f} с, векторно: {batch_time:.3f} с "
+          f"(x{scalar_time / batch_time:.0f}), расхождений: {mismatches}")
+
+    if '--db' in sys.argv:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+            db.connection.executemany(
+                "INSERT INTO users (user_id, age, height, weight, goal, activity_level) VALUES (?, ?, ?, ?, ?, ?)",
+                zip(range(1, count + 1), ages.tolist(), heights.tolist(), weights.tolist(), goals, activities)
+            )
+            db.connection.commit()
+            started = time.perf_counter()
+            updated = recompute_all(db)
+            print(f"recompute_all: {updated} строк за {time.perf_counter() - started:.2f} с")
+            db.connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# src/benchmarks/bench_charts.py
+"""Графики прогресса: время отрисовки и доля отправок из кэша file_id.
+
+Пользователи открывают прогресс несколько раз, между просмотрами часть
+из них добавляет прием пищи. Telegram имитируется заглушкой, которая
+возвращает file_id загруженного фото; база настоящая (временный SQLite).
+Нужен matplotlib.
+
+Запуск из каталога src: python -m benchmarks.bench_charts [пользователей] [просмотров]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from types import SimpleNamespace
+from database.db_manager import DatabaseManager
+from services.charts import ChartService
+from services.hedging import percentile
+from services.meal_result import MealResult
+
+USERS = 200
+VIEWS = 5
+# Доля пользователей, добавляющих прием пищи между просмотрами
+NEW_MEAL_SHARE = 0.3
+DAYS = 7
+
+
+class FakeBot:
+    """send_photo без сети: байты считаются загрузкой, строка - отправкой по file_id"""
+
+    def __init__(self):
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.by_file_id = 0
+
+    def send_photo(self, chat_id, photo, caption=None):
+        if isinstance(photo, bytes):
+            self.uploads += 1
+            self.uploaded_bytes += len(photo)
+            photo = f"file{self.uploads}"
+        else:
+            self.by_file_id += 1
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+
+
+def add_meal(db_manager, generator, user_id, created_at):
+    kcal = generator.randrange(200, 900)
+    result = MealResult("Борщ", 300, kcal, kcal / 40, kcal / 30, kcal / 8, 0.6, "")
+    meal_id = db_manager.save_meal(user_id, ["file"], result)
+    db_manager.connection.execute("UPDATE meals SET created_at = ? WHERE id = ?", (created_at, meal_id))
+
+
+def main():
+    try:
+        import matplotlib  # noqa: F401
+    except ImportError:
+        print("matplotlib не установлен: pip install matplotlib")
+        return
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    views = int(sys.argv[2]) if len(sys.argv) > 2 else VIEWS
+    generator = random.Random(1)
+    now = int(time.time())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        for user_id in range(1, users + 1):
+            for _ in range(generator.randrange(5, 20)):
+                add_meal(db_manager, generator, user_id, now - generator.randrange(DAYS * 86400))
+        db_manager.connection.commit()
+
+        bot = FakeBot()
+        charts = ChartService(db_manager)
+        latencies = []
+        for view in range(views):
+            if view:
+                for user_id in range(1, users + 1):
+                    if generator.random() < NEW_MEAL_SHARE:
+                        add_meal(db_manager, generator, user_id, now)
+                db_manager.connection.commit()
+            for user_id in range(1, users + 1):
+                started = time.perf_counter()
+                charts.send_intake_chart(bot, user_id, user_id, DAYS, 2000)
+                latencies.append(time.perf_counter() - started)
+
+        stats = charts.stats()
+        total = len(latencies)
+        print(f"{users} пользователей x {views} просмотров = {total} графиков")
+        print(f"Доля отправок из кэша:        {stats['hit_rate']:.1%} ({bot.by_file_id} по file_id)")
+        print(f"Отрисовок:                    {stats['renders']}, в среднем {stats['render_avg'] * 1000:.1f} мс")
+        print(f"Загружено:                    {bot.uploaded_bytes / 2 ** 20:.1f} МБ "
+              f"({bot.uploaded_bytes / max(bot.uploads, 1) / 1024:.0f} КБ на график)")
+        print(f"Запрос графика, p50 / p99:    {percentile(latencies, 0.5) * 1000:.2f} / "
+              f"{percentile(latencies, 0.99) * 1000:.2f} мс")
+        print(f"Без кэша (каждый раз рисуем): ~{stats['render_avg'] * total:.1f} с CPU вместо "
+              f"{stats['render_avg'] * stats['renders']:.1f} с")
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# src/benchmarks/bench_dish_classifier.py
+"""Сравнение определения блюда: локальный классификатор, OpenAI и каскад.
+
+Набор фикстур - каталог с подкаталогами по меткам:
+    fixtures/борщ/1.jpg, fixtures/пицца/2.jpg, ...
+
+Запуск из каталога src:
+    python -m benchmarks.bench_dish_classifier fixtures [--remote]
+
+Без --remote считается только локальный классификатор; с --remote
+дополнительно вызывается OpenAI (нужен OPENAI_API_KEY) и считается
+каскад: локальный ответ при уверенности выше порога, иначе OpenAI.
+"""
+import os
+import sys
+import time
+import base64
+import statistics
+from services.dish_classifier import load_dish_classifier
+from services.usage_ledger import usage_cost_micros
+from handlers.meal_analysis import DISH_SYSTEM_PROMPT
+
+
+def load_fixtures(root):
+    for label in sorted(os.listdir(root)):
+        directory = os.path.join(root, label)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as image_file:
+                yield label, image_file.read()
+
+
+def normalize(label):
+    return label.strip().strip('.').lower()
+
+
+def remote_detect(client, image_bytes):
+    started = time.perf_counter()
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": DISH_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Что это за блюдо?"},
+                    {"type": "image_url", "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+                    }}
+                ]
+            }
+        ],
+        max_tokens=20
+    )
+    latency = time.perf_counter() - started
+    cost = usage_cost_micros('gpt-4o', response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content.strip(), latency, cost
+
+
+def report(name, results):
+    if not results:
+        return
+    correct = sum(1 for expected, predicted, _, _ in results if normalize(expected) == normalize(predicted or ''))
+    latencies = sorted(latency for _, _, latency, _ in results)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    cost = sum(cost for _, _, _, cost in results)
+    print(f"{name:<10} точность {correct / len(results):6.1%}  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} мс  p95 {p95 * 1000:7.1f} мс  "
+          f"${cost / 1_000_000 / len(results):.5f}/фото")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    fixtures = list(load_fixtures(sys.argv[1]))
+    use_remote = '--remote' in sys.argv
+    classifier = load_dish_classifier()
+    client = None
+    if use_remote:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+    local, remote, cascade = [], [], []
+    for label, image_bytes in fixtures:
+        started = time.perf_counter()
+        prediction = classifier.predict(image_bytes)
+        local_latency = time.perf_counter() - started
+        local.append((label, prediction.label if prediction else None, local_latency, 0))
+
+        if client:
+            remote_label, remote_latency, remote_cost = remote_detect(client, image_bytes)
+            remote.append((label, remote_label, remote_latency, remote_cost))
+            if classifier.confident(prediction):
+                cascade.append((label, prediction.label, local_latency, 0))
+            else:
+                cascade.append((label, remote_label, local_latency + remote_latency, remote_cost))
+
+    print(f"Фото: {len(fixtures)}, порог уверенности: {classifier.threshold}")
+    report("локально", local)
+    report("OpenAI", remote)
+    report("каскад", cascade)
+    if cascade:
+        skipped = sum(1 for _, _, _, cost in cascade if cost == 0)
+        print(f"Каскад обошелся без запроса к OpenAI для {skipped / len(cascade):.1%} фото")
+
+
+if __name__ == "__main__":
+    main()
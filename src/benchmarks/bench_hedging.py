@@ -0,0 +1,93 @@
+# src/benchmarks/bench_hedging.py
+"""Хвостовые задержки запросов к модели с хеджированием и без.
+
+Заглушка chat.completions отвечает за 40-60 мс, но доля SLOW_SHARE
+ответов задерживается на SLOW_LATENCY, как редкие медленные ответы
+gpt-4o. Сравниваются перцентили задержки вызова и доля лишних запросов.
+
+Запуск из каталога src: python -m benchmarks.bench_hedging [число_вызовов]
+"""
+import sys
+import time
+import random
+import threading
+from types import SimpleNamespace
+from config.settings import HEDGE_PERCENTILE, HEDGE_BUDGET
+from services.hedging import HedgePolicy, percentile
+
+CALLS = 1000
+THREADS = 8
+SLOW_SHARE = 0.03
+SLOW_LATENCY = 1.0
+
+
+class StubCompletions:
+    """Заглушка client.chat.completions с редкими медленными ответами"""
+
+    def __init__(self, seed=1):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.requests += 1
+            slow = self.random.random() < SLOW_SHARE
+            latency = SLOW_LATENCY if slow else self.random.uniform(0.04, 0.06)
+        time.sleep(latency)
+        return SimpleNamespace(
+            model='gpt-4o-2024-08-06',
+            choices=[SimpleNamespace(message=SimpleNamespace(content='Борщ'))],
+            usage=SimpleNamespace(prompt_tokens=900, completion_tokens=20, prompt_tokens_details=None)
+        )
+
+
+def run(calls, policy):
+    completions = StubCompletions()
+    latencies = []
+    lock = threading.Lock()
+    discarded = []
+
+    def worker(count):
+        for _ in range(count):
+            request = lambda: completions.create(model='gpt-4o', max_tokens=20)
+            started = time.perf_counter()
+            if policy:
+                policy.call('dish', request, on_discard=discarded.append)
+            else:
+                request()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(calls // THREADS,)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Проигравшие запросы дорабатывают в фоне, ждем их для честного подсчета
+    time.sleep(SLOW_LATENCY)
+    return latencies, completions.requests, len(discarded)
+
+
+def report(name, latencies, requests, discarded):
+    calls = len(latencies)
+    print(f"{name:<16} p50 {percentile(latencies, 0.5) * 1000:6.0f} мс  "
+          f"p95 {percentile(latencies, 0.95) * 1000:6.0f} мс  "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.0f} мс  "
+          f"max {max(latencies) * 1000:6.0f} мс  "
+          f"запросов {requests} (+{(requests - calls) / calls:.1%}), отброшено ответов {discarded}")
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else CALLS
+    print(f"{calls} вызовов в {THREADS} потоков, медленных ответов {SLOW_SHARE:.0%} по {SLOW_LATENCY:.1f} с, "
+          f"порог p{HEDGE_PERCENTILE * 100:g}, бюджет {HEDGE_BUDGET:.0%}")
+    report("без хеджирования", *run(calls, None))
+    policy = HedgePolicy()
+    report("с хеджированием", *run(calls, policy))
+    stats = policy.stats()
+    print(f"хеджировано {stats['hedge_rate']:.1%} вызовов, второй запрос быстрее в {stats['hedge_win_rate']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# src/benchmarks/bench_keyboards.py
+"""Сравнение сборки клавиатур на каждый вызов и готовых клавиатур из реестра.
+
+Запуск из каталога src: python -m benchmarks.bench_keyboards
+"""
+import time
+import tracemalloc
+from telebot import types
+from utils.keyboards import main_menu, correction_keyboard
+
+ITERATIONS = 10000
+
+
+def legacy_main_menu():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(types.KeyboardButton("🔧 Настроить профиль"))
+    markup.add(types.KeyboardButton("🍽️ Анализ блюда"))
+    markup.add(types.KeyboardButton("📊 Мой прогресс"))
+    markup.add(types.KeyboardButton("📜 История блюд"))
+    markup.add(types.KeyboardButton("💰 Пополнить баланс"))
+    return markup
+
+
+def legacy_correction_keyboard(meal_id):
+    markup = types.InlineKeyboardMarkup()
+    markup.row(
+        types.InlineKeyboardButton("Всё верно ✅", callback_data=f"meal_correct:{meal_id}"),
+        types.InlineKeyboardButton("Указать название 🍽️", callback_data=f"meal_rename:{meal_id}")
+    )
+    return markup
+
+
+def measure(name, func):
+    """Время вызова и объём памяти, выделяемой на один func().to_json()"""
+    started = time.perf_counter()
+    for i in range(ITERATIONS):
+        func(i).to_json()
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    peak_total = 0
+    for i in range(ITERATIONS):
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(i).to_json()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - baseline
+    tracemalloc.stop()
+    print(f"{name:<28} {elapsed * 1e6 / ITERATIONS:8.2f} мкс/вызов  "
+          f"{peak_total / ITERATIONS:8.0f} байт выделено/вызов")
+
+
+def main():
+    measure("main_menu (сборка)", lambda i: legacy_main_menu())
+    measure("main_menu (реестр)", lambda i: main_menu())
+    measure("correction (сборка)", lambda i: legacy_correction_keyboard(i))
+    measure("correction (шаблон)", lambda i: correction_keyboard(i))
+
+
+if __name__ == "__main__":
+    main()
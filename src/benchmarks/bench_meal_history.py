@@ -0,0 +1,134 @@
+# src/benchmarks/bench_meal_history.py
+"""История и поиск по приемам пищи на большой таблице meals.
+
+Таблица заполняется через DatabaseManager со всеми индексами и триггерами
+FTS5: обычные пользователи по ~100 приемов пищи и один с HEAVY_USER_MEALS.
+Глубокие страницы истории сравниваются с OFFSET, поиск меряется по частому
+и редкому слову.
+
+Запуск из каталога src: python -m benchmarks.bench_meal_history [строк] [путь_к_базе]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from database.db_manager import DatabaseManager
+from handlers.history import build_match_query
+
+ROWS = 10_000_000
+HEAVY_USER = 1
+HEAVY_USER_MEALS = 100_000
+MEALS_PER_USER = 100
+INSERT_BATCH = 50_000
+REPEATS = 20
+
+DISHES = [
+    "Пицца Маргарита", "Борщ", "Цезарь с курицей", "Плов", "Пельмени", "Оливье", "Сырники",
+    "Гречка с котлетой", "Шаурма", "Роллы Филадельфия", "Омлет", "Овсянка с ягодами",
+    "Паста карбонара", "Бургер", "Солянка", "Блины с икрой", "Греческий салат", "Стейк рибай",
+    "Том ям", "Хачапури по-аджарски", "Фалафель", "Рамен", "Чизкейк", "Вареники с вишней",
+]
+COMMENTS = [
+    "Углеводы раздеваются прямо на глазах.", "Белок скромничает, жиры флиртуют.",
+    "Порция честная, совесть - не очень.", "Диетолог внутри меня плачет и просит добавки.",
+]
+
+
+def rows(count, seed=1):
+    generator = random.Random(seed)
+    users = max(1, (count - HEAVY_USER_MEALS) // MEALS_PER_USER)
+    started = int(time.time()) - count * 30
+    heavy_share = HEAVY_USER_MEALS / count
+    for i in range(count):
+        user_id = HEAVY_USER if generator.random() < heavy_share else 2 + generator.randrange(users)
+        dish = generator.choice(DISHES)
+        kcal = generator.randrange(150, 1200)
+        # Редкое блюдо для проверки выборочного поиска
+        if i % 100_003 == 0:
+            dish = "Суфле из маракуйи"
+        yield (user_id, started + i * 30, f"file{i}", dish,
+               f"🔥 Калорийность: {kcal} ккал\n\n{generator.choice(COMMENTS)}", kcal)
+
+
+def populate(db_manager, count):
+    started = time.perf_counter()
+    generator = rows(count)
+    inserted = 0
+    while inserted < count:
+        batch = [row for _, row in zip(range(INSERT_BATCH), generator)]
+        with db_manager.transaction():
+            db_manager.connection.executemany(
+                "INSERT INTO meals (user_id, created_at, file_ids, dish, analysis, kcal) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+        inserted += len(batch)
+        if inserted % 1_000_000 == 0:
+            print(f"  вставлено {inserted:,} строк за {time.perf_counter() - started:.0f} с", flush=True)
+    return time.perf_counter() - started
+
+
+def timed(func, repeats=REPEATS):
+    """Среднее время вызова в миллисекундах и результат"""
+    result = func()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1000, result
+
+
+def cursor_at(db_manager, position):
+    """Курсор (created_at, id) записи истории тяжелого пользователя на позиции position"""
+    meal_id, created_at = db_manager.connection.execute(
+        "SELECT id, created_at FROM meals WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+        (HEAVY_USER, position)
+    ).fetchone()
+    return created_at, meal_id
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.mkdtemp(), 'bench_history.db')
+    db_manager = DatabaseManager(db_path)
+    existing = db_manager.connection.execute("SELECT COUNT(*) FROM meals").fetchone()[0]
+    if existing < count:
+        print(f"Заполнение {count - existing:,} строк (с триггерами FTS5)...")
+        elapsed = populate(db_manager, count - existing)
+        print(f"  {(count - existing) / elapsed:,.0f} строк/с, база {os.path.getsize(db_path) / 2 ** 30:.2f} ГБ")
+
+    heavy = db_manager.connection.execute("SELECT COUNT(*) FROM meals WHERE user_id = ?", (HEAVY_USER,)).fetchone()[0]
+    print(f"\n{count:,} приемов пищи, у пользователя {HEAVY_USER}: {heavy:,}")
+    page = 11
+    deep = min(heavy - page, 50_000)
+
+    ms, _ = timed(lambda: db_manager.get_meal_history(HEAVY_USER, None, page))
+    print(f"История, первая страница:                  {ms:8.2f} мс")
+    before = cursor_at(db_manager, deep)
+    ms, _ = timed(lambda: db_manager.get_meal_history(HEAVY_USER, before, page))
+    print(f"История, страница {deep // 10:,} по курсору:         {ms:8.2f} мс")
+    ms, _ = timed(lambda: db_manager.connection.execute(
+        "SELECT id, created_at, dish, kcal FROM meals WHERE user_id = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?", (HEAVY_USER, page, deep)
+    ).fetchall(), repeats=3)
+    print(f"История, та же страница через OFFSET:      {ms:8.2f} мс")
+
+    common = build_match_query("пицц")
+    ms, found = timed(lambda: db_manager.search_meals(HEAVY_USER, common, None, page))
+    print(f"Поиск «пицц», первая страница:             {ms:8.2f} мс")
+    last_id = db_manager.connection.execute(
+        "SELECT rowid FROM meals_fts WHERE meals_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET 2000",
+        (f'user_id:"{HEAVY_USER}" AND {{dish analysis}}: ({common})',)
+    ).fetchone()[0]
+    ms, found = timed(lambda: db_manager.search_meals(HEAVY_USER, common, last_id, page))
+    print(f"Поиск «пицц», страница 200 по курсору:     {ms:8.2f} мс ({len(found)} строк)")
+    rare_user = db_manager.connection.execute(
+        "SELECT user_id FROM meals WHERE dish = 'Суфле из маракуйи' AND user_id != ? LIMIT 1", (HEAVY_USER,)
+    ).fetchone()[0]
+    rare = build_match_query("суфле маракуй")
+    ms, found = timed(lambda: db_manager.search_meals(rare_user, rare, None, page))
+    print(f"Поиск редкого блюда у обычного пользователя: {ms:6.2f} мс ({len(found)} строк)")
+    db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
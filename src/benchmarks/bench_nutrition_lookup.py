@@ -0,0 +1,81 @@
+# src/benchmarks/bench_nutrition_lookup.py
+"""Задержка поиска в справочнике пищевой ценности на тысячах названий.
+
+Названия генерируются из справочника: точные, с опечатками, с добавками
+("борщ со сметаной") и заведомо неизвестные блюда.
+
+Запуск из каталога src: python -m benchmarks.bench_nutrition_lookup [число_названий]
+"""
+import sys
+import time
+import random
+from database.nutrition_db import NutritionDatabase, normalize_name
+
+SUFFIXES = ["со сметаной", "с курицей", "домашний", "с сыром", "по-грузински", "с зеленью"]
+UNKNOWN = ["ризотто", "киноа", "лимонад", "бейгл", "пхали", "тирамису", "маффин", "поке", "буррито"]
+
+
+def typo(name, rng):
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return name[:i] + name[i + 1:]
+    if kind == 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + name[i] + name[i:]
+
+
+def generate_names(db, count, seed=42):
+    rng = random.Random(seed)
+    known = list(db.names)
+    names = []
+    while len(names) < count:
+        base = rng.choice(known)
+        variant = rng.randrange(4)
+        if variant == 0:
+            names.append(base.capitalize())
+        elif variant == 1:
+            names.append(typo(base, rng))
+        elif variant == 2:
+            names.append(f"{base} {rng.choice(SUFFIXES)}")
+        else:
+            names.append(f"{rng.choice(UNKNOWN)} {rng.randrange(1000)}")
+    return names
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    started = time.perf_counter()
+    db = NutritionDatabase()
+    print(f"Загрузка справочника: {(time.perf_counter() - started) * 1000:.1f} мс, {len(db.names)} названий")
+
+    names = generate_names(db, count)
+    uncached = db._lookup.__wrapped__
+    timings = []
+    hits = 0
+    for name in names:
+        started = time.perf_counter()
+        facts = uncached(db, normalize_name(name))
+        timings.append(time.perf_counter() - started)
+        hits += facts is not None
+    timings.sort()
+    print(f"Без кэша: {count} названий, найдено {hits / count:.1%}, "
+          f"p50 {percentile(timings, 0.5) * 1e6:.0f} мкс, p99 {percentile(timings, 0.99) * 1e6:.0f} мкс, "
+          f"max {timings[-1] * 1e6:.0f} мкс")
+
+    for name in names:
+        db.lookup(name)
+    started = time.perf_counter()
+    for name in names:
+        db.lookup(name)
+    print(f"С прогретым кэшем: {(time.perf_counter() - started) / count * 1e6:.1f} мкс в среднем")
+
+
+if __name__ == "__main__":
+    main()
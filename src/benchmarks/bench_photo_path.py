@@ -0,0 +1,160 @@
+# src/benchmarks/bench_photo_path.py
+"""Этапы MealAnalysisHandler.handle_photo: последовательно и с параллельным I/O.
+
+Задержки Telegram и модели имитируются заглушками, база настоящая
+(временный SQLite). Последовательный вариант - тот же код с пулом,
+выполняющим задачи сразу в вызывающем потоке. Для каждого варианта
+печатается, когда начался и закончился каждый этап, и общее время.
+
+Запуск из каталога src: python -m benchmarks.bench_photo_path [повторов]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+from database.db_manager import DatabaseManager
+from services.dish_classifier import NullDishClassifier
+from handlers.meal_analysis import MealAnalysisHandler
+
+FAKE_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 2000
+
+# Задержки в секундах: запросы к api.telegram.org и ответы модели
+TELEGRAM_LATENCY = {'send_message': 0.07, 'get_file': 0.06, 'download_file': 0.12, 'delete_message': 0.06}
+MODEL_LATENCY = {20: 0.2, 250: 0.4, 300: 0.4}
+RUNS = 5
+
+
+class Timeline:
+    """Начало и конец этапов относительно старта обработки фото"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def span(self, name, func, *args, **kwargs):
+        start = time.perf_counter() - self.started
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.spans.append((name, start, time.perf_counter() - self.started))
+
+
+class FakeBot:
+    def __init__(self):
+        self.timeline = None
+        self.sent = 0
+
+    def _call(self, name, result):
+        return self.timeline.span(name, lambda: (time.sleep(TELEGRAM_LATENCY[name]), result)[1])
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+        stage = 'send_message (результат)' if 'reply_markup' in kwargs else 'send_message (процесс)'
+        return self.timeline.span(stage, lambda: (
+            time.sleep(TELEGRAM_LATENCY['send_message']), SimpleNamespace(message_id=self.sent)
+        )[1])
+
+    def get_file(self, file_id):
+        return self._call('get_file', SimpleNamespace(file_path=file_id))
+
+    def download_file(self, file_path):
+        return self._call('download_file', FAKE_JPEG)
+
+    def delete_message(self, chat_id, message_id):
+        return self._call('delete_message', True)
+
+
+class StubCompletions:
+    def __init__(self, bot):
+        self.bot = bot
+
+    def create(self, max_tokens, **kwargs):
+        name = 'модель: блюдо' if max_tokens == 20 else 'модель: анализ'
+        content = 'Борщ' if max_tokens == 20 else 'Порция: 300 г\nСвекла в открытую.'
+        return self.bot.timeline.span(name, lambda: (time.sleep(MODEL_LATENCY[max_tokens]), SimpleNamespace(
+            model='gpt-4o', choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None
+        ))[1])
+
+
+class InlineExecutor:
+    """Пул, выполняющий задачу сразу: прежний последовательный порядок"""
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class TimedDatabase:
+    """Обертка над DatabaseManager, отмечающая этапы работы с базой"""
+
+    def __init__(self, db_manager, bot):
+        self.db_manager = db_manager
+        self.bot = bot
+
+    def __getattr__(self, name):
+        method = getattr(self.db_manager, name)
+        return lambda *args, **kwargs: self.bot.timeline.span(f"база: {name}", method, *args, **kwargs)
+
+
+def make_message(message_id, user_id=1):
+    return SimpleNamespace(
+        message_id=message_id, media_group_id=None,
+        chat=SimpleNamespace(id=user_id), from_user=SimpleNamespace(id=user_id),
+        photo=[SimpleNamespace(file_id=f"photo{message_id}", file_unique_id=f"u{message_id}")]
+    )
+
+
+def run(handler, bot, message_id):
+    bot.timeline = Timeline()
+    handler.handle_photo(make_message(message_id))
+    return bot.timeline.spans, time.perf_counter() - bot.timeline.started
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        db_manager.ensure_user_exists(1)
+        db_manager.adjust_generations(1, 100, 'bench:topup')
+        bot = FakeBot()
+        handler = MealAnalysisHandler(
+            bot, TimedDatabase(db_manager, bot),
+            usage_ledger=SimpleNamespace(record=lambda *args: None),
+            dish_classifier=NullDishClassifier()
+        )
+        handler._client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(bot)))
+        concurrent_pool = handler.io_pool
+
+        totals = {}
+        message_id = 0
+        for name, pool in (("последовательно", InlineExecutor()), ("параллельный I/O", concurrent_pool)):
+            handler.io_pool = pool
+            best = None
+            for _ in range(runs):
+                message_id += 1
+                spans, elapsed = run(handler, bot, message_id)
+                if best is None or elapsed < best[1]:
+                    best = spans, elapsed
+            spans, elapsed = best
+            totals[name] = elapsed
+            print(f"\n{name}: {elapsed * 1000:.0f} мс")
+            for stage, start, end in sorted(spans, key=lambda span: span[1]):
+                print(f"  {stage:<28} {start * 1000:7.0f} -> {end * 1000:7.0f} мс")
+
+        sequential, concurrent = totals.values()
+        print(f"\nКритический путь короче на {(sequential - concurrent) * 1000:.0f} мс "
+              f"({1 - concurrent / sequential:.0%})")
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# src/benchmarks/bench_reminders.py
+"""Планировщик напоминаний на 100 тыс. пользователей.
+
+У каждого пользователя два расписания (meal и nudge). Напоминания meal
+всех пользователей наступают в течение BURST_SECONDS секунд - худший
+случай "все обедают в 13:00"; nudge - завтра. Посередине всплеска
+планировщик останавливается и запускается заново, как при перезапуске
+бота. Telegram имитируется заглушкой, лимит отправки снят, чтобы мерить
+сам планировщик. Печатается память кучи в сравнении с полной загрузкой
+расписания, число пробуждений, CPU на тысячу напоминаний, опоздание
+отправки и число повторных и потерянных напоминаний.
+
+Запуск из каталога src: python -m benchmarks.bench_reminders [пользователей]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from database.db_manager import DatabaseManager
+from services.hedging import percentile
+from services.rate_limiter import RateLimiter
+from services.reminders import ReminderScheduler, next_due, KIND_MEAL, KIND_NUDGE
+from config.settings import REMINDER_HORIZON
+
+USERS = 100_000
+BURST_SECONDS = 20
+IDLE_SECONDS = 5
+
+
+class FakeBot:
+    def __init__(self):
+        self.received = Counter()
+        self.total = 0
+        self.lateness = []
+        self.due = {}
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text):
+        with self.lock:
+            self.received[chat_id] += 1
+            self.total += 1
+            self.lateness.append(time.time() - self.due[chat_id])
+
+
+def populate(db_manager, users, started):
+    generator = random.Random(1)
+    due = {}
+    rows = []
+    for user_id in range(1, users + 1):
+        due[user_id] = started + 2 + generator.randrange(BURST_SECONDS)
+        rows.append((user_id, KIND_MEAL, "13:00", due[user_id]))
+        rows.append((user_id, KIND_NUDGE, "21:00", next_due("21:00", started + 86400)))
+    with db_manager.transaction():
+        db_manager.connection.executemany(
+            "INSERT OR REPLACE INTO reminders (user_id, kind, times, due_at) VALUES (?, ?, ?, ?)", rows
+        )
+    return due
+
+
+def heap_memory(scheduler, horizon):
+    """Размер кучи планировщика после чтения окна horizon и занятая ею память"""
+    scheduler.horizon = horizon
+    tracemalloc.start()
+    scheduler._refill(int(time.time()))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(scheduler.heap), size
+
+
+def make_scheduler(bot, db_manager):
+    return ReminderScheduler(bot, db_manager, RateLimiter(global_rate=10 ** 6, per_chat_rate=1))
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        bot = FakeBot()
+        started = int(time.time())
+        bot.due = populate(db_manager, users, started)
+
+        probe = make_scheduler(bot, db_manager)
+        window, window_bytes = heap_memory(probe, REMINDER_HORIZON)
+        everything, all_bytes = heap_memory(probe, 2 * 86400)
+        print(f"{users:,} пользователей, {everything:,} расписаний")
+        print(f"Куча окна {REMINDER_HORIZON} с:         {window:,} записей, {window_bytes / 2 ** 20:.1f} МБ")
+        print(f"Все расписание в памяти:  {everything:,} записей, {all_bytes / 2 ** 20:.1f} МБ")
+
+        cpu_started = time.process_time()
+        first = make_scheduler(bot, db_manager)
+        first.start()
+        while bot.total < users // 2:
+            time.sleep(0.05)
+        first.stop()
+        print(f"\nПерезапуск после {bot.total:,} отправок")
+
+        second = make_scheduler(bot, db_manager)
+        second.start()
+        deadline = time.time() + BURST_SECONDS + 10
+        while bot.total < users and time.time() < deadline:
+            time.sleep(0.05)
+        cpu = time.process_time() - cpu_started
+        busy_wakeups = second.stats()['wakeups']
+        time.sleep(IDLE_SECONDS)
+        idle_wakeups = second.stats()['wakeups'] - busy_wakeups
+        second.stop()
+
+        sent = first.sent + second.sent
+        wakeups = first.wakeups + busy_wakeups
+        duplicates = sum(count - 1 for count in bot.received.values() if count > 1)
+        print(f"Отправлено:               {sent:,}, повторно: {duplicates}, потеряно: {users - len(bot.received)}")
+        print(f"Пробуждений за всплеск:   {wakeups:,} ({sent / max(wakeups, 1):.0f} напоминаний на пробуждение)")
+        print(f"Пробуждений за {IDLE_SECONDS} с простоя: {idle_wakeups}")
+        print(f"CPU процесса:             {cpu:.2f} с, {cpu / sent * 1000 * 1000:.1f} мс на 1000 напоминаний")
+        print(f"Опоздание, p50 / p99:     {percentile(bot.lateness, 0.5) * 1000:.0f} / "
+              f"{percentile(bot.lateness, 0.99) * 1000:.0f} мс (due_at - целые секунды)")
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# src/benchmarks/bench_workers.py
+"""Пропускная способность 1, 2 и 4 воркеров за роутером services.workers.
+
+Воркеры - отдельные процессы с TeleBot и общим SQLite-хранилищем
+состояний. Обработчик читает и пишет состояние пользователя и ждет
+ANALYSIS_LATENCY, как ожидание ответа OpenAI. По окончании проверяется,
+что каждый апдейт обработан ровно один раз и по порядку.
+
+Запуск из каталога src: python -m benchmarks.bench_workers
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+from telebot import TeleBot
+from database.db_manager import DatabaseManager
+from services.state_storage import StateSQLiteStorage, CachedStateFilter
+from services.workers import UpdateRouter, WorkerPool, serve_worker
+
+USERS = 200
+UPDATES = 600
+ANALYSIS_LATENCY = 0.01
+BASE_PORT = 18450
+
+
+def serve(port, db_path):
+    """Процесс-воркер с заглушкой анализа"""
+    db_manager = DatabaseManager(db_path)
+    storage = StateSQLiteStorage(db_manager)
+    bot = TeleBot('0:bench', threaded=False, state_storage=storage)
+    bot.add_custom_filter(CachedStateFilter(bot))
+
+    @bot.message_handler(content_types=['text'])
+    def analyze(message):
+        user_id, chat_id = message.from_user.id, message.chat.id
+        data = storage.get_data(chat_id, user_id)
+        seq = int(message.text)
+        data['disorder'] = data.get('disorder', 0) + (seq <= data.get('last', -1))
+        data['last'] = seq
+        data['count'] = data.get('count', 0) + 1
+        time.sleep(ANALYSIS_LATENCY)
+        storage.set_state(chat_id, user_id, 'done')
+        storage.save(chat_id, user_id, data)
+
+    serve_worker(bot, port)
+
+
+def make_update(update_id, user_id, seq):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": str(seq),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"}
+        }
+    }
+
+
+def run(workers, db_path):
+    command = [sys.executable, '-m', 'benchmarks.bench_workers', '--serve', db_path]
+    pool = WorkerPool(workers, BASE_PORT, command)
+    router = UpdateRouter(pool.ports)
+    try:
+        # Прогрев: по апдейту каждому воркеру, чтобы не мерить запуск процессов
+        for user_id in range(USERS + 1, USERS + 1 + workers):
+            router.route(make_update(0, user_id, 0))
+        router.join()
+
+        started = time.perf_counter()
+        for update_id in range(UPDATES):
+            user_id = update_id % USERS + 1
+            router.route(make_update(update_id, user_id, update_id // USERS))
+        router.join()
+        return time.perf_counter() - started
+    finally:
+        pool.stop()
+
+
+def check(db_path):
+    """(потеряно или продублировано, нарушений порядка)"""
+    db_manager = DatabaseManager(db_path)
+    expected = UPDATES // USERS
+    lost = disorder = 0
+    for user_id in range(1, USERS + 1):
+        row = db_manager.get_conversation(user_id, user_id)
+        data = json.loads(row[1]) if row else {}
+        lost += abs(data.get('count', 0) - expected)
+        disorder += data.get('disorder', 0)
+    return lost, disorder
+
+
+def main():
+    if '--serve' in sys.argv:
+        serve(int(sys.argv[sys.argv.index('--worker-port') + 1]), sys.argv[sys.argv.index('--serve') + 1])
+        return
+
+    print(f"{UPDATES} апдейтов от {USERS} пользователей, заглушка анализа {ANALYSIS_LATENCY * 1000:.0f} мс, "
+          f"CPU: {os.cpu_count()}")
+    baseline = None
+    for workers in (1, 2, 4):
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench_workers.db')
+        DatabaseManager(db_path)
+        elapsed = run(workers, db_path)
+        throughput = UPDATES / elapsed
+        baseline = baseline or throughput
+        lost, disorder = check(db_path)
+        print(f"{workers} воркер(а): {throughput:7.1f} апд/с  ускорение x{throughput / baseline:.2f}  "
+              f"потеряно/дублей {lost}, вне порядка {disorder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# src/benchmarks/check_startup.py
+"""Проверка бюджета холодного старта: код выхода 1, если запуск дольше STARTUP_BUDGET.
+
+Бот стартует с временной базой и логом и фиктивными токенами (к Telegram
+и OpenAI запуск не обращается), время берется лучшее из нескольких
+попыток, чтобы не ловить шум файлового кэша.
+
+Запуск из каталога src: python -m benchmarks.check_startup [--runs N]
+"""
+import os
+import sys
+import tempfile
+from config.settings import STARTUP_BUDGET
+from services.startup_profile import run_startup, print_report
+
+RUNS = 3
+
+
+def main():
+    runs = int(sys.argv[sys.argv.index('--runs') + 1]) if '--runs' in sys.argv else RUNS
+    main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(workdir, 'startup.db'),
+        BOT_LOG_PATH=os.path.join(workdir, 'startup.log'),
+    )
+    env.setdefault('TELEGRAM_BOT_TOKEN', '0:startup-check')
+    env.setdefault('PAYMENT_PROVIDER_TOKEN', 'startup-check')
+
+    # Рабочий каталог тоже временный: туда пишется logs/payment_bot.log
+    best = min((run_startup(main_path, env, workdir) for _ in range(runs)), key=lambda result: result[0])
+    print_report(*best)
+
+    elapsed = best[0]
+    if elapsed > STARTUP_BUDGET:
+        print(f"\nПРОВАЛ: запуск {elapsed:.3f} с, бюджет {STARTUP_BUDGET:.3f} с")
+        sys.exit(1)
+    print(f"\nOK: запуск {elapsed:.3f} с, бюджет {STARTUP_BUDGET:.3f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,4 +37,118 @@ LOGGING_CONFIG = {
 
 # Пути к файлам
 DATABASE_PATH = 'user_profiles.db'
-TEMP_DIR = 'temp'
\ No newline at end of file
+TEMP_DIR = 'temp'
+
+# Рассылки: общий лимит бота и лимит на один чат (сообщений в секунду)
+BROADCAST_GLOBAL_RATE = 25
+BROADCAST_PER_CHAT_RATE = 1
+BROADCAST_PAGE_SIZE = 500
+
+# Цены моделей OpenAI в долларах за 1M токенов
+MODEL_PRICING = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+USD_TO_RUB = 100
+
+# Журнал расхода токенов: размер пачки и максимальная задержка записи в секундах
+USAGE_BATCH_SIZE = 50
+USAGE_FLUSH_INTERVAL = 10
+
+# Локальный классификатор блюд (ONNX). Без модели все блюда определяет OpenAI.
+DISH_CLASSIFIER_MODEL = os.getenv('DISH_CLASSIFIER_MODEL')
+DISH_CLASSIFIER_LABELS = os.getenv('DISH_CLASSIFIER_LABELS')
+DISH_CLASSIFIER_THRESHOLD = float(os.getenv('DISH_CLASSIFIER_THRESHOLD', '0.6'))
+
+# Таблица пищевой ценности блюд на 100 г
+NUTRITION_TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'nutrients.csv')
+
+# Сколько секунд ждать остальные фото альбома после последнего полученного
+MEDIA_GROUP_WINDOW = 1.5
+
+# Хранилище состояния диалогов: sqlite (файл базы бота) или redis
+# (любой Redis-совместимый сервер по REDIS_URL)
+STATE_STORAGE = os.getenv('STATE_STORAGE', 'sqlite')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Через сколько секунд без ответа незавершенный шаг диалога забывается
+CONVERSATION_STATE_TTL = int(os.getenv('CONVERSATION_STATE_TTL', '1800'))
+
+# Процессы-воркеры: апдейты делятся между ними по user_id,
+# воркер i слушает 127.0.0.1:WORKER_BASE_PORT + i
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', '8450'))
+
+# Сколько секунд после SIGTERM ждать завершения начатых анализов
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '60'))
+# Остановка, не завершившаяся за это время (например, закрытие базы ждет
+# блокировку), пишет стеки потоков в лог и завершает процесс с ошибкой
+SHUTDOWN_EXIT_TIMEOUT = SHUTDOWN_DRAIN_TIMEOUT + 15
+
+# Допустимое время холодного старта в секундах (benchmarks/check_startup.py)
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', '1.0'))
+
+# Пул HTTP-соединений к Telegram: размер, таймауты в секундах, повторы при сбое
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '16'))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5'))
+TELEGRAM_READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', '30'))
+TELEGRAM_RETRIES = int(os.getenv('TELEGRAM_RETRIES', '3'))
+
+# Допуск фото к анализу: сколько анализов идет параллельно, сколько секунд
+# ожидания ответа допустимо, сколько фото одного пользователя может быть в работе
+ANALYSIS_CONCURRENCY = int(os.getenv('ANALYSIS_CONCURRENCY', '4'))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '60'))
+ADMISSION_PER_USER_LIMIT = int(os.getenv('ADMISSION_PER_USER_LIMIT', '2'))
+# Оценка длительности анализа до первых замеров, секунды
+ADMISSION_INITIAL_LATENCY = float(os.getenv('ADMISSION_INITIAL_LATENCY', '10'))
+
+# Хеджирование запросов к OpenAI: второй такой же запрос, если первый дольше
+# перцентиля HEDGE_PERCENTILE недавних задержек; дополнительных запросов
+# не больше доли HEDGE_BUDGET от всех вызовов
+OPENAI_HEDGING = os.getenv('OPENAI_HEDGING', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', '0.05'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+# Таймаут одного запроса к OpenAI и число повторов клиента: вызов ограничен
+# OPENAI_CALL_LIMIT секундами (с паузами между повторами), анализ фото -
+# это до двух вызовов подряд (название блюда и состав)
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '45'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '1'))
+OPENAI_CALL_LIMIT = OPENAI_TIMEOUT * (OPENAI_MAX_RETRIES + 1) + 10
+
+# Напоминания: время в расписаниях - местное, UTC+REMINDER_UTC_OFFSET часов
+REMINDER_UTC_OFFSET = int(os.getenv('REMINDER_UTC_OFFSET', '3'))
+# Планировщик держит в памяти только напоминания на REMINDER_HORIZON секунд вперед
+REMINDER_HORIZON = int(os.getenv('REMINDER_HORIZON', '300'))
+# Напоминания, просроченные больше чем на REMINDER_GRACE секунд (бот был
+# остановлен), не отправляются, а переносятся на следующий раз
+REMINDER_GRACE = int(os.getenv('REMINDER_GRACE', '1800'))
+REMINDER_BATCH_SIZE = 100
+# Варианты напоминаний в профиле: кнопка -> расписание по видам
+# (meal - напоминание поесть, nudge - если за день не было ни одного блюда)
+REMINDER_PRESETS = {
+    "🔔 Завтрак, обед и ужин": {"meal": "09:00,13:00,19:00", "nudge": "21:00"},
+    "🌙 Вечером, если не было блюд": {"meal": None, "nudge": "20:00"},
+    "🔕 Без напоминаний": {"meal": None, "nudge": None},
+}
+
+# Проверки здоровья /healthz и /readyz: в режиме одного процесса - отдельный
+# HTTP-сервер на HEALTH_HOST:HEALTH_PORT, в режиме воркеров - порт воркера
+HEALTH_HOST = os.getenv('HEALTH_HOST', '127.0.0.1')
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8440'))
+# Watchdog: задача обработчика дольше WATCHDOG_STALL_TIMEOUT секунд или
+# getUpdates, не возвращавшийся POLL_STALL_TIMEOUT секунд, считаются зависшими;
+# при WATCHDOG_RESTART=1 бот сохраняет стеки потоков в лог и перезапускается.
+# Порог не ниже двух вызовов OpenAI с запасом: медленный, но ограниченный
+# таймаутами анализ не должен считаться зависанием
+WATCHDOG_INTERVAL = 5
+WATCHDOG_STALL_TIMEOUT = int(os.getenv('WATCHDOG_STALL_TIMEOUT', str(max(300, int(2 * OPENAI_CALL_LIMIT) + 60))))
+POLL_STALL_TIMEOUT = int(os.getenv('POLL_STALL_TIMEOUT', '90'))
+WATCHDOG_RESTART = os.getenv('WATCHDOG_RESTART', '1') == '1'
+# Роутер воркеров раз в WORKER_HEALTH_INTERVAL секунд проверяет /healthz
+# каждого воркера и перезапускает тот, что не ответил WORKER_HEALTH_FAILURES
+# раз подряд; первые WORKER_START_GRACE секунд после запуска не проверяются
+WORKER_HEALTH_INTERVAL = 10
+WORKER_HEALTH_FAILURES = 6
+WORKER_START_GRACE = 30
+# Сколько ошибок OpenAI подряд считать отказом
+OPENAI_FAILURE_THRESHOLD = 5
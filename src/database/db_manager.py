@@ -1,13 +1,57 @@
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+# Счета книги генераций. Каждая проводка переносит генерации между счетами
+# и в сумме дает ноль: бесплатные приходят со счета promo, оплаченные -
+# со счета sales, использованные уходят на счет usage.
+FREE_ACCOUNT = 'user:{}:free'
+PAID_ACCOUNT = 'user:{}:paid'
+PROMO_ACCOUNT = 'promo'
+SALES_ACCOUNT = 'sales'
+USAGE_ACCOUNT = 'usage'
+ADJUSTMENT_ACCOUNT = 'adjustment'
+
+SIGNUP_FREE_GENERATIONS = 5
+
+# Колонки meals с цифрами анализа, в порядке MealResult.columns()
+MEAL_RESULT_COLUMNS = ('portion_g', 'kcal', 'protein_dg', 'fat_dg', 'carbs_dg', 'confidence')
+
+# Степени прореживания замеров тела: сутки, неделя с понедельника, месяц (UTC)
+MEASUREMENT_GRANULARITIES = ('day', 'week', 'month')
+
+# Сегменты получателей рассылки: условие WHERE по таблице users
+BROADCAST_SEGMENTS = {
+    'all': "1 = 1",
+    'active_7d': "last_activity > datetime('now', '-7 days')",
+    'inactive_7d': "(last_activity IS NULL OR last_activity <= datetime('now', '-7 days'))",
+    'zero_balance': "COALESCE(free_generations, 0) + COALESCE(paid_generations, 0) <= 0",
+    'paid': "COALESCE(paid_generations, 0) > 0",
+}
+
+def rollup_buckets(measured_at):
+    """Начало суток, недели и месяца (unix-время, UTC), в которые попадает замер"""
+    day = measured_at - measured_at % 86400
+    date = datetime.fromtimestamp(day, timezone.utc)
+    month = int(date.replace(day=1).timestamp())
+    return {'day': day, 'week': day - date.weekday() * 86400, 'month': month}
+
 class DatabaseManager:
     def __init__(self, db_path="/root/new_telegram_bot/src/user_profiles.db"):
-        self.connection = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.connection.cursor()
+        # База общая для нескольких процессов-воркеров: WAL позволяет читать
+        # во время записи, timeout ждет блокировку вместо ошибки
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Соединение одно на все потоки процесса. Любая запись идет через
+        # transaction() под self.lock: иначе commit/rollback одного потока
+        # завершит или откатит чужую незаконченную транзакцию. Чтения
+        # берут собственный курсор через connection.execute.
+        self.cursor = self.connection.cursor()  # только для init_db
+        self.lock = threading.RLock()
         self.init_db()
 
     def init_db(self):
@@ -51,8 +95,255 @@ class DatabaseManager:
             FOREIGN KEY(user_id) REFERENCES users(user_id)
         )
         """)
+
+        # Рассылки и их контрольные точки для возобновления
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            segment TEXT NOT NULL DEFAULT 'all',
+            status TEXT NOT NULL DEFAULT 'pending',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+        # Журнал расхода токенов: только добавление, время в unix-секундах,
+        # стоимость в микродолларах, чтобы строки оставались компактными
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usage_log (
+            id INTEGER PRIMARY KEY,
+            created_at INTEGER NOT NULL,
+            user_id INTEGER,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            image_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms INTEGER NOT NULL,
+            cost_micros INTEGER NOT NULL,
+            cached_tokens INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        try:
+            self.cursor.execute("ALTER TABLE usage_log ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            # Колонка уже существует
+            pass
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_log_created ON usage_log(created_at)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_log_user ON usage_log(user_id, created_at)")
+
+        # Проанализированные приемы пищи; file_ids - file_id фото через пробел
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            file_ids TEXT NOT NULL,
+            dish TEXT,
+            analysis TEXT,
+            reanalyzed_at INTEGER,
+            portion_g INTEGER,
+            kcal INTEGER,
+            protein_dg INTEGER,
+            fat_dg INTEGER,
+            carbs_dg INTEGER,
+            confidence INTEGER
+        )
+        """)
+        # Цифры анализа хранятся целыми: граммы БЖУ в десятых долях, уверенность в процентах
+        for column in MEAL_RESULT_COLUMNS:
+            try:
+                self.cursor.execute(f"ALTER TABLE meals ADD COLUMN {column} INTEGER")
+            except sqlite3.OperationalError:
+                # Колонка уже существует
+                pass
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_meals_user ON meals(user_id, created_at)")
+        # Покрывающий индекс: сводки питания за период считаются без чтения таблицы
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_meals_intake "
+            "ON meals(user_id, created_at, kcal, protein_dg, fat_dg, carbs_dg)"
+        )
+
+        # Полнотекстовый поиск по истории: FTS5 поверх meals без копии текста,
+        # индекс поддерживается триггерами. user_id проиндексирован как слово,
+        # чтобы поиск шел только по приемам пищи владельца
+        fts_exists = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meals_fts'"
+        ).fetchone()
+        self.cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS meals_fts USING fts5(
+            dish, analysis, user_id,
+            content='meals', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+        self.cursor.executescript("""
+        CREATE TRIGGER IF NOT EXISTS meals_fts_insert AFTER INSERT ON meals BEGIN
+            INSERT INTO meals_fts(rowid, dish, analysis, user_id)
+            VALUES (new.id, new.dish, new.analysis, new.user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS meals_fts_delete AFTER DELETE ON meals BEGIN
+            INSERT INTO meals_fts(meals_fts, rowid, dish, analysis, user_id)
+            VALUES ('delete', old.id, old.dish, old.analysis, old.user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS meals_fts_update AFTER UPDATE OF dish, analysis ON meals BEGIN
+            INSERT INTO meals_fts(meals_fts, rowid, dish, analysis, user_id)
+            VALUES ('delete', old.id, old.dish, old.analysis, old.user_id);
+            INSERT INTO meals_fts(rowid, dish, analysis, user_id)
+            VALUES (new.id, new.dish, new.analysis, new.user_id);
+        END;
+        """)
+        if not fts_exists:
+            # Индекс для уже сохраненных приемов пищи строится один раз
+            self.cursor.execute("INSERT INTO meals_fts(meals_fts) VALUES ('rebuild')")
+
+        # file_id загруженных в Telegram графиков: версия - хеш данных графика,
+        # при совпадении картинка отправляется повторно без отрисовки и загрузки
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chart_cache (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            version TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, period)
+        ) WITHOUT ROWID
+        """)
+
+        # Замеры тела (вес, талия...): только добавление. Сводки по суткам,
+        # неделям и месяцам обновляются в той же транзакции, что и вставка,
+        # поэтому динамика за любой срок читается из ограниченного числа строк
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS measurements (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL NOT NULL,
+            measured_at INTEGER NOT NULL
+        )
+        """)
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_measurements_user ON measurements(user_id, metric, measured_at)"
+        )
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS measurement_rollups (
+            user_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min_value REAL NOT NULL,
+            max_value REAL NOT NULL,
+            last_value REAL NOT NULL,
+            last_at INTEGER NOT NULL,
+            PRIMARY KEY (user_id, metric, granularity, bucket)
+        ) WITHOUT ROWID
+        """)
+
+        # Расписание напоминаний: times - местное время 'ЧЧ:ММ' через запятую,
+        # due_at - ближайшая отправка. Отправка сначала сдвигает due_at,
+        # поэтому после перезапуска напоминание не повторяется
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            times TEXT NOT NULL,
+            due_at INTEGER NOT NULL,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_at)")
+
+        # Состояние диалогов (шаг и данные) по чату и пользователю, общее
+        # для всех процессов бота
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+        """)
+        try:
+            self.cursor.execute("ALTER TABLE conversation_state ADD COLUMN expires_at INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            # Колонка уже существует
+            pass
+        # Просроченные шаги не читаются, при старте их можно просто удалить
+        self.cursor.execute(
+            "DELETE FROM conversation_state WHERE expires_at <= CAST(strftime('%s', 'now') AS INTEGER)"
+        )
+
+        # Книга генераций: проводки и их строки по счетам, только добавление.
+        # Текущий остаток хранится в users и меняется в той же транзакции.
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_transactions (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            reference TEXT UNIQUE,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            id INTEGER PRIMARY KEY,
+            txn_id INTEGER NOT NULL REFERENCES ledger_transactions(id),
+            account TEXT NOT NULL,
+            amount INTEGER NOT NULL
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_ledger_entries_account ON ledger_entries(account)")
+
+        # Офлайн-переанализ через Batch API: задания и их пачки
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS batch_chunks (
+            id INTEGER PRIMARY KEY,
+            job_id INTEGER NOT NULL,
+            first_key TEXT NOT NULL,
+            last_key TEXT NOT NULL,
+            requests INTEGER NOT NULL,
+            input_file_id TEXT,
+            batch_id TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            applied INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(job_id) REFERENCES batch_jobs(id)
+        )
+        """)
+        try:
+            self.cursor.execute("ALTER TABLE batch_chunks ADD COLUMN input_file_id TEXT")
+        except sqlite3.OperationalError:
+            # Колонка уже существует
+            pass
         
         self.connection.commit()
+        self._migrate_balances()
+        self._migrate_weights()
+
+    def close(self):
+        """Закрытие соединения при остановке бота."""
+        with self.lock:
+            try:
+                self.connection.commit()
+                self.connection.close()
+                logger.info("Соединение с базой данных закрыто")
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка закрытия базы данных: {e}")
 
     def get_user_profile(self, user_id):
         """Получение профиля пользователя."""
@@ -62,8 +353,7 @@ class DatabaseManager:
             FROM users
             WHERE user_id = ?
             """
-            self.cursor.execute(query, (user_id,))
-            return self.cursor.fetchone()
+            return self.connection.execute(query, (user_id,)).fetchone()
         except sqlite3.Error as e:
             logger.error(f"Ошибка получения профиля пользователя: {e}")
             return None
@@ -72,8 +362,8 @@ class DatabaseManager:
         """Обновление поля профиля пользователя."""
         try:
             query = f"UPDATE users SET {field} = ?, last_activity = CURRENT_TIMESTAMP WHERE user_id = ?"
-            self.cursor.execute(query, (value, user_id))
-            self.connection.commit()
+            with self.transaction():
+                self.connection.execute(query, (value, user_id))
             logger.info(f"Обновлено поле {field} для пользователя {user_id}")
         except sqlite3.Error as e:
             logger.error(f"Ошибка обновления профиля пользователя: {e}")
@@ -82,15 +372,20 @@ class DatabaseManager:
         """Проверяет, существует ли пользователь, и добавляет его, если нет."""
         try:
             query = "SELECT 1 FROM users WHERE user_id = ?"
-            self.cursor.execute(query, (user_id,))
-            if not self.cursor.fetchone():
-                query = """
-                INSERT INTO users (user_id, age, height, weight, goal, daily_calories, activity_level, free_generations, last_activity)
-                VALUES (?, NULL, NULL, NULL, NULL, NULL, 'Не указан', 5, CURRENT_TIMESTAMP)
-                """
-                self.cursor.execute(query, (user_id,))
-                self.connection.commit()
-                logger.info(f"Создан профиль для нового пользователя {user_id} с 5 бесплатными генерациями")
+            if not self.connection.execute(query, (user_id,)).fetchone():
+                with self.transaction():
+                    self.connection.execute(
+                        """
+                        INSERT INTO users (user_id, age, height, weight, goal, daily_calories, activity_level, free_generations, last_activity)
+                        VALUES (?, NULL, NULL, NULL, NULL, NULL, 'Не указан', 0, CURRENT_TIMESTAMP)
+                        """,
+                        (user_id,)
+                    )
+                    self._post('signup', f"signup:{user_id}", user_id, [
+                        (PROMO_ACCOUNT, -SIGNUP_FREE_GENERATIONS),
+                        (FREE_ACCOUNT.format(user_id), SIGNUP_FREE_GENERATIONS),
+                    ])
+                logger.info(f"Создан профиль для нового пользователя {user_id} с {SIGNUP_FREE_GENERATIONS} бесплатными генерациями")
             else:
                 self.update_last_activity(user_id)
         except sqlite3.Error as e:
@@ -100,16 +395,15 @@ class DatabaseManager:
         """Обновляет время последней активности пользователя."""
         try:
             query = "UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?"
-            self.cursor.execute(query, (user_id,))
-            self.connection.commit()
+            with self.transaction():
+                self.connection.execute(query, (user_id,))
         except sqlite3.Error as e:
             logger.error(f"Ошибка обновления времени последней активности: {e}")
 
     def get_total_users(self):
         """Возвращает общее количество пользователей."""
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM users")
-            return self.cursor.fetchone()[0]
+            return self.connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
         except sqlite3.Error as e:
             logger.error(f"Ошибка получения общего количества пользователей: {e}")
             return 0
@@ -117,8 +411,7 @@ class DatabaseManager:
     def get_total_generations(self):
         """Возвращает общее количество генераций."""
         try:
-            self.cursor.execute("SELECT SUM(total_generations) FROM users")
-            return self.cursor.fetchone()[0] or 0
+            return self.connection.execute("SELECT SUM(total_generations) FROM users").fetchone()[0] or 0
         except sqlite3.Error as e:
             logger.error(f"Ошибка получения общего количества генераций: {e}")
             return 0
@@ -131,153 +424,885 @@ class DatabaseManager:
             FROM users 
             WHERE last_activity > datetime('now', '-7 days')
             """
-            self.cursor.execute(query)
-            return self.cursor.fetchone()[0]
+            return self.connection.execute(query).fetchone()[0]
         except sqlite3.Error as e:
             logger.error(f"Ошибка получения количества активных пользователей: {e}")
             return 0
 
-    def check_user_generations(self, user_id):
-        """Проверка количества бесплатных и общих генераций пользователя."""
+    def ping(self):
+        """Доступна ли база: короткий запрос на чтение"""
         try:
-            query = """
-            SELECT free_generations, total_generations
+            self.connection.execute("SELECT 1 FROM users LIMIT 1").fetchall()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"База недоступна: {e}")
+            return False
+
+    @contextmanager
+    def transaction(self):
+        """Атомарный блок записи: commit при успехе, rollback при ошибке."""
+        with self.lock:
+            try:
+                yield self.connection
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+
+    def _post(self, kind, reference, user_id, legs, update_balance=True):
+        """Проводка в книге генераций внутри открытой транзакции.
+
+        legs - пары (счет, сумма), сумма по проводке всегда ноль. Остатки
+        пользователя в users обновляются в той же транзакции. Возвращает
+        False, если проводка с таким reference уже есть.
+        """
+        if sum(amount for _, amount in legs) != 0:
+            raise ValueError(f"Проводка {kind} не сбалансирована: {legs}")
+        try:
+            cursor = self.connection.execute(
+                """
+                INSERT INTO ledger_transactions (kind, reference, user_id, created_at)
+                VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+                """,
+                (kind, reference, user_id)
+            )
+        except sqlite3.IntegrityError:
+            return False
+        txn_id = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO ledger_entries (txn_id, account, amount) VALUES (?, ?, ?)",
+            [(txn_id, account, amount) for account, amount in legs if amount]
+        )
+        if update_balance:
+            free = sum(amount for account, amount in legs if account == FREE_ACCOUNT.format(user_id))
+            paid = sum(amount for account, amount in legs if account == PAID_ACCOUNT.format(user_id))
+            used = -(free + paid) if kind == 'usage' else 0
+            self.connection.execute(
+                """
+                UPDATE users
+                SET free_generations = COALESCE(free_generations, 0) + ?,
+                    paid_generations = COALESCE(paid_generations, 0) + ?,
+                    total_generations = COALESCE(total_generations, 0) + ?,
+                    last_activity = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+                """,
+                (free, paid, used, user_id)
+            )
+        return True
+
+    def _migrate_balances(self):
+        """Входящие остатки в книге для пользователей, созданных до ее появления."""
+        if self.connection.execute("SELECT 1 FROM ledger_transactions LIMIT 1").fetchone():
+            return
+        users = self.connection.execute(
+            """
+            SELECT user_id, COALESCE(free_generations, 0), COALESCE(paid_generations, 0)
             FROM users
-            WHERE user_id = ?
+            WHERE COALESCE(free_generations, 0) != 0 OR COALESCE(paid_generations, 0) != 0
             """
-            self.cursor.execute(query, (user_id,))
-            result = self.cursor.fetchone()
-            if result:
-                return result  # Возвращаем (free_generations, total_generations)
-            else:
-                # Если пользователь не найден, возвращаем значения по умолчанию
-                return 0, 0
+        ).fetchall()
+        if not users:
+            return
+        with self.transaction():
+            for user_id, free, paid in users:
+                self._post('opening', f"opening:{user_id}", user_id, [
+                    (FREE_ACCOUNT.format(user_id), free),
+                    (PAID_ACCOUNT.format(user_id), paid),
+                    (ADJUSTMENT_ACCOUNT, -(free + paid)),
+                ], update_balance=False)
+        logger.info(f"Входящие остатки генераций перенесены в книгу для {len(users)} пользователей")
+
+    def _migrate_weights(self):
+        """Первый замер веса из профиля для пользователей, заполнивших его до появления замеров."""
+        if self.connection.execute("SELECT 1 FROM measurements LIMIT 1").fetchone():
+            return
+        users = self.connection.execute(
+            "SELECT user_id, weight FROM users WHERE weight IS NOT NULL"
+        ).fetchall()
+        if not users:
+            return
+        measured_at = int(datetime.now(timezone.utc).timestamp())
+        with self.transaction():
+            for user_id, weight in users:
+                self._insert_measurement(user_id, "weight", weight, measured_at)
+        logger.info(f"Вес из профиля перенесен в замеры для {len(users)} пользователей")
+
+    def get_balance(self, user_id):
+        """Остаток генераций пользователя: (free, paid, used); (0, 0, 0), если его нет."""
+        try:
+            result = self.connection.execute(
+                """
+                SELECT COALESCE(free_generations, 0), COALESCE(paid_generations, 0), COALESCE(total_generations, 0)
+                FROM users
+                WHERE user_id = ?
+                """,
+                (user_id,)
+            ).fetchone()
+            return result or (0, 0, 0)
         except sqlite3.Error as e:
             logger.error(f"Ошибка проверки генераций пользователя: {e}")
-            return 0, 0
+            return 0, 0, 0
+
+    def record_payment(self, payment_info):
+        """Платеж и начисление генераций одной идемпотентной транзакцией.
 
-    def save_payment(self, payment_info):
-        """Сохранение информации о платеже."""
+        Ключ идемпотентности - telegram_payment_charge_id. Возвращает False,
+        если этот платеж уже был проведен.
+        """
         logger.info(f"Начало сохранения платежа: {payment_info}")
+        required_keys = [
+            'user_id', 'telegram_payment_charge_id', 'amount', 'plan_name',
+            'generations_added', 'payment_date'
+        ]
+        for key in required_keys:
+            if key not in payment_info:
+                logger.error(f"Отсутствует обязательный ключ: {key}")
+                raise ValueError(f"Отсутствует обязательный ключ: {key}")
+
+        user_id = payment_info['user_id']
+        charge_id = payment_info['telegram_payment_charge_id']
+        generations = payment_info['generations_added']
         try:
-            # Проверка наличия всех необходимых ключей
-            required_keys = [
-                'user_id', 'telegram_payment_charge_id', 'amount', 'plan_name',
-                'generations_added', 'payment_date'
-            ]
-            for key in required_keys:
-                if key not in payment_info:
-                    logger.error(f"Отсутствует обязательный ключ: {key}")
-                    raise ValueError(f"Отсутствует обязательный ключ: {key}")
-
-            # Вставляем информацию о платеже в таблицу платежей
-            insert_query = """
-            INSERT INTO payments (user_id, payment_id, amount, plan, generations, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            with self.transaction():
+                applied = self._post('purchase', f"payment:{charge_id}", user_id, [
+                    (SALES_ACCOUNT, -generations),
+                    (PAID_ACCOUNT.format(user_id), generations),
+                ])
+                if not applied:
+                    logger.warning(f"Платеж {charge_id} уже проведен, повторное начисление пропущено")
+                    return False
+                self.connection.execute(
+                    """
+                    INSERT INTO payments (user_id, payment_id, amount, plan, generations, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (user_id, charge_id, payment_info['amount'], payment_info['plan_name'],
+                     generations, 'completed', payment_info['payment_date'])
+                )
+            logger.info(f"Платеж для пользователя {user_id} сохранен успешно")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка базы данных при сохранении платежа: {e}")
+            raise
+
+    def adjust_generations(self, user_id, free_delta, reference, paid_delta=0):
+        """Ручная корректировка остатка проводкой со счетом adjustment."""
+        try:
+            with self.transaction():
+                return self._post('adjustment', reference, user_id, [
+                    (FREE_ACCOUNT.format(user_id), free_delta),
+                    (PAID_ACCOUNT.format(user_id), paid_delta),
+                    (ADJUSTMENT_ACCOUNT, -(free_delta + paid_delta)),
+                ])
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка корректировки генераций: {e}")
+            raise
+
+    def use_generation(self, user_id, reference=None):
+        """Списание одной генерации: сначала бесплатные, затем оплаченные.
+
+        Возвращает остаток (free, paid) или None, если списывать нечего
+        либо проводка с таким reference уже была.
+        """
+        try:
+            with self.transaction():
+                row = self.connection.execute(
+                    "SELECT COALESCE(free_generations, 0), COALESCE(paid_generations, 0) FROM users WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
+                if not row or row[0] + row[1] <= 0:
+                    logger.warning(f"У пользователя {user_id} нет генераций для списания")
+                    return None
+                account = FREE_ACCOUNT if row[0] > 0 else PAID_ACCOUNT
+                if not self._post('usage', reference, user_id, [
+                    (account.format(user_id), -1),
+                    (USAGE_ACCOUNT, 1),
+                ]):
+                    return None
+            logger.info(f"Использована одна генерация пользователем {user_id}")
+            return self.get_balance(user_id)[:2]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка списания генерации: {e}")
+            raise
+
+    def get_ledger(self, user_id, limit=20):
+        """Последние проводки по счетам пользователя: (время, вид, reference, счет, сумма)."""
+        return self.connection.execute(
             """
-            self.cursor.execute(insert_query, (
-                payment_info['user_id'],
-                payment_info['telegram_payment_charge_id'],
-                payment_info['amount'],
-                payment_info['plan_name'],
-                payment_info['generations_added'],
-                'completed',
-                payment_info['payment_date']
-            ))
-
-            # Обновляем количество оплаченных генераций для пользователя
-            update_query = """
-            UPDATE users
-            SET paid_generations = COALESCE(paid_generations, 0) + ?,
-                total_generations = COALESCE(total_generations, 0) + ?,
-                last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = ?
+            SELECT datetime(t.created_at, 'unixepoch'), t.kind, t.reference, e.account, e.amount
+            FROM ledger_entries e
+            JOIN ledger_transactions t ON t.id = e.txn_id
+            WHERE e.account IN (?, ?)
+            ORDER BY e.id DESC
+            LIMIT ?
+            """,
+            (FREE_ACCOUNT.format(user_id), PAID_ACCOUNT.format(user_id), limit)
+        ).fetchall()
+
+    def find_balance_mismatches(self):
+        """Пользователи, у которых остаток в users не сходится с книгой: (user_id, free, книга free, paid, книга paid)."""
+        return self.connection.execute(
+            """
+            SELECT u.user_id,
+                   COALESCE(u.free_generations, 0), COALESCE(f.total, 0),
+                   COALESCE(u.paid_generations, 0), COALESCE(p.total, 0)
+            FROM users u
+            LEFT JOIN (SELECT account, SUM(amount) AS total FROM ledger_entries GROUP BY account) f
+                   ON f.account = 'user:' || u.user_id || ':free'
+            LEFT JOIN (SELECT account, SUM(amount) AS total FROM ledger_entries GROUP BY account) p
+                   ON p.account = 'user:' || u.user_id || ':paid'
+            WHERE COALESCE(u.free_generations, 0) != COALESCE(f.total, 0)
+               OR COALESCE(u.paid_generations, 0) != COALESCE(p.total, 0)
             """
-            self.cursor.execute(update_query, (
-                payment_info['generations_added'],
-                payment_info['generations_added'],
-                payment_info['user_id']
-            ))
+        ).fetchall()
 
-            self.connection.commit()
-            logger.info(f"Платеж для пользователя {payment_info['user_id']} сохранен успешно")
-        except sqlite3.IntegrityError as e:
-            self.connection.rollback()
-            logger.error(f"Ошибка целостности данных при сохранении платежа: {e}")
+    def create_broadcast(self, text, segment='all'):
+        """Создание рассылки, возвращает её id."""
+        if segment not in BROADCAST_SEGMENTS:
+            raise ValueError(f"Неизвестный сегмент рассылки: {segment}")
+        try:
+            with self.transaction():
+                cursor = self.connection.execute(
+                    "INSERT INTO broadcasts (text, segment) VALUES (?, ?)", (text, segment)
+                )
+            logger.info(f"Создана рассылка {cursor.lastrowid} для сегмента {segment}")
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка создания рассылки: {e}")
             raise
-        except sqlite3.OperationalError as e:
-            self.connection.rollback()
-            logger.error(f"Операционная ошибка базы данных: {e}")
+
+    def get_broadcast(self, broadcast_id):
+        """Получение рассылки: (id, text, segment, status, last_user_id, sent, failed)."""
+        try:
+            return self.connection.execute(
+                """
+                SELECT id, text, segment, status, last_user_id, sent, failed
+                FROM broadcasts
+                WHERE id = ?
+                """,
+                (broadcast_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения рассылки {broadcast_id}: {e}")
+            return None
+
+    def get_unfinished_broadcasts(self):
+        """Список id рассылок, прерванных до завершения."""
+        try:
+            rows = self.connection.execute(
+                "SELECT id FROM broadcasts WHERE status IN ('pending', 'running') ORDER BY id"
+            ).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения незавершенных рассылок: {e}")
+            return []
+
+    def update_broadcast_progress(self, broadcast_id, status, last_user_id, sent, failed):
+        """Сохранение контрольной точки рассылки."""
+        try:
+            with self.transaction():
+                self.connection.execute(
+                    """
+                    UPDATE broadcasts
+                    SET status = ?, last_user_id = ?, sent = ?, failed = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    """,
+                    (status, last_user_id, sent, failed, broadcast_id)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения прогресса рассылки {broadcast_id}: {e}")
+            raise
+
+    def get_broadcast_recipients(self, segment, after_user_id, limit):
+        """Страница получателей сегмента с user_id больше after_user_id (keyset-пагинация)."""
+        where = BROADCAST_SEGMENTS[segment]
+        try:
+            rows = self.connection.execute(
+                f"""
+                SELECT user_id FROM users
+                WHERE user_id > ? AND {where}
+                ORDER BY user_id
+                LIMIT ?
+                """,
+                (after_user_id, limit)
+            ).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения получателей рассылки: {e}")
             raise
-        except ValueError as e:
-            logger.error(f"Ошибка валидации данных: {e}")
+
+    def insert_usage_records(self, records):
+        """Пакетная запись строк журнала расхода токенов.
+
+        records: кортежи (created_at, user_id, kind, model, prompt_tokens,
+        completion_tokens, image_tokens, latency_ms, cost_micros, cached_tokens).
+        """
+        try:
+            with self.transaction():
+                self.connection.executemany(
+                    """
+                    INSERT INTO usage_log (created_at, user_id, kind, model, prompt_tokens,
+                                           completion_tokens, image_tokens, latency_ms, cost_micros,
+                                           cached_tokens)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    records
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи журнала расхода токенов: {e}")
             raise
-        except Exception as e:
-            self.connection.rollback()
-            logger.error(f"Непредвиденная ошибка при сохранении платежа: {e}")
+
+    def get_usage_by_day(self, days=7):
+        """Расход по дням: (день, запросов, prompt, completion, стоимость в микродолларах, анализов, из кэша)."""
+        try:
+            return self.connection.execute(
+                """
+                SELECT date(created_at, 'unixepoch') AS day,
+                       COUNT(*),
+                       SUM(prompt_tokens),
+                       SUM(completion_tokens),
+                       SUM(cost_micros),
+                       SUM(kind IN ('analysis', 'album')),
+                       SUM(cached_tokens)
+                FROM usage_log
+                WHERE created_at >= CAST(strftime('%s', 'now', ?) AS INTEGER)
+                GROUP BY day
+                ORDER BY day
+                """,
+                (f'-{int(days)} days',)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка агрегации расхода по дням: {e}")
+            return []
+
+    def get_usage_by_user(self, limit=10, days=30):
+        """Самые затратные пользователи: (user_id, запросов, стоимость в микродолларах, анализов)."""
+        try:
+            return self.connection.execute(
+                """
+                SELECT user_id, COUNT(*), SUM(cost_micros), SUM(kind IN ('analysis', 'album'))
+                FROM usage_log
+                WHERE created_at >= CAST(strftime('%s', 'now', ?) AS INTEGER)
+                GROUP BY user_id
+                ORDER BY SUM(cost_micros) DESC
+                LIMIT ?
+                """,
+                (f'-{int(days)} days', limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка агрегации расхода по пользователям: {e}")
+            return []
+
+    def get_usage_by_plan(self, days=30):
+        """Расход по последнему купленному тарифу: (тариф или NULL, пользователей, стоимость, анализов)."""
+        try:
+            return self.connection.execute(
+                """
+                SELECT plan, COUNT(DISTINCT user_id), SUM(cost), SUM(analyses)
+                FROM (
+                    SELECT u.user_id,
+                           (SELECT p.plan FROM payments p
+                            WHERE p.user_id = u.user_id
+                            ORDER BY p.created_at DESC LIMIT 1) AS plan,
+                           SUM(u.cost_micros) AS cost,
+                           SUM(u.kind IN ('analysis', 'album')) AS analyses
+                    FROM usage_log u
+                    WHERE u.created_at >= CAST(strftime('%s', 'now', ?) AS INTEGER)
+                    GROUP BY u.user_id
+                )
+                GROUP BY plan
+                ORDER BY plan
+                """,
+                (f'-{int(days)} days',)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка агрегации расхода по тарифам: {e}")
+            return []
+
+    def iter_complete_profiles(self, chunk_size):
+        """Пачки заполненных профилей по столбцам: (user_ids, ages, heights, weights, goals, activity_levels)."""
+        last_user_id = 0
+        while True:
+            rows = self.connection.execute(
+                """
+                SELECT user_id, age, height, weight, goal, activity_level
+                FROM users
+                WHERE user_id > ?
+                  AND age IS NOT NULL AND height IS NOT NULL AND weight IS NOT NULL
+                  AND goal IS NOT NULL AND activity_level IS NOT NULL
+                ORDER BY user_id
+                LIMIT ?
+                """,
+                (last_user_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_user_id = rows[-1][0]
+            yield tuple(map(list, zip(*rows)))
+
+    @contextmanager
+    def bulk_calories_update(self):
+        """Одна транзакция для массовой записи daily_calories.
+
+        Отдает функцию write(pairs), где pairs - пары (daily_calories, user_id).
+        """
+        def write(pairs):
+            self.connection.executemany(
+                "UPDATE users SET daily_calories = ? WHERE user_id = ?", pairs
+            )
+
+        try:
+            with self.transaction():
+                yield write
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка массового обновления калорий: {e}")
             raise
 
-    def add_generations(self, user_id, generations):
-        """Добавление количества генераций пользователю."""
+    def save_meal(self, user_id, file_ids, result):
+        """Сохранение проанализированного приема пищи (MealResult), возвращает его id."""
         try:
-            query = """
-            UPDATE users
-            SET free_generations = COALESCE(free_generations, 0) + ?,
-                total_generations = COALESCE(total_generations, 0) + ?,
-                last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = ?
+            with self.transaction():
+                cursor = self.connection.execute(
+                    """
+                    INSERT INTO meals (user_id, created_at, file_ids, dish, analysis,
+                                       portion_g, kcal, protein_dg, fat_dg, carbs_dg, confidence)
+                    VALUES (?, CAST(strftime('%s', 'now') AS INTEGER), ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (user_id, ' '.join(file_ids), result.dish, result.text, *result.columns())
+                )
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения приема пищи пользователя {user_id}: {e}")
+            return None
+
+    def update_meal(self, meal_id, result):
+        """Обновление блюда, анализа и цифр после уточнения названия."""
+        try:
+            with self.transaction():
+                self.connection.execute(
+                    """
+                    UPDATE meals
+                    SET dish = ?, analysis = ?, portion_g = ?, kcal = ?,
+                        protein_dg = ?, fat_dg = ?, carbs_dg = ?, confidence = ?
+                    WHERE id = ?
+                    """,
+                    (result.dish, result.text, *result.columns(), meal_id)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка обновления приема пищи {meal_id}: {e}")
+
+    def get_meal(self, meal_id):
+        """Прием пищи по id: (user_id, file_ids, dish) или None."""
+        try:
+            return self.connection.execute(
+                "SELECT user_id, file_ids, dish FROM meals WHERE id = ?", (meal_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения приема пищи {meal_id}: {e}")
+            return None
+
+    def get_intake_summary(self, user_id, since):
+        """Питание с unix-времени since по приемам пищи с известными калориями.
+
+        Возвращает (приемов пищи, ккал, белки г, жиры г, углеводы г, дней с записями).
+        """
+        try:
+            meals, kcal, protein, fat, carbs, days = self.connection.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(kcal), 0), COALESCE(SUM(protein_dg), 0),
+                       COALESCE(SUM(fat_dg), 0), COALESCE(SUM(carbs_dg), 0),
+                       COUNT(DISTINCT created_at / 86400)
+                FROM meals
+                WHERE user_id = ? AND created_at >= ? AND kcal IS NOT NULL
+                """,
+                (user_id, since)
+            ).fetchone()
+            return meals, kcal, protein / 10, fat / 10, carbs / 10, days
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сводки питания пользователя {user_id}: {e}")
+            return 0, 0, 0.0, 0.0, 0.0, 0
+
+    def get_daily_intake(self, user_id, since):
+        """Питание по дням (UTC) с unix-времени since: (день, ккал, белки г, жиры г, углеводы г).
+
+        День - номер суток от начала эпохи; дни без записей не возвращаются.
+        """
+        try:
+            rows = self.connection.execute(
+                """
+                SELECT created_at / 86400 AS day, SUM(kcal), SUM(protein_dg), SUM(fat_dg), SUM(carbs_dg)
+                FROM meals
+                WHERE user_id = ? AND created_at >= ? AND kcal IS NOT NULL
+                GROUP BY day ORDER BY day
+                """,
+                (user_id, since)
+            ).fetchall()
+            return [(day, kcal, (protein or 0) / 10, (fat or 0) / 10, (carbs or 0) / 10)
+                    for day, kcal, protein, fat, carbs in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка питания по дням пользователя {user_id}: {e}")
+            return []
+
+    def add_measurement(self, user_id, metric, value, measured_at=None):
+        """Добавляет замер и обновляет его сводки за сутки, неделю и месяц."""
+        if measured_at is None:
+            measured_at = int(datetime.now(timezone.utc).timestamp())
+        try:
+            with self.transaction():
+                self._insert_measurement(user_id, metric, value, measured_at)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения замера {metric} пользователя {user_id}: {e}")
+            return False
+
+    def _insert_measurement(self, user_id, metric, value, measured_at):
+        """Вставка замера и его сводок; вызывается внутри transaction()."""
+        buckets = rollup_buckets(measured_at)
+        self.connection.execute(
+            "INSERT INTO measurements (user_id, metric, value, measured_at) VALUES (?, ?, ?, ?)",
+            (user_id, metric, value, measured_at)
+        )
+        self.connection.executemany(
             """
-            self.cursor.execute(query, (generations, generations, user_id))
-            self.connection.commit()
-            logger.info(f"Добавлено {generations} генераций пользователю {user_id}")
+            INSERT INTO measurement_rollups (user_id, metric, granularity, bucket, samples,
+                                             total, min_value, max_value, last_value, last_at)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, metric, granularity, bucket) DO UPDATE SET
+                samples = samples + 1,
+                total = total + excluded.total,
+                min_value = MIN(min_value, excluded.min_value),
+                max_value = MAX(max_value, excluded.max_value),
+                last_value = CASE WHEN excluded.last_at >= last_at
+                                  THEN excluded.last_value ELSE last_value END,
+                last_at = MAX(last_at, excluded.last_at)
+            """,
+            [(user_id, metric, granularity, buckets[granularity],
+              value, value, value, value, measured_at)
+             for granularity in MEASUREMENT_GRANULARITIES]
+        )
+
+    def get_measurement_trend(self, user_id, metric, granularity, limit):
+        """Последние limit сводок замера от старых к новым.
+
+        Возвращает строки (начало периода, замеров, среднее, минимум, максимум, последнее).
+        """
+        try:
+            rows = self.connection.execute(
+                """
+                SELECT bucket, samples, total / samples, min_value, max_value, last_value
+                FROM measurement_rollups
+                WHERE user_id = ? AND metric = ? AND granularity = ?
+                ORDER BY bucket DESC LIMIT ?
+                """,
+                (user_id, metric, granularity, limit)
+            ).fetchall()
+            return rows[::-1]
         except sqlite3.Error as e:
-            self.connection.rollback()
-            logger.error(f"Ошибка добавления генераций: {e}")
+            logger.error(f"Ошибка чтения динамики {metric} пользователя {user_id}: {e}")
+            return []
+
+    def get_chart_file_id(self, user_id, period, version):
+        """file_id графика, если он уже загружен для этой версии данных"""
+        try:
+            row = self.connection.execute(
+                "SELECT file_id FROM chart_cache WHERE user_id = ? AND period = ? AND version = ?",
+                (user_id, period, version)
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша графиков пользователя {user_id}: {e}")
+            return None
+
+    def save_chart_file_id(self, user_id, period, version, file_id):
+        """Запоминает file_id графика; старая версия того же периода заменяется"""
+        try:
+            with self.transaction():
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO chart_cache (user_id, period, version, file_id) VALUES (?, ?, ?, ?)",
+                    (user_id, period, version, file_id)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи кэша графиков пользователя {user_id}: {e}")
+
+    def delete_chart_file_id(self, user_id, period):
+        """Удаляет file_id графика, который Telegram больше не принимает"""
+        try:
+            with self.transaction():
+                self.connection.execute(
+                    "DELETE FROM chart_cache WHERE user_id = ? AND period = ?", (user_id, period)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка очистки кэша графиков пользователя {user_id}: {e}")
+
+    def get_meal_history(self, user_id, before=None, limit=10):
+        """Страница истории от новых к старым: (id, created_at, dish, kcal).
+
+        before - курсор (created_at, id) последней показанной записи: страница
+        берется одним диапазонным запросом по индексу без OFFSET.
+        """
+        if before is None:
+            before = (2 ** 62, 0)
+        try:
+            return self.connection.execute(
+                """
+                SELECT id, created_at, dish, kcal FROM meals
+                WHERE user_id = ? AND (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC LIMIT ?
+                """,
+                (user_id, *before, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения истории пользователя {user_id}: {e}")
+            return []
+
+    def search_meals(self, user_id, match_query, before_id=None, limit=10):
+        """Поиск по названиям и анализам от новых к старым: (id, created_at, dish, kcal).
+
+        match_query - выражение FTS5 по колонкам dish и analysis, курсор - id
+        последней показанной записи.
+        """
+        try:
+            return self.connection.execute(
+                """
+                SELECT meals.id, meals.created_at, meals.dish, meals.kcal
+                FROM meals_fts JOIN meals ON meals.id = meals_fts.rowid
+                WHERE meals_fts MATCH ? AND meals_fts.rowid < ?
+                ORDER BY meals_fts.rowid DESC LIMIT ?
+                """,
+                (f'user_id:"{int(user_id)}" AND {{dish analysis}}: ({match_query})',
+                 before_id if before_id is not None else 2 ** 63 - 1, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка поиска по истории пользователя {user_id}: {e}")
+            return []
+
+    def get_meals_after(self, after_id, limit):
+        """Страница приемов пищи с id больше after_id: (id, file_ids, dish)."""
+        try:
+            return self.connection.execute(
+                "SELECT id, file_ids, dish FROM meals WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения приемов пищи: {e}")
             raise
 
-    def use_generation(self, user_id):
-        """Списывание одной генерации у пользователя."""
-        try:
-            # Сначала пытаемся списать из бесплатных
-            free_query = """
-            UPDATE users 
-            SET free_generations = CASE 
-                WHEN free_generations > 0 THEN free_generations - 1 
-                ELSE free_generations 
-            END,
-            total_generations = total_generations + 1,
-            last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = ?
-            """
-            self.cursor.execute(free_query, (user_id,))
-            
-            # Если не осталось бесплатных, списываем из оплаченных
-            paid_query = """
-            UPDATE users 
-            SET paid_generations = CASE 
-                WHEN paid_generations > 0 THEN paid_generations - 1 
-                ELSE paid_generations 
-            END,
-            total_generations = total_generations + 1,
-            last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = ? AND free_generations = 0
-            """
-            self.cursor.execute(paid_query, (user_id,))
-            
-            self.connection.commit()
-            logger.info(f"Использована одна генерация пользователем {user_id}")
-            
-            # Возвращаем остаток генераций
-            generations_query = """
-            SELECT free_generations, paid_generations 
-            FROM users 
-            WHERE user_id = ?
-            """
-            self.cursor.execute(generations_query, (user_id,))
-            return self.cursor.fetchone()
-    
+    def update_meal_analyses(self, rows):
+        """Пакетная запись результатов переанализа: пары (meal_id, MealResult).
+
+        Прием пищи перезаписывается, только если уверенность нового
+        результата не ниже сохраненной: цифры из справочника не заменяются
+        оценкой модели, а ответ без цифр не стирает уже посчитанные.
+        Возвращает число обновленных приемов пищи.
+        """
+        try:
+            with self.transaction():
+                cursor = self.connection.executemany(
+                    """
+                    UPDATE meals
+                    SET analysis = ?, portion_g = ?, kcal = ?, protein_dg = ?, fat_dg = ?,
+                        carbs_dg = ?, confidence = ?, reanalyzed_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE id = ? AND COALESCE(confidence, 0) <= ?
+                    """,
+                    ((result.text, *columns, meal_id, columns[-1])
+                     for meal_id, result in rows
+                     for columns in (result.columns(),))
+                )
+            return cursor.rowcount
         except sqlite3.Error as e:
-            self.connection.rollback()
-            logger.error(f"Ошибка списания генерации: {e}")
+            logger.error(f"Ошибка записи результатов переанализа: {e}")
             raise
 
+    def create_batch_job(self, source):
+        """Создание задания переанализа, возвращает его id."""
+        with self.transaction():
+            cursor = self.connection.execute("INSERT INTO batch_jobs (source) VALUES (?)", (source,))
+        return cursor.lastrowid
+
+    def get_batch_job(self, job_id):
+        """Задание переанализа: (id, source, status)."""
+        return self.connection.execute(
+            "SELECT id, source, status FROM batch_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+
+    def update_batch_job_status(self, job_id, status):
+        with self.transaction():
+            self.connection.execute("UPDATE batch_jobs SET status = ? WHERE id = ?", (status, job_id))
+
+    def get_batch_chunks(self, job_id):
+        """Пачки задания: (id, first_key, last_key, requests, input_file_id, batch_id, status, applied)."""
+        return self.connection.execute(
+            """
+            SELECT id, first_key, last_key, requests, input_file_id, batch_id, status, applied
+            FROM batch_chunks
+            WHERE job_id = ?
+            ORDER BY id
+            """,
+            (job_id,)
+        ).fetchall()
+
+    def add_batch_chunk(self, job_id, first_key, last_key, requests):
+        """Пачка записывается до загрузки файла и создания batch, возвращает ее id."""
+        with self.transaction():
+            cursor = self.connection.execute(
+                """
+                INSERT INTO batch_chunks (job_id, first_key, last_key, requests)
+                VALUES (?, ?, ?, ?)
+                """,
+                (job_id, first_key, last_key, requests)
+            )
+        return cursor.lastrowid
+
+    def set_batch_chunk_input(self, chunk_id, input_file_id):
+        """Загруженный входной файл пачки; прежний batch забывается - его заменит новый."""
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE batch_chunks SET input_file_id = ?, batch_id = NULL, status = 'uploaded' WHERE id = ?",
+                (input_file_id, chunk_id)
+            )
+
+    def set_batch_chunk_batch(self, chunk_id, batch_id):
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE batch_chunks SET batch_id = ?, status = 'submitted' WHERE id = ?",
+                (batch_id, chunk_id)
+            )
+
+    def update_batch_chunk(self, chunk_id, status, applied=0):
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE batch_chunks SET status = ?, applied = ? WHERE id = ?",
+                (status, applied, chunk_id)
+            )
+
+    def set_reminder(self, user_id, kind, times, due_at):
+        """Сохраняет расписание напоминаний; times None - напоминания этого вида выключены"""
+        try:
+            with self.transaction():
+                if times is None:
+                    self.connection.execute(
+                        "DELETE FROM reminders WHERE user_id = ? AND kind = ?", (user_id, kind)
+                    )
+                else:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO reminders (user_id, kind, times, due_at) VALUES (?, ?, ?, ?)",
+                        (user_id, kind, times, due_at)
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения напоминаний пользователя {user_id}: {e}")
+
+    def get_reminder_settings(self, user_id):
+        """Расписания пользователя: {вид: times}"""
+        try:
+            return dict(self.connection.execute(
+                "SELECT kind, times FROM reminders WHERE user_id = ?", (user_id,)
+            ).fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения напоминаний пользователя {user_id}: {e}")
+            return {}
+
+    def get_due_reminders(self, until):
+        """Напоминания со временем отправки раньше until: (due_at, user_id, kind) по возрастанию"""
+        try:
+            return self.connection.execute(
+                "SELECT due_at, user_id, kind FROM reminders WHERE due_at < ? ORDER BY due_at", (until,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения расписания напоминаний: {e}")
+            return []
+
+    def get_reminders(self, keys):
+        """Текущие расписания по ключам (user_id, kind): {ключ: (times, due_at)}"""
+        try:
+            found = {}
+            for user_id, kind in keys:
+                row = self.connection.execute(
+                    "SELECT times, due_at FROM reminders WHERE user_id = ? AND kind = ?", (user_id, kind)
+                ).fetchone()
+                if row:
+                    found[(user_id, kind)] = row
+            return found
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения напоминаний: {e}")
+            return {}
+
+    def advance_reminders(self, rows):
+        """Переносит напоминания на следующее время одной транзакцией.
+
+        rows - (next_due, user_id, kind, expected_due). Строка переносится,
+        только если due_at в базе еще равен expected_due; возвращает
+        перенесенные ключи (user_id, kind) - их и нужно отправить.
+        """
+        try:
+            claimed = []
+            with self.transaction():
+                for next_due, user_id, kind, expected_due in rows:
+                    cursor = self.connection.execute(
+                        "UPDATE reminders SET due_at = ? WHERE user_id = ? AND kind = ? AND due_at = ?",
+                        (next_due, user_id, kind, expected_due)
+                    )
+                    if cursor.rowcount:
+                        claimed.append((user_id, kind))
+            return claimed
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка переноса напоминаний: {e}")
+            return []
+
+    def delete_reminders(self, user_id):
+        """Удаляет все напоминания пользователя (например, бот заблокирован)"""
+        try:
+            with self.transaction():
+                self.connection.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка удаления напоминаний пользователя {user_id}: {e}")
+
+    def get_users_with_meals_since(self, user_ids, since):
+        """Кто из user_ids сохранял приемы пищи с unix-времени since"""
+        if not user_ids:
+            return set()
+        try:
+            placeholders = ', '.join('?' * len(user_ids))
+            return {row[0] for row in self.connection.execute(
+                f"SELECT DISTINCT user_id FROM meals WHERE user_id IN ({placeholders}) AND created_at >= ?",
+                (*user_ids, since)
+            )}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка проверки приемов пищи: {e}")
+            return set()
+
+    def get_conversation(self, chat_id, user_id):
+        """Непросроченное состояние диалога: (state, data JSON) или None.
+
+        Одно чтение по первичному ключу (chat_id, user_id).
+        """
+        return self.connection.execute(
+            """
+            SELECT state, data FROM conversation_state
+            WHERE chat_id = ? AND user_id = ? AND expires_at > CAST(strftime('%s', 'now') AS INTEGER)
+            """,
+            (chat_id, user_id)
+        ).fetchone()
+
+    def save_conversation(self, chat_id, user_id, state, data, ttl):
+        """Запись состояния диалога на ttl секунд; data - строка JSON."""
+        with self.transaction():
+            self.connection.execute(
+                """
+                INSERT INTO conversation_state (chat_id, user_id, state, data, updated_at, expires_at)
+                VALUES (?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER) + ?)
+                ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at,
+                    expires_at = excluded.expires_at
+                """,
+                (chat_id, user_id, state, data, ttl)
+            )
+
+    def delete_conversation(self, chat_id, user_id):
+        """Удаление состояния диалога."""
+        with self.transaction():
+            cursor = self.connection.execute(
+                "DELETE FROM conversation_state WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)
+            )
+        return cursor.rowcount > 0
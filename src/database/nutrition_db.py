@@ -0,0 +1,158 @@
+# src/database/nutrition_db.py
+import re
+import csv
+import logging
+from difflib import SequenceMatcher
+from functools import lru_cache
+from collections import namedtuple, defaultdict, Counter
+from config.settings import NUTRITION_TABLE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Минимальная похожесть названия, при которой нечеткое совпадение принимается
+MATCH_THRESHOLD = 0.72
+# Для составных названий ("гречка с курицей") - только почти точное совпадение
+# с таким же составным названием из справочника, то есть опечатка
+COMPOUND_MATCH_THRESHOLD = 0.9
+
+# Слова и знаки, соединяющие части блюда: "гречка с курицей", "суп и салат", "рис, котлета"
+CONNECTOR_WORDS = frozenset({'с', 'со', 'и', 'плюс'})
+CONNECTOR_PATTERN = re.compile(r'[,+&/]')
+
+# Слова, уточняющие блюдо, а не добавляющие к нему еду: "домашний борщ", "порция плова"
+ADJECTIVE_ENDINGS = ('ый', 'ий', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ого', 'его', 'ую', 'юю', 'ым', 'им')
+MODIFIER_WORDS = frozenset({'порция', 'порции', 'тарелка', 'тарелки', 'кусок', 'куска', 'г', 'гр', 'грамм'})
+
+
+class NutritionFacts(namedtuple('NutritionFacts', ['name', 'kcal', 'protein', 'fat', 'carbs'])):
+    """Пищевая ценность блюда на 100 г"""
+    __slots__ = ()
+
+    def for_portion(self, grams):
+        factor = grams / 100
+        return NutritionFacts(
+            self.name,
+            round(self.kcal * factor),
+            round(self.protein * factor, 1),
+            round(self.fat * factor, 1),
+            round(self.carbs * factor, 1)
+        )
+
+
+def normalize_name(name):
+    """Нижний регистр, ё -> е, без пунктуации и лишних пробелов"""
+    name = name.lower().replace('ё', 'е')
+    name = re.sub(r'[^\w\s-]', ' ', name)
+    return ' '.join(name.split())
+
+
+def is_modifier(word):
+    """Слово уточняет блюдо (прилагательное, "по-грузински", количество), а не называет еще одно"""
+    return (word in MODIFIER_WORDS or word.isdigit() or word.startswith('по-')
+            or (len(word) > 3 and word.endswith(ADJECTIVE_ENDINGS)))
+
+
+def trigrams(name):
+    padded = f" {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NutritionDatabase:
+    """Справочник пищевой ценности блюд с нечетким поиском по названию.
+
+    CSV из data/ загружается при старте в неизменяемые структуры в памяти:
+    словарь точных названий и синонимов и триграммный индекс. Кандидаты
+    отбираются по пересечению триграмм (коэффициент Дайса), финальный
+    выбор - по похожести строк.
+    """
+
+    def __init__(self, csv_path=NUTRITION_TABLE_PATH):
+        self.names = {}
+        self.index_names = []
+        self.index_sizes = []
+        self.trigram_index = defaultdict(list)
+        self._load(csv_path)
+
+    def _load(self, csv_path):
+        foods = 0
+        with open(csv_path, encoding='utf-8') as table:
+            for row in csv.DictReader(table):
+                facts = NutritionFacts(
+                    row['name'], float(row['kcal']), float(row['protein']),
+                    float(row['fat']), float(row['carbs'])
+                )
+                foods += 1
+                for name in [row['name']] + row['synonyms'].split('|'):
+                    name = normalize_name(name)
+                    if name and name not in self.names:
+                        self._add_name(name, facts)
+        self.trigram_index = dict(self.trigram_index)
+        logger.info(f"Справочник пищевой ценности загружен: {foods} блюд, {len(self.names)} названий")
+
+    def _add_name(self, name, facts):
+        name_id = len(self.index_names)
+        grams = trigrams(name)
+        self.names[name] = facts
+        self.index_names.append(name)
+        self.index_sizes.append(len(grams))
+        for gram in grams:
+            self.trigram_index[gram].append(name_id)
+
+    def lookup(self, dish_name):
+        """Пищевая ценность на 100 г для названия блюда или None.
+
+        Составное название ("гречка с курицей", "рис, котлета") находится
+        только целиком: цифры одной части, умноженные на вес всей тарелки,
+        были бы неверны, такое блюдо оценивает модель.
+        """
+        if not dish_name:
+            return None
+        query = normalize_name(dish_name)
+        compound = bool(CONNECTOR_PATTERN.search(dish_name)) or any(
+            word in CONNECTOR_WORDS for word in query.split()
+        )
+        return self._lookup(query, compound)
+
+    @lru_cache(maxsize=4096)
+    def _lookup(self, query, compound=False):
+        facts = self.names.get(query)
+        if facts:
+            return facts
+
+        if not compound:
+            # "домашний борщ" содержит известное название целыми словами: берем
+            # самую длинную такую фразу, если остальные слова только уточняют блюдо
+            words = query.split()
+            for size in range(len(words) - 1, 0, -1):
+                for start in range(len(words) - size + 1):
+                    phrase = ' '.join(words[start:start + size])
+                    rest = words[:start] + words[start + size:]
+                    if phrase in self.names and all(is_modifier(word) for word in rest):
+                        return self.names[phrase]
+
+        threshold = COMPOUND_MATCH_THRESHOLD if compound else MATCH_THRESHOLD
+        best_score, best_facts = 0.0, None
+        for name in self._candidates(query):
+            matcher = SequenceMatcher(None, query, name)
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+            score = matcher.ratio()
+            if score > best_score:
+                best_score, best_facts = score, self.names[name]
+        if best_score >= threshold:
+            return best_facts
+        return None
+
+    def _candidates(self, query, limit=3):
+        """Названия с наибольшим коэффициентом Дайса по триграммам"""
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            for name_id in self.trigram_index.get(gram, ()):
+                shared[name_id] += 1
+        scored = sorted(
+            shared.items(),
+            key=lambda item: 2 * item[1] / (len(grams) + self.index_sizes[item[0]]),
+            reverse=True
+        )
+        return [self.index_names[name_id] for name_id, _ in scored[:limit]]
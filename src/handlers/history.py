@@ -0,0 +1,139 @@
+# src/handlers/history.py
+import re
+import logging
+from datetime import datetime
+from telebot import TeleBot
+from database.db_manager import DatabaseManager
+from utils.keyboards import main_menu, history_keyboard
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+# Telegram ограничивает callback_data 64 байтами, запрос поиска обрезается под остаток
+CALLBACK_DATA_LIMIT = 64
+
+
+# Окончание слова, которое отбрасывается перед поиском по префиксу
+ENDING_PATTERN = re.compile(r'[аеиоуыэюяьй]{1,2}$')
+
+
+def build_match_query(text):
+    """Выражение FTS5 из текста пользователя: все слова, каждое как префикс.
+
+    У длинных слов отбрасываются гласные на конце, так что "пиццы"
+    ищется как "пицц" и находит и "пицца", и "пиццу". Предлоги и другие
+    слова короче трех букв пропускаются.
+    """
+    words = re.findall(r'\w+', text.lower())
+    words = [word for word in words if len(word) >= 3] or words
+    if not words:
+        return None
+    stems = [ENDING_PATTERN.sub('', word) if len(word) > 4 else word for word in words]
+    return ' '.join(f'"{stem or word}"*' for stem, word in zip(stems, words))
+
+
+def fit_callback_data(prefix, query):
+    """prefix + запрос, обрезанный по границе символа до лимита Telegram"""
+    budget = CALLBACK_DATA_LIMIT - len(prefix.encode('utf-8'))
+    return prefix + query.encode('utf-8')[:budget].decode('utf-8', 'ignore')
+
+
+class HistoryHandler:
+    """История приемов пищи и поиск по ней.
+
+    Страницы листаются кнопкой "Раньше": в callback_data лежит курсор -
+    ключ последней показанной записи, и следующая страница берется одним
+    запросом по индексу, сколько бы страниц ни было пролистано.
+    """
+
+    def __init__(self, bot: TeleBot, db_manager: DatabaseManager):
+        self.bot = bot
+        self.db_manager = db_manager
+
+    def render_page(self, title, rows):
+        """Текст страницы и признак, что есть записи старше"""
+        has_more = len(rows) > PAGE_SIZE
+        lines = [title]
+        for meal_id, created_at, dish, kcal in rows[:PAGE_SIZE]:
+            moment = datetime.fromtimestamp(created_at)
+            calories = f", {kcal} ккал" if kcal is not None else ""
+            lines.append(f"{WEEKDAYS[moment.weekday()]} {moment:%d.%m %H:%M} — {dish or 'блюдо'}{calories}")
+        return "\n".join(lines), has_more
+
+    def history_page(self, user_id, before=None):
+        rows = self.db_manager.get_meal_history(user_id, before, PAGE_SIZE + 1)
+        if not rows:
+            return "История пока пуста: пришли фото блюда, и я его запомню 😉", None
+        text, has_more = self.render_page("📜 Твои приемы пищи:", rows)
+        markup = None
+        if has_more:
+            last_id, created_at, _, _ = rows[PAGE_SIZE - 1]
+            markup = history_keyboard(f"meal_hist:{created_at}:{last_id}")
+        return text, markup
+
+    def search_page(self, user_id, query, before_id=None):
+        match_query = build_match_query(query)
+        if not match_query:
+            return "Напиши, что искать: /find пицца", None
+        rows = self.db_manager.search_meals(user_id, match_query, before_id, PAGE_SIZE + 1)
+        if not rows:
+            return f"Ничего не нашел по запросу «{query}» 🤷", None
+        text, has_more = self.render_page(f"🔍 Нашел по запросу «{query}»:", rows)
+        markup = None
+        if has_more:
+            markup = history_keyboard(fit_callback_data(f"meal_find:{rows[PAGE_SIZE - 1][0]}:", query))
+        return text, markup
+
+    def show_history(self, message):
+        try:
+            text, markup = self.history_page(message.from_user.id)
+            self.bot.send_message(message.chat.id, text, reply_markup=markup or main_menu())
+        except Exception as e:
+            logger.error(f"Ошибка показа истории: {e}")
+            self.bot.send_message(message.chat.id, "Не удалось открыть историю. Попробуйте позже.", reply_markup=main_menu())
+
+    def find(self, message):
+        try:
+            query = message.text.partition(' ')[2].strip()
+            text, markup = self.search_page(message.from_user.id, query)
+            self.bot.send_message(message.chat.id, text, reply_markup=markup or main_menu())
+        except Exception as e:
+            logger.error(f"Ошибка поиска по истории: {e}")
+            self.bot.send_message(message.chat.id, "Поиск не удался. Попробуйте позже.", reply_markup=main_menu())
+
+    def next_page(self, call):
+        """Следующая страница по курсору из кнопки, сообщение редактируется на месте"""
+        try:
+            kind, _, rest = call.data.partition(':')
+            if kind == 'meal_hist':
+                created_at, last_id = rest.split(':')
+                text, markup = self.history_page(call.from_user.id, (int(created_at), int(last_id)))
+            else:
+                last_id, query = rest.split(':', 1)
+                text, markup = self.search_page(call.from_user.id, query, int(last_id))
+            self.bot.answer_callback_query(call.id)
+            self.bot.edit_message_text(
+                text, call.message.chat.id, call.message.message_id, reply_markup=markup
+            )
+        except Exception as e:
+            logger.error(f"Ошибка листания истории: {e}")
+            self.bot.answer_callback_query(call.id, "Произошла ошибка.")
+
+    def register_handlers(self):
+        """Регистрация обработчиков истории."""
+        @self.bot.message_handler(func=lambda message: message.text == "📜 История блюд")
+        def history(message):
+            self.show_history(message)
+
+        @self.bot.message_handler(commands=['history'])
+        def history_command(message):
+            self.show_history(message)
+
+        @self.bot.message_handler(commands=['find'])
+        def find(message):
+            self.find(message)
+
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(('meal_hist:', 'meal_find:')))
+        def page(call):
+            self.next_page(call)
@@ -1,25 +1,113 @@
 import os
+import re
+import time
 import logging
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
 from telebot import TeleBot, types
-from openai import OpenAI
+from telebot.handler_backends import State, StatesGroup
 import base64
-from utils.keyboards import main_menu
+from services.image_service import ImageService
+from services.dish_classifier import load_dish_classifier
+from services.media_group import MediaGroupCollector
+from services.lifecycle import InFlight, tracked
+from services.admission import AdmissionController, SHED_PER_USER
+from services.single_flight import SingleFlight
+from services.hedging import HedgePolicy
+from services.health import CallHealth
+from database.nutrition_db import NutritionDatabase
+from services.usage_ledger import UsageLedger, estimate_image_tokens
+from services.meal_result import (
+    MealResult, NUTRITION_LINE_FORMAT, CONFIDENCE_REFERENCE, render_nutrition, parse_model_analysis
+)
+from utils.keyboards import main_menu, correction_keyboard
+from config.settings import OPENAI_HEDGING, ANALYSIS_CONCURRENCY, OPENAI_TIMEOUT, OPENAI_MAX_RETRIES
 
 logger = logging.getLogger(__name__)
 
+# Статичные системные промпты. Префикс запроса должен совпадать байт в байт,
+# чтобы OpenAI мог взять его из кэша, поэтому случайные фразы сюда не попадают.
+DISH_SYSTEM_PROMPT = "Определи название блюда максимально точно. Назови его одним словом."
+
+ANALYSIS_SYSTEM_PROMPT = (
+    "Ты эксперт по питанию с острым языком в стиле FoodNudes. "
+    "Твоя задача - провести максимально честный и дерзкий анализ блюда:\n\n"
+    "🔥 Правила:\n"
+    "1. Первой строкой напиши только оценку порции на фото: " + NUTRITION_LINE_FORMAT + "\n"
+    "2. Определи ингредиенты с язвительным комментарием\n"
+    "3. Укажи калорийность с provокационным намёком\n"
+    "4. Оцени пищевую ценность с легким флиртом\n"
+    "5. Дай совет по употреблению в стиле злого диетолога\n\n"
+    "В сообщении пользователя есть вступление и фраза про калории: "
+    "подхвати их настроение в своём ответе."
+)
+
+# Промпт для блюд из справочника: калории и БЖУ считаются локально,
+# модель оценивает только вес порции и пишет комментарий
+PORTION_SYSTEM_PROMPT = (
+    "Ты эксперт по питанию с острым языком в стиле FoodNudes. "
+    "Калорийность и БЖУ блюда уже посчитаны, не пересчитывай их и не перечисляй цифры.\n\n"
+    "🔥 Правила:\n"
+    "1. Первой строкой напиши только вес порции на фото: 'Порция: <число> г'\n"
+    "2. Определи ингредиенты с язвительным комментарием\n"
+    "3. Оцени пищевую ценность с легким флиртом\n"
+    "4. Дай совет по употреблению в стиле злого диетолога\n\n"
+    "В сообщении пользователя есть вступление и фраза про калории: "
+    "подхвати их настроение в своём ответе."
+)
+
+# Альбом из нескольких фото анализируется одним запросом как один прием пищи
+ALBUM_SYSTEM_PROMPT = (
+    "Ты эксперт по питанию с острым языком в стиле FoodNudes. "
+    "На нескольких фото - один прием пищи: разные блюда или одно блюдо с разных ракурсов. "
+    "Твоя задача - провести максимально честный и дерзкий анализ всего приема пищи целиком:\n\n"
+    "🔥 Правила:\n"
+    "1. Первой строкой перечисли блюда: 'Блюда: <названия через запятую>'\n"
+    "2. Второй строкой напиши только оценку всего приема пищи: " + NUTRITION_LINE_FORMAT + "\n"
+    "3. Определи ингредиенты с язвительным комментарием\n"
+    "4. Укажи суммарную калорийность с provокационным намёком, одно и то же блюдо на разных фото не суммируй\n"
+    "5. Оцени пищевую ценность с легким флиртом\n"
+    "6. Дай совет по употреблению в стиле злого диетолога\n\n"
+    "В сообщении пользователя есть вступление и фраза про калории: "
+    "подхвати их настроение в своём ответе."
+)
+
+ALBUM_DISHES_PATTERN = re.compile(r'^\W*Блюда\W*(.+)$', re.IGNORECASE | re.MULTILINE)
+
+# Итог фото, не допущенного к анализу: его получают и присоединившиеся повторы
+PhotoRejected = namedtuple('PhotoRejected', ['reason', 'retry_after'])
+
+PORTION_PATTERN = re.compile(r'^\W*Порция\W*(\d+(?:[.,]\d+)?)\s*г\W*$', re.IGNORECASE | re.MULTILINE)
+
+class MealStates(StatesGroup):
+    """Шаг уточнения названия блюда; id приема пищи лежит в данных состояния"""
+    rename = State()
+
 class MealAnalysisHandler:
-    def __init__(self, bot: TeleBot, db_manager):
+    def __init__(self, bot: TeleBot, db_manager, usage_ledger=None, dish_classifier=None, nutrition_db=None,
+                 hedge_policy=None):
         self.bot = bot
         self.db_manager = db_manager
-        self.current_rename_context = {}
-        
-        try:
-            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            logger.info("OpenAI client successfully initialized")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {e}")
-            raise
+        self.usage_ledger = usage_ledger or UsageLedger(db_manager)
+        self.dish_classifier = dish_classifier or load_dish_classifier()
+        self.nutrition_db = nutrition_db or NutritionDatabase()
+        # Второй запрос к модели при медленном ответе, включается OPENAI_HEDGING
+        self.hedge_policy = hedge_policy or (HedgePolicy() if OPENAI_HEDGING else None)
+        # Ошибки OpenAI подряд для /healthz
+        self.openai_health = CallHealth()
+        self.media_groups = MediaGroupCollector(self.handle_album)
+        # Анализы, которые при остановке бота нужно дождаться
+        self.in_flight = InFlight()
+        # Очередь анализов фото с отказом при перегрузке
+        self.admission = AdmissionController(self.in_flight)
+        # Повторно присланное фото, пока первое еще анализируется, получает тот же ответ
+        self.photo_flights = SingleFlight()
+        # Независимые запросы к Telegram и базе внутри анализа фото идут параллельно
+        self.io_pool = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY * 2, thread_name_prefix="photo-io")
+        self._client = None
+        self._client_lock = threading.Lock()
 
         # Коллекция провокационных фраз для разнообразия
         self.spicy_intros = [
@@ -46,28 +134,153 @@ class MealAnalysisHandler:
             "Один culinary striptease окончен, но шоу продолжается! Какое блюдо раздетое ждёт меня? 👀"
         ]
 
-    def generate_correction_keyboard(self, message_id, current_dish):
+    @property
+    def client(self):
+        """Клиент OpenAI создается при первом обращении: импорт openai - самая долгая часть запуска"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    try:
+                        self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), timeout=OPENAI_TIMEOUT,
+                                              max_retries=OPENAI_MAX_RETRIES)
+                        logger.info("OpenAI client successfully initialized")
+                    except Exception as e:
+                        logger.error(f"Failed to initialize OpenAI client: {e}")
+                        raise
+        return self._client
+
+    def generate_correction_keyboard(self, meal_id):
         """Создание клавиатуры для коррекции блюда"""
-        markup = types.InlineKeyboardMarkup()
-        markup.row(
-            types.InlineKeyboardButton("Всё верно ✅", callback_data=f"meal_correct:{message_id}"),
-            types.InlineKeyboardButton("Указать название 🍽️", callback_data=f"meal_rename:{message_id}:{current_dish}")
-        )
-        return markup
+        return correction_keyboard(meal_id)
 
-    def encode_image(self, image_path):
-        """Кодирование изображения в base64"""
+    def create_completion(self, kind, user_id, image_tokens=0, **kwargs):
+        """Вызов модели с записью расхода токенов и задержки в журнал"""
+        started = time.perf_counter()
+        request = lambda: self.client.chat.completions.create(**kwargs)
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            if self.hedge_policy:
+                # Ответ проигравшего запроса не используется, но оплачен: пишем его расход отдельно
+                response = self.hedge_policy.call(kind, request, on_discard=lambda discarded: self.record_usage(
+                    user_id, f"{kind}_hedge", discarded, time.perf_counter() - started, image_tokens
+                ))
+            else:
+                response = request()
         except Exception as e:
-            logger.error(f"Ошибка при кодировании изображения: {e}")
+            self.openai_health.failure(e)
             raise
+        self.openai_health.success()
+        self.record_usage(user_id, kind, response, time.perf_counter() - started, image_tokens)
+        return response
+
+    def record_usage(self, user_id, kind, response, latency, image_tokens):
+        try:
+            self.usage_ledger.record(user_id, kind, response, latency, image_tokens)
+        except Exception as e:
+            logger.error(f"Не удалось учесть расход токенов: {e}")
+
+    def detect_dish(self, user_id, image_bytes, base64_image, image_tokens=0):
+        """Название блюда: локальный классификатор, а если он не уверен - OpenAI"""
+        prediction = self.dish_classifier.predict(image_bytes)
+        if self.dish_classifier.confident(prediction):
+            logger.info(f"Блюдо определено локально: {prediction.label} ({prediction.confidence:.2f})")
+            return prediction.label
+
+        # Первичный анализ для определения блюда
+        dish_response = self.create_completion(
+            'dish',
+            user_id,
+            image_tokens,
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": DISH_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Что это за блюдо?"},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    ]
+                }
+            ],
+            max_tokens=20
+        )
+
+        return dish_response.choices[0].message.content.strip()
+
+    def build_analysis_messages(self, dish_name, base64_image, system_prompt=ANALYSIS_SYSTEM_PROMPT):
+        """Сообщения для полного анализа: сначала статичная часть, затем изменяемая.
+
+        Картинка идет перед текстом, так что при уточнении названия блюда
+        совпадает префикс вместе с изображением.
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+                    {
+                        "type": "text",
+                        "text": f"{random.choice(self.spicy_intros)}\n"
+                                f"{random.choice(self.calorie_comments)}\n\n"
+                                f"Это блюдо '{dish_name}'"
+                    }
+                ]
+            }
+        ]
+
+    def analyze_dish(self, kind, user_id, dish_name, base64_image, image_tokens=0):
+        """Анализ блюда: MealResult с цифрами и текстом ответа.
+
+        Если блюдо есть в справочнике, калории и БЖУ берутся из него,
+        а у модели запрашиваются только вес порции и комментарий.
+        """
+        facts = self.nutrition_db.lookup(dish_name)
+        if not facts:
+            response = self.create_completion(
+                kind,
+                user_id,
+                image_tokens,
+                model="gpt-4o",
+                messages=self.build_analysis_messages(dish_name, base64_image),
+                max_tokens=300
+            )
+            return parse_model_analysis(dish_name, response.choices[0].message.content)
+
+        response = self.create_completion(
+            kind,
+            user_id,
+            image_tokens,
+            model="gpt-4o",
+            messages=self.build_analysis_messages(dish_name, base64_image, PORTION_SYSTEM_PROMPT),
+            max_tokens=250
+        )
+        commentary = response.choices[0].message.content
+        match = PORTION_PATTERN.search(commentary)
+        if not match:
+            # Без веса порции показываем значения на 100 г, но в учет питания они не идут
+            return MealResult.text_only(dish_name, f"{self.render_nutrition(facts, 100)}\n\n{commentary}")
+
+        portion = float(match.group(1).replace(',', '.'))
+        commentary = (commentary[:match.start()] + commentary[match.end():]).strip()
+        portion_facts = facts.for_portion(portion)
+        return MealResult.from_facts(
+            dish_name, portion_facts, portion, CONFIDENCE_REFERENCE,
+            f"{self.render_nutrition(portion_facts, portion)}\n\n{commentary}"
+        )
+
+    @staticmethod
+    def render_nutrition(facts, grams):
+        """Блок калорийности и БЖУ для ответа"""
+        return render_nutrition(facts.kcal, facts.protein, facts.fat, facts.carbs, grams)
 
     def handle_start_analysis(self, message):
         """Начало анализа блюда с новым характером"""
         try:
-            free_gens, paid_gens = self.db_manager.check_user_generations(message.from_user.id)
+            free_gens, paid_gens, _ = self.db_manager.get_balance(message.from_user.id)
             
             if free_gens + paid_gens <= 0:
                 self.bot.send_message(
@@ -90,11 +303,21 @@ class MealAnalysisHandler:
                 reply_markup=main_menu()
             )
 
-    def handle_photo(self, message):
-        """Обработка полученного фото с возможностью коррекции"""
+    def download_photo(self, file_id):
+        """Скачивание фото: (байты, base64, оценка токенов изображения)"""
+        file_info = self.bot.get_file(file_id)
+        downloaded_file = self.bot.download_file(file_info.file_path)
+        image_tokens = estimate_image_tokens(ImageService.jpeg_size(downloaded_file))
+        base64_image = base64.b64encode(downloaded_file).decode('utf-8')
+        return downloaded_file, base64_image, image_tokens
+
+    @tracked
+    def handle_album(self, messages):
+        """Анализ альбома одним запросом: одно сообщение и одна генерация на прием пищи"""
+        message = messages[0]
         try:
-            free_gens, paid_gens = self.db_manager.check_user_generations(message.from_user.id)
-            
+            free_gens, paid_gens, _ = self.db_manager.get_balance(message.from_user.id)
+
             if free_gens + paid_gens <= 0:
                 self.bot.send_message(
                     message.chat.id,
@@ -105,97 +328,197 @@ class MealAnalysisHandler:
 
             processing_msg = self.bot.send_message(
                 message.chat.id,
-                "Раздеваю твою тарелку... Анализирую со страстью к деталям! 🔍"
+                f"Раздеваю все {len(messages)} тарелки разом... Анализирую со страстью к деталям! 🔍"
             )
 
-            file_info = self.bot.get_file(message.photo[-1].file_id)
-            downloaded_file = self.bot.download_file(file_info.file_path)
-
-            os.makedirs("temp", exist_ok=True)
-            file_path = f"temp/{message.photo[-1].file_id}.jpg"
-            
-            try:
-                with open(file_path, "wb") as file:
-                    file.write(downloaded_file)
-
-                base64_image = self.encode_image(file_path)
-            finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-
-            # Первичный анализ для определения блюда
-            dish_response = self.client.chat.completions.create(
+            images = []
+            image_tokens = 0
+            for album_message in messages:
+                _, base64_image, tokens = self.download_photo(album_message.photo[-1].file_id)
+                images.append(base64_image)
+                image_tokens += tokens
+
+            content = [
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                for base64_image in images
+            ]
+            content.append({
+                "type": "text",
+                "text": f"{random.choice(self.spicy_intros)}\n{random.choice(self.calorie_comments)}"
+            })
+            response = self.create_completion(
+                'album',
+                message.from_user.id,
+                image_tokens,
                 model="gpt-4o",
                 messages=[
-                    {
-                        "role": "system",
-                        "content": "Определи название блюда максимально точно. Назови его одним словом."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Что это за блюдо?"},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
-                    }
+                    {"role": "system", "content": ALBUM_SYSTEM_PROMPT},
+                    {"role": "user", "content": content}
                 ],
-                max_tokens=20
+                max_tokens=450
             )
+            analysis_result = response.choices[0].message.content
 
-            detected_dish = dish_response.choices[0].message.content.strip()
+            dishes = "твой прием пищи"
+            match = ALBUM_DISHES_PATTERN.search(analysis_result)
+            if match:
+                dishes = match.group(1).strip()
+                analysis_result = (analysis_result[:match.start()] + analysis_result[match.end():]).strip()
+            result = parse_model_analysis(dishes, analysis_result)
 
-            # Полный анализ блюда
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"{random.choice(self.spicy_intros)}\n\n"
-                        "Ты эксперт по питанию с острым языком в стиле FoodNudes. "
-                        "Твоя задача - провести максимально честный и дерзкий анализ блюда:\n\n"
-                        "🔥 Правила:\n"
-                        "1. Определи ингредиенты с язвительным комментарием\n"
-                        "2. Укажи калорийность с provокационным намёком\n"
-                        "3. Оцени пищевую ценность с легким флиртом\n"
-                        "4. Дай совет по употреблению в стиле злого диетолога\n\n"
-                        f"{random.choice(self.calorie_comments)}"
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": f"Это блюдо '{detected_dish}'"},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300
+            self.bot.delete_message(message.chat.id, processing_msg.message_id)
+
+            self.db_manager.save_meal(
+                message.from_user.id,
+                [album_message.photo[-1].file_id for album_message in messages],
+                result
             )
 
-            self.bot.delete_message(message.chat.id, processing_msg.message_id)
+            self.bot.send_message(
+                message.chat.id,
+                f"🍽️ Анализ: {dishes}\n\n{result.text}",
+                reply_markup=main_menu(),
+                parse_mode='Markdown'
+            )
 
-            generations_left = self.db_manager.use_generation(message.from_user.id)
+            # Генерация списывается только после доставленного ответа
+            generations_left = self.db_manager.use_generation(
+                message.from_user.id, f"album:{message.chat.id}:{message.media_group_id}"
+            )
             logger.info(f"Остаток генераций: {generations_left}")
 
-            analysis_result = response.choices[0].message.content
-
-            # Добавляем клавиатуру для коррекции
-            correction_message = self.bot.send_message(
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома: {e}")
+            self.bot.send_message(
                 message.chat.id,
-                f"🍽️ Анализ блюда '{detected_dish}':\n\n"
-                f"{analysis_result}\n\n"
-                f"🔍 Я правильно определил блюдо?",
-                reply_markup=self.generate_correction_keyboard(message.message_id, detected_dish),
+                "Упс, что-то пошло не так с твоим альбомом 😏 Попробуй прислать фото еще раз.",
+                reply_markup=main_menu()
+            )
+
+    def submit_photo(self, message):
+        """Допуск фото к анализу: при перегрузке сразу отвечаем, когда прислать снова"""
+        key = (message.from_user.id, message.photo[-1].file_unique_id)
+        flight, leader = self.photo_flights.begin(key)
+        if not leader:
+            # Это фото уже анализируется: ответ придет по готовности, без второго списания
+            logger.info(f"Повтор фото {key[1]} от {key[0]} присоединен к идущему анализу")
+            flight.add_done_callback(lambda done: self.deliver_duplicate(message, done.result()))
+            return
+
+        rejection = self.admission.submit(message.from_user.id, self.analyze_photo, message, key)
+        if not rejection:
+            return
+        # Отклоненное фото не занимает ключ: присланное позже пойдет на анализ заново.
+        # Повторы, успевшие присоединиться, получают тот же отказ
+        rejected = PhotoRejected(*rejection)
+        self.photo_flights.finish(key, rejected)
+        self.send_rejection(message.chat.id, rejected)
+
+    def send_rejection(self, chat_id, rejected):
+        """Ответ на фото, не допущенное к анализу: когда прислать снова"""
+        if rejected.reason == SHED_PER_USER:
+            text = f"⏳ Я еще раздеваю твою прошлую тарелку. Пришли следующее фото через {rejected.retry_after} с 😏"
+        else:
+            text = f"⏳ Сейчас ко мне очередь из тарелок. Попробуй прислать фото через {rejected.retry_after} с 😉"
+        self.bot.send_message(chat_id, text, reply_markup=main_menu())
+
+    def analyze_photo(self, message, key):
+        """Анализ фото ведущим запросом: результат получают и присоединившиеся повторы"""
+        result = None
+        try:
+            result = self.handle_photo(message)
+        finally:
+            self.photo_flights.finish(key, result)
+
+    def deliver_duplicate(self, message, result):
+        """Ответ на повтор фото результатом уже выполненного анализа"""
+        # Без результата ведущий запрос сам сообщил пользователю об ошибке или балансе
+        if result is None:
+            return
+        try:
+            if isinstance(result, PhotoRejected):
+                self.send_rejection(message.chat.id, result)
+                return
+            self.send_photo_analysis(message.chat.id, *result)
+        except Exception as e:
+            logger.error(f"Ошибка ответа на повтор фото: {e}")
+
+    def send_photo_analysis(self, chat_id, result, meal_id):
+        """Ответ с анализом и клавиатурой для коррекции"""
+        if meal_id is None:
+            # Прием пищи не сохранился: кнопкам коррекции не на что ссылаться
+            self.bot.send_message(
+                chat_id,
+                f"🍽️ Анализ блюда '{result.dish}':\n\n{result.text}",
+                reply_markup=main_menu(),
                 parse_mode='Markdown'
             )
+            return
+        self.bot.send_message(
+            chat_id,
+            f"🍽️ Анализ блюда '{result.dish}':\n\n"
+            f"{result.text}\n\n"
+            f"🔍 Я правильно определил блюдо?",
+            reply_markup=self.generate_correction_keyboard(meal_id),
+            parse_mode='Markdown'
+        )
 
-            # Сохраняем контекст для возможной коррекции
-            self.current_rename_context = {
-                'user_id': message.from_user.id,
-                'image_base64': base64_image,
-                'original_analysis': analysis_result,
-                'original_dish': detected_dish,
-                'message_id': correction_message.message_id
-            }
+    def handle_photo(self, message):
+        """Обработка полученного фото с возможностью коррекции.
+
+        Возвращает (MealResult, id приема пищи) или None, если анализа не было.
+        """
+        started = time.perf_counter()
+        # Длительность учитывается и для анализов с ошибкой или таймаутом:
+        # именно они растут при перегрузке. Отказ без баланса не учитывается
+        measured = False
+        try:
+            free_gens, paid_gens, _ = self.db_manager.get_balance(message.from_user.id)
+            
+            if free_gens + paid_gens <= 0:
+                self.bot.send_message(
+                    message.chat.id,
+                    "⚠️ Твои бесплатные свидания с едой окончены. Пополни баланс, красавчик! 💸",
+                    reply_markup=main_menu()
+                )
+                return
+
+            measured = True
+            # Сообщение о начале анализа отправляется, пока скачивается фото
+            processing = self.io_pool.submit(
+                self.bot.send_message,
+                message.chat.id,
+                "Раздеваю твою тарелку... Анализирую со страстью к деталям! 🔍"
+            )
+
+            downloaded_file, base64_image, image_tokens = self.download_photo(message.photo[-1].file_id)
+
+            detected_dish = self.detect_dish(message.from_user.id, downloaded_file, base64_image, image_tokens)
+
+            # Полный анализ блюда
+            result = self.analyze_dish(
+                'analysis', message.from_user.id, detected_dish, base64_image, image_tokens
+            )
+
+            # Удаление сообщения о процессе идет параллельно с сохранением и ответом
+            processing_msg = processing.result()
+            cleanup = self.io_pool.submit(self.bot.delete_message, message.chat.id, processing_msg.message_id)
+
+            # Прием пищи сохраняется до ответа: кнопка коррекции ссылается на его id,
+            # и уточнить название можно в любом процессе бота
+            meal_id = self.db_manager.save_meal(
+                message.from_user.id, [message.photo[-1].file_id], result
+            )
+
+            self.send_photo_analysis(message.chat.id, result, meal_id)
+
+            # Генерация списывается только после доставленного ответа
+            generations_left = self.db_manager.use_generation(
+                message.from_user.id, f"photo:{message.chat.id}:{message.message_id}"
+            )
+            logger.info(f"Остаток генераций: {generations_left}")
+            cleanup.result()
+            return result, meal_id
 
         except Exception as e:
             logger.error(f"Ошибка обработки фото: {e}")
@@ -207,32 +530,45 @@ class MealAnalysisHandler:
                 error_message,
                 reply_markup=main_menu()
             )
+        finally:
+            if measured:
+                self.admission.observe(time.perf_counter() - started)
 
     def register_handlers(self):
         """Регистрация обработчиков сообщений"""
+        @self.bot.message_handler(state=MealStates.rename)
+        def rename_step(message):
+            self.process_meal_rename(message)
+
         @self.bot.message_handler(func=lambda message: message.text == "🍽️ Анализ блюда")
         def start_analysis(message):
             self.handle_start_analysis(message)
 
         @self.bot.message_handler(content_types=['photo'])
         def process_photo(message):
-            self.handle_photo(message)
+            # Фото из альбома копятся и анализируются вместе в handle_album
+            if not self.media_groups.add(message):
+                self.submit_photo(message)
 
         @self.bot.callback_query_handler(func=lambda call: call.data.startswith('meal_rename:'))
         def handle_meal_rename(call):
             try:
-                _, message_id, current_dish = call.data.split(':')
+                meal_id = int(call.data.split(':')[1])
                 self.bot.answer_callback_query(call.id)
-                
-                rename_msg = self.bot.send_message(
+                meal = self.db_manager.get_meal(meal_id)
+                if not meal:
+                    return
+
+                self.bot.send_message(
                     call.message.chat.id, 
-                    f"Текущее определение блюда: *{current_dish}*\n"
+                    f"Текущее определение блюда: *{meal[2]}*\n"
                     "Введите точное название блюда:",
                     parse_mode='Markdown'
                 )
                 
-                # Регистрируем следующий шаг
-                self.bot.register_next_step_handler(rename_msg, self.process_meal_rename)
+                # Следующее сообщение пользователя - новое название
+                self.bot.set_state(call.from_user.id, MealStates.rename, call.message.chat.id)
+                self.bot.add_data(call.from_user.id, call.message.chat.id, meal_id=meal_id)
             except Exception as e:
                 logger.error(f"Ошибка в callback обработки переименования: {e}")
 
@@ -260,56 +596,37 @@ class MealAnalysisHandler:
                 logger.error(f"Ошибка при подтверждении анализа: {e}")
                 self.bot.answer_callback_query(call.id, "Произошла ошибка.")
 
+    @tracked
     def process_meal_rename(self, message):
         """Обработка нового названия блюда"""
         try:
-            # Проверяем, что есть активный контекст
-            if not hasattr(self, 'current_rename_context') or \
-               self.current_rename_context.get('user_id') != message.from_user.id:
+            with self.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+                meal_id = data.get('meal_id')
+            self.bot.delete_state(message.from_user.id, message.chat.id)
+
+            meal = self.db_manager.get_meal(meal_id) if meal_id else None
+            if not meal or meal[0] != message.from_user.id:
                 return
 
             new_dish_name = message.text.strip()
-            context = self.current_rename_context
+
+            # Фото берется из Telegram по file_id, в состоянии хранится только id приема пищи
+            _, base64_image, image_tokens = self.download_photo(meal[1].split()[0])
 
             # Повторный анализ с новым названием
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"{random.choice(self.spicy_intros)}\n\n"
-                        "Ты эксперт по питанию с острым языком в стиле FoodNudes. "
-                        "Твоя задача - провести максимально честный и дерзкий анализ блюда:\n\n"
-                        "🔥 Правила:\n"
-                        "1. Определи ингредиенты с язвительным комментарием\n"
-                        "2. Укажи калорийность с provокационным намёком\n"
-                        "3. Оцени пищевую ценность с легким флиртом\n"
-                        "4. Дай совет по употреблению в стиле злого диетолога\n\n"
-                        f"{random.choice(self.calorie_comments)}"
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": f"Это блюдо '{new_dish_name}'"},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{context['image_base64']}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300
+            updated = self.analyze_dish(
+                'rename', message.from_user.id, new_dish_name, base64_image, image_tokens
             )
 
-            updated_analysis = response.choices[0].message.content
-
             # Отправляем обновленный анализ
             self.bot.send_message(
                 message.chat.id,
-                f"🍽️ Уточненный анализ блюда '{new_dish_name}':\n\n{updated_analysis}",
+                f"🍽️ Уточненный анализ блюда '{new_dish_name}':\n\n{updated.text}",
                 reply_markup=main_menu(),
                 parse_mode='Markdown'
             )
 
-            # Очищаем контекст
-            del self.current_rename_context
+            self.db_manager.update_meal(meal_id, updated)
 
         except Exception as e:
             logger.error(f"Ошибка при переименовании блюда: {e}")
@@ -4,7 +4,7 @@ from datetime import datetime
 from logging.handlers import RotatingFileHandler
 from telebot import TeleBot, types
 from database.db_manager import DatabaseManager
-from utils.keyboards import main_menu
+from utils.keyboards import main_menu, tariff_menu
 
 # Создаем директорию для логов, если её нет
 log_directory = 'logs'
@@ -71,26 +71,20 @@ class PaymentHandler:
         if not self.provider_token:
             logger.error("PAYMENT_PROVIDER_TOKEN не найден в переменных окружения")
             raise ValueError("Токен платежной системы не настроен")
+        self.tariff_keyboard = tariff_menu(TARIFF_PLANS)
         logger.info("PaymentHandler успешно инициализирован")
 
     def show_tariff_plans(self, message):
         """Показ доступных тарифных планов"""
         logger.info(f"Показ тарифов для пользователя {message.from_user.id}")
         try:
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            
-            for plan_name, plan_info in TARIFF_PLANS.items():
-                button_text = f"{plan_name} ({plan_info['price']} ₽)"
-                markup.add(types.KeyboardButton(button_text))
-            
-            markup.add(types.KeyboardButton("Назад в меню"))
-
-            free_gens, total_gens = self.db_manager.check_user_generations(message.from_user.id)
+            free_gens, paid_gens, used_gens = self.db_manager.get_balance(message.from_user.id)
             
             text = (
                 f"🔢 Ваш баланс:\n"
                 f"- Бесплатные генерации: {free_gens}\n"
-                f"- Всего использовано: {total_gens}\n\n"
+                f"- Оплаченные генерации: {paid_gens}\n"
+                f"- Всего использовано: {used_gens}\n\n"
                 "📊 Доступные тарифы:\n"
             )
             
@@ -101,7 +95,7 @@ class PaymentHandler:
                     f"  - {plan_info['price']} ₽\n"
                 )
 
-            self.bot.send_message(message.chat.id, text, reply_markup=markup)
+            self.bot.send_message(message.chat.id, text, reply_markup=self.tariff_keyboard)
             logger.info(f"Тарифы успешно показаны пользователю {message.from_user.id}")
             
         except Exception as e:
@@ -240,12 +234,11 @@ class PaymentHandler:
             
             logger.info(f"Информация о платеже: {payment_info}")
             
-            # Сохраняем информацию о платеже
-            self.db_manager.save_payment(payment_info)
-            logger.info(f"Платёж сохранен в базе данных")
-            
-            # Начисляем генерации пользователю
-            self.db_manager.add_generations(message.from_user.id, plan['generations'])
+            # Платеж и начисление генераций - одна проводка; повторная доставка
+            # того же платежа ничего не начисляет
+            if not self.db_manager.record_payment(payment_info):
+                logger.info(f"Повторное уведомление о платеже {payment.telegram_payment_charge_id}")
+                return
             logger.info(f"Генерации начислены пользователю {message.from_user.id}")
             
             success_message = (
@@ -1,41 +1,26 @@
 import logging
 from telebot import TeleBot, types
+from telebot.handler_backends import State, StatesGroup
 from database.db_manager import DatabaseManager
-from utils.keyboards import main_menu, profile_menu, goals_menu, activity_menu
+from services.calorie_engine import calculate_daily_calories, ACTIVITY_MULTIPLIERS, GOAL_ADJUSTMENTS
+from services.reminders import ReminderScheduler
+from config.settings import REMINDER_PRESETS, REMINDER_UTC_OFFSET
+from utils.keyboards import main_menu, profile_menu, goals_menu, activity_menu, reminders_menu
 
 logger = logging.getLogger(__name__)
 
+class ProfileStates(StatesGroup):
+    """Шаги ввода профиля, хранятся в state_storage бота"""
+    age = State()
+    height = State()
+    weight = State()
+    waist = State()
+
 class ProfileHandler:
-    def __init__(self, bot: TeleBot, db_manager: DatabaseManager):
+    def __init__(self, bot: TeleBot, db_manager: DatabaseManager, reminder_scheduler=None):
         self.bot = bot
         self.db_manager = db_manager
-
-    # Остальной код класса остается без изменений
-    
-    def calculate_daily_calories(self, weight, height, age, activity_level, goal):
-        """Расчет дневной нормы калорий"""
-        # Базовый обмен веществ (формула Миффлина-Сан Жеора)
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-
-        # Коэффициент активности
-        activity_multipliers = {
-            "Малоподвижный": 1.2,
-            "Умеренно активный": 1.375,
-            "Активный": 1.55,
-            "Очень активный": 1.725,
-            "Экстремально активный": 1.9
-        }
-        
-        # Учитываем уровень активности
-        maintenance = bmr * activity_multipliers.get(activity_level, 1.2)
-        
-        # Корректировка на основе цели
-        if goal == "Похудение":
-            return int(maintenance - 500)  # Дефицит 500 ккал
-        elif goal == "Набор массы":
-            return int(maintenance + 500)  # Профицит 500 ккал
-        else:
-            return int(maintenance)  # Поддержание веса
+        self.reminder_scheduler = reminder_scheduler or ReminderScheduler(bot, db_manager)
 
     def handle_profile_settings(self, message):
         """Обработка нажатия кнопки настройки профиля"""
@@ -47,15 +32,17 @@ class ProfileHandler:
 
     def handle_age(self, message):
         """Запрос возраста пользователя"""
-        msg = self.bot.send_message(
+        self.bot.send_message(
             message.chat.id,
             "Введите ваш возраст:",
             reply_markup=types.ReplyKeyboardRemove()
         )
-        self.bot.register_next_step_handler(msg, self.save_age)
+        self.bot.set_state(message.from_user.id, ProfileStates.age, message.chat.id)
 
     def save_age(self, message):
         """Сохранение возраста пользователя"""
+        # Шаг ждет одно сообщение, как и раньше: неверный ввод тоже его завершает
+        self.bot.delete_state(message.from_user.id, message.chat.id)
         try:
             age = int(message.text)
             if 0 <= age <= 120:
@@ -81,15 +68,16 @@ class ProfileHandler:
 
     def handle_height(self, message):
         """Запрос роста пользователя"""
-        msg = self.bot.send_message(
+        self.bot.send_message(
             message.chat.id,
             "Введите ваш рост в сантиметрах:",
             reply_markup=types.ReplyKeyboardRemove()
         )
-        self.bot.register_next_step_handler(msg, self.save_height)
+        self.bot.set_state(message.from_user.id, ProfileStates.height, message.chat.id)
 
     def save_height(self, message):
         """Сохранение роста пользователя"""
+        self.bot.delete_state(message.from_user.id, message.chat.id)
         try:
             height = float(message.text)
             if 50 <= height <= 250:
@@ -115,19 +103,22 @@ class ProfileHandler:
 
     def handle_weight(self, message):
         """Запрос веса пользователя"""
-        msg = self.bot.send_message(
+        self.bot.send_message(
             message.chat.id,
             "Введите ваш вес в килограммах:",
             reply_markup=types.ReplyKeyboardRemove()
         )
-        self.bot.register_next_step_handler(msg, self.save_weight)
+        self.bot.set_state(message.from_user.id, ProfileStates.weight, message.chat.id)
 
     def save_weight(self, message):
         """Сохранение веса пользователя"""
+        self.bot.delete_state(message.from_user.id, message.chat.id)
         try:
             weight = float(message.text)
             if 3 <= weight <= 300:
+                # В профиле - текущий вес для расчета нормы, в замерах - история для динамики
                 self.db_manager.update_user_profile(message.from_user.id, "weight", weight)
+                self.db_manager.add_measurement(message.from_user.id, "weight", weight)
                 self.bot.send_message(
                     message.chat.id,
                     f"Вес {weight} кг успешно сохранен!",
@@ -147,6 +138,40 @@ class ProfileHandler:
                 reply_markup=profile_menu()
             )
 
+    def handle_waist(self, message):
+        """Запрос обхвата талии пользователя"""
+        self.bot.send_message(
+            message.chat.id,
+            "Введите обхват талии в сантиметрах:",
+            reply_markup=types.ReplyKeyboardRemove()
+        )
+        self.bot.set_state(message.from_user.id, ProfileStates.waist, message.chat.id)
+
+    def save_waist(self, message):
+        """Сохранение обхвата талии: только в замеры, на норму калорий он не влияет"""
+        self.bot.delete_state(message.from_user.id, message.chat.id)
+        try:
+            waist = float(message.text)
+            if 30 <= waist <= 250:
+                self.db_manager.add_measurement(message.from_user.id, "waist", waist)
+                self.bot.send_message(
+                    message.chat.id,
+                    f"Талия {waist} см успешно сохранена!",
+                    reply_markup=profile_menu()
+                )
+            else:
+                self.bot.send_message(
+                    message.chat.id,
+                    "Пожалуйста, введите корректный обхват талии (от 30 до 250 см)",
+                    reply_markup=profile_menu()
+                )
+        except ValueError:
+            self.bot.send_message(
+                message.chat.id,
+                "Пожалуйста, введите число",
+                reply_markup=profile_menu()
+            )
+
     def handle_goal(self, message):
         """Запрос цели пользователя"""
         self.bot.send_message(
@@ -158,7 +183,7 @@ class ProfileHandler:
     def save_goal(self, message):
         """Сохранение цели пользователя"""
         goal = message.text
-        if goal in ["Похудение", "Набор массы", "Поддержание веса"]:
+        if goal in GOAL_ADJUSTMENTS:
             self.db_manager.update_user_profile(message.from_user.id, "goal", goal)
             self.bot.send_message(
                 message.chat.id,
@@ -184,10 +209,7 @@ class ProfileHandler:
     def save_activity(self, message):
         """Сохранение уровня активности пользователя"""
         activity = message.text
-        valid_activities = ["Малоподвижный", "Умеренно активный", "Активный", 
-                          "Очень активный", "Экстремально активный"]
-        
-        if activity in valid_activities:
+        if activity in ACTIVITY_MULTIPLIERS:
             self.db_manager.update_user_profile(message.from_user.id, "activity_level", activity)
             self.bot.send_message(
                 message.chat.id,
@@ -202,11 +224,35 @@ class ProfileHandler:
                 reply_markup=activity_menu()
             )
 
+    def handle_reminders(self, message):
+        """Выбор напоминаний с текущим расписанием пользователя"""
+        settings = self.db_manager.get_reminder_settings(message.from_user.id)
+        current = next(
+            (name for name, preset in REMINDER_PRESETS.items()
+             if all(settings.get(kind) == times for kind, times in preset.items())),
+            None
+        )
+        text = f"Когда напоминать о приемах пищи? Время указано по UTC+{REMINDER_UTC_OFFSET}."
+        if current:
+            text += f"\nСейчас: {current}"
+        self.bot.send_message(message.chat.id, text, reply_markup=reminders_menu(REMINDER_PRESETS))
+
+    def save_reminders(self, message):
+        """Сохранение выбранного варианта напоминаний"""
+        for kind, times in REMINDER_PRESETS[message.text].items():
+            self.reminder_scheduler.schedule(message.from_user.id, kind, times)
+        self.bot.send_message(
+            message.chat.id,
+            f"Напоминания сохранены: {message.text}",
+            reply_markup=profile_menu()
+        )
+
     def update_daily_calories(self, user_id):
         """Обновление дневной нормы калорий"""
         try:
             profile = self.db_manager.get_user_profile(user_id)
-            if profile and all(x is not None for x in profile):
+            # daily_calories (profile[4]) не проверяем: до первого расчета он пустой
+            if profile and all(x is not None for x in profile[:4] + profile[5:]):
                 age = profile[0]      # возраст
                 height = profile[1]   # рост
                 weight = profile[2]   # вес
@@ -214,7 +260,7 @@ class ProfileHandler:
                 activity = profile[5] # уровень активности
                 
                 if all(isinstance(x, (int, float, str)) for x in [weight, height, age, activity, goal]):
-                    daily_calories = self.calculate_daily_calories(
+                    daily_calories = calculate_daily_calories(
                         float(weight), 
                         float(height), 
                         int(age), 
@@ -231,6 +277,23 @@ class ProfileHandler:
 
     def register_handlers(self):
         """Регистрация всех обработчиков профиля"""
+        # Шаги ввода регистрируются первыми: ответ на вопрос важнее кнопок меню
+        @self.bot.message_handler(state=ProfileStates.age)
+        def age_step(message):
+            self.save_age(message)
+
+        @self.bot.message_handler(state=ProfileStates.height)
+        def height_step(message):
+            self.save_height(message)
+
+        @self.bot.message_handler(state=ProfileStates.weight)
+        def weight_step(message):
+            self.save_weight(message)
+
+        @self.bot.message_handler(state=ProfileStates.waist)
+        def waist_step(message):
+            self.save_waist(message)
+
         @self.bot.message_handler(func=lambda message: message.text == "🔧 Настроить профиль")
         def profile_settings(message):
             self.handle_profile_settings(message)
@@ -247,6 +310,10 @@ class ProfileHandler:
         def weight(message):
             self.handle_weight(message)
 
+        @self.bot.message_handler(func=lambda message: message.text == "Талия")
+        def waist(message):
+            self.handle_waist(message)
+
         @self.bot.message_handler(func=lambda message: message.text == "Цель")
         def goal(message):
             self.handle_goal(message)
@@ -255,12 +322,19 @@ class ProfileHandler:
         def activity(message):
             self.handle_activity(message)
 
-        @self.bot.message_handler(func=lambda message: message.text in 
-            ["Малоподвижный", "Умеренно активный", "Активный", "Очень активный", "Экстремально активный"])
+        @self.bot.message_handler(func=lambda message: message.text == "Напоминания")
+        def reminders(message):
+            self.handle_reminders(message)
+
+        @self.bot.message_handler(func=lambda message: message.text in REMINDER_PRESETS)
+        def save_reminders_handler(message):
+            self.save_reminders(message)
+
+        @self.bot.message_handler(func=lambda message: message.text in ACTIVITY_MULTIPLIERS)
         def save_activity_handler(message):
             self.save_activity(message)
 
-        @self.bot.message_handler(func=lambda message: message.text in ["Похудение", "Набор массы", "Поддержание веса"])
+        @self.bot.message_handler(func=lambda message: message.text in GOAL_ADJUSTMENTS)
         def save_goal_handler(message):
             self.save_goal(message)
 
@@ -1,35 +1,27 @@
 
+import time
 import logging
 from telebot import TeleBot
 from database.db_manager import DatabaseManager
+from services.calorie_engine import calculate_daily_calories
+from services.charts import ChartService
 from utils.keyboards import main_menu
 
 logger = logging.getLogger(__name__)
 
-def calculate_daily_calories(age, height, weight, goal, activity_level):
-    """Расчёт дневной нормы калорий."""
-    bmr = 10 * weight + 6.25 * height - 5 * age + 5  # Для мужчин (+5), для женщин (-161)
-    
-    activity_multiplier = {
-        'Малоподвижный': 1.2,
-        'Умеренно активный': 1.55,
-        'Активный': 1.75,
-        'Очень активный': 2.0
-    }.get(activity_level, 1.2)
-    
-    daily_calories = bmr * activity_multiplier
-    
-    if goal == 'Похудение':
-        daily_calories -= 500
-    elif goal == 'Набор массы':
-        daily_calories += 500
-
-    return int(daily_calories)
+# Периоды сводки питания: (заголовок, дней)
+INTAKE_PERIODS = (("неделю", 7), ("месяц", 30))
+# Динамика замеров по недельным сводкам: (метрика, заголовок, единица)
+TREND_METRICS = (("weight", "Вес", "кг"), ("waist", "Талия", "см"))
+TREND_WEEKS = 8
+# График калорий и БЖУ по дням за последние CHART_DAYS суток
+CHART_DAYS = 7
 
 class ProgressHandler:
     def __init__(self, bot: TeleBot, db_manager: DatabaseManager):
         self.bot = bot
         self.db_manager = db_manager
+        self.charts = ChartService(db_manager)
 
     def show_progress(self, message):
         """Отображение прогресса пользователя."""
@@ -43,16 +35,11 @@ class ProgressHandler:
             # Распаковываем профиль
             age, height, weight, goal, daily_calories, activity_level = profile
 
-            # Рассчитываем daily_calories, если оно отсутствует
-            if not daily_calories:
+            # Норма еще не сохранена, но профиль заполнен - считаем для показа
+            if not daily_calories and all(x is not None for x in (age, height, weight, goal, activity_level)):
                 daily_calories = calculate_daily_calories(
-                    age=age or 30,  # Значение по умолчанию
-                    height=height or 170,  # Значение по умолчанию
-                    weight=weight or 70,  # Значение по умолчанию
-                    goal=goal or 'Поддержание веса',  # Значение по умолчанию
-                    activity_level=activity_level or 'Малоподвижный'  # Значение по умолчанию
+                    float(weight), float(height), int(age), activity_level, goal
                 )
-                self.db_manager.update_user_profile(message.from_user.id, 'daily_calories', daily_calories)
 
             # Формируем текст профиля
             goal_recommendation = {
@@ -73,14 +60,26 @@ class ProgressHandler:
                 f"{goal_recommendation}\n\n"
             )
 
-            free_gens, total_gens = self.db_manager.check_user_generations(message.from_user.id)
+            # Сводки считаются SQL-агрегатом по сохраненным цифрам анализов
+            now = int(time.time())
+            for title, days in INTAKE_PERIODS:
+                summary = self.db_manager.get_intake_summary(message.from_user.id, now - days * 86400)
+                profile_text += self.format_intake(title, summary, daily_calories)
+
+            for metric, title, unit in TREND_METRICS:
+                trend = self.db_manager.get_measurement_trend(message.from_user.id, metric, 'week', TREND_WEEKS)
+                profile_text += self.format_trend(title, unit, trend)
+
+            free_gens, paid_gens, used_gens = self.db_manager.get_balance(message.from_user.id)
             profile_text += (
                 f"Статистика использования:\n"
                 f"Бесплатные генерации: {free_gens}\n"
-                f"Всего использовано генераций: {total_gens}\n"
+                f"Оплаченные генерации: {paid_gens}\n"
+                f"Всего использовано генераций: {used_gens}\n"
             )
 
             self.bot.send_message(message.chat.id, profile_text, reply_markup=main_menu())
+            self.send_chart(message, daily_calories)
 
         except ValueError as ve:
             logger.error(f"Ошибка данных профиля: {ve}")
@@ -97,6 +96,44 @@ class ProgressHandler:
                 reply_markup=main_menu()
             )
 
+    def send_chart(self, message, daily_calories):
+        """График питания за неделю; текст прогресса уже отправлен, ошибка графика его не отменяет"""
+        try:
+            self.charts.send_intake_chart(
+                self.bot, message.chat.id, message.from_user.id, CHART_DAYS,
+                daily_calories, caption="📈 Питание за неделю"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отправки графика прогресса: {e}")
+
+    @staticmethod
+    def format_intake(title, summary, daily_calories):
+        """Блок сводки питания за период"""
+        meals, kcal, protein, fat, carbs, days = summary
+        if not meals:
+            return f"Питание за {title}: проанализированных блюд пока нет\n\n"
+        average = round(kcal / days)
+        norm = f" (норма {daily_calories})" if daily_calories else ""
+        return (
+            f"Питание за {title}:\n"
+            f"Приемов пищи: {meals}, дней с записями: {days}\n"
+            f"Калории: {kcal} ккал, в среднем {average} ккал в день{norm}\n"
+            f"Б/Ж/У: {protein:g} / {fat:g} / {carbs:g} г\n\n"
+        )
+
+    @staticmethod
+    def format_trend(title, unit, trend):
+        """Средние за последние недели и изменение между первой и последней"""
+        if not trend:
+            return ""
+        averages = [average for _, _, average, _, _, _ in trend]
+        text = f"{title} по неделям (среднее): {' → '.join(f'{value:.1f}' for value in averages)} {unit}\n"
+        if len(averages) > 1:
+            # Недели без замеров сводок не имеют: срок считается по началам недель
+            weeks = (trend[-1][0] - trend[0][0]) // 604800 + 1
+            text += f"Изменение за {weeks} нед.: {averages[-1] - averages[0]:+.1f} {unit}\n"
+        return text + "\n"
+
     def register_handlers(self):
         """Регистрация обработчиков прогресса."""
         @self.bot.message_handler(func=lambda message: message.text == "📊 Мой прогресс")
@@ -1,14 +1,42 @@
 import os
+import sys
+from services.startup_profile import StartupTimer, profile_startup
+
+# --profile-startup без -X importtime: перезапуск себя под профилировщиком импорта
+if __name__ == "__main__" and '--profile-startup' in sys.argv and 'importtime' not in sys._xoptions:
+    sys.exit(profile_startup(os.path.abspath(__file__)))
+
+startup_timer = StartupTimer()
+
+import time
+import signal
 import logging
+import threading
 from dotenv import load_dotenv
 from telebot import TeleBot
-from database.db_manager import DatabaseManager
+from database.db_manager import DatabaseManager, BROADCAST_SEGMENTS
 from handlers.meal_analysis import MealAnalysisHandler
 from handlers.profile import ProfileHandler
 from handlers.progress import ProgressHandler
+from handlers.history import HistoryHandler
 from handlers.payment import PaymentHandler
+from services.broadcast import BroadcastService
+from services.reminders import ReminderScheduler
+from services.usage_ledger import UsageLedger
+from services.calorie_engine import recompute_all
+from services.state_storage import load_state_storage, CachedStateFilter
+from services.workers import make_worker_server
+from services.lifecycle import drain
+from services.http_session import install_telegram_session
+from services.health import Watchdog, HealthMonitor, make_health_server, dump_stacks
+from config.settings import (
+    TARIFF_PLANS, USD_TO_RUB, SHUTDOWN_DRAIN_TIMEOUT, SHUTDOWN_EXIT_TIMEOUT, HEALTH_HOST, HEALTH_PORT,
+    WATCHDOG_RESTART
+)
 from utils.keyboards import main_menu
 
+startup_timer.mark("импорт модулей")
+
 # Настройка путей и загрузка переменных окружения
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_PATH = os.path.join(BASE_DIR, '.env')
@@ -19,7 +47,7 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(os.path.join(BASE_DIR, 'bot.log')),
+        logging.FileHandler(os.getenv('BOT_LOG_PATH', os.path.join(BASE_DIR, 'bot.log'))),
         logging.StreamHandler()
     ]
 )
@@ -33,20 +61,41 @@ if not TELEGRAM_BOT_TOKEN:
     logger.critical("Telegram токен не найден в .env файле")
     exit(1)
 
-# Инициализация бота
-bot = TeleBot(TELEGRAM_BOT_TOKEN)
-
-# Инициализация базы данных
-db_path = os.path.join(BASE_DIR, "user_profiles.db")
+# Инициализация базы данных (схема создается в конструкторе, один раз)
+db_path = os.getenv('DATABASE_PATH', os.path.join(BASE_DIR, "user_profiles.db"))
 db_manager = DatabaseManager(db_path)
-db_manager.init_db()
+startup_timer.mark("база данных")
+
+# Все запросы к Telegram, включая скачивание фото, идут через общий пул keep-alive соединений
+telegram_session = install_telegram_session()
+
+# Инициализация бота: шаги диалогов хранятся вне процесса и переживают
+# перезапуск, состояние читается один раз на апдейт
+bot = TeleBot(TELEGRAM_BOT_TOKEN, state_storage=load_state_storage(db_manager))
+bot.add_custom_filter(CachedStateFilter(bot))
+
+# Журнал расхода токенов OpenAI
+usage_ledger = UsageLedger(db_manager)
+
+# Рассылки и напоминания делят один лимит отправки бота
+broadcast_service = BroadcastService(bot, db_manager)
+reminder_scheduler = ReminderScheduler(bot, db_manager, broadcast_service.rate_limiter)
 
 # Инициализация обработчиков
-meal_handler = MealAnalysisHandler(bot, db_manager)
-profile_handler = ProfileHandler(bot, db_manager)
+meal_handler = MealAnalysisHandler(bot, db_manager, usage_ledger)
+profile_handler = ProfileHandler(bot, db_manager, reminder_scheduler)
 progress_handler = ProgressHandler(bot, db_manager)
+history_handler = HistoryHandler(bot, db_manager)
 payment_handler = PaymentHandler(bot, db_manager)
 
+# Watchdog отмечает задачи обработчиков, анализы фото и цикл getUpdates;
+# /healthz и /readyz собирают его отчет, доступность базы и ошибки OpenAI
+watchdog = Watchdog()
+watchdog.watch_bot(bot)
+meal_handler.analyze_photo = watchdog.track(meal_handler.analyze_photo, "analyze_photo")
+health_monitor = HealthMonitor(db_manager, watchdog, meal_handler.openai_health)
+startup_timer.mark("бот и обработчики")
+
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
     """Обработчик команды /start"""
@@ -82,32 +131,260 @@ def send_stats(message):
     total_users = db_manager.get_total_users()
     total_generations = db_manager.get_total_generations()
     active_users = db_manager.get_active_users_last_week()
+    http_requests, http_connections, http_reused = telegram_session.stats()
+    admission = meal_handler.admission.stats()
+    charts = progress_handler.charts.stats()
+    reminders = reminder_scheduler.stats()
     
     stats_message = f"📊 Статистика бота:\n\n" \
                     f"👤 Всего пользователей: {total_users}\n" \
                     f"🏃 Активных пользователей за неделю: {active_users}\n" \
-                    f"🔢 Всего генераций: {total_generations}\n"
+                    f"🔢 Всего генераций: {total_generations}\n" \
+                    f"🌐 Запросов к Telegram: {http_requests}, соединений: {http_connections}, " \
+                    f"повторное использование: {http_reused:.0%}\n" \
+                    f"🚦 Анализов в работе: {admission['pending']}, принято: {admission['admitted']}, " \
+                    f"ожидание ~{admission['estimated_wait']:.0f} с\n" \
+                    f"🚫 Отклонено: перегрузка {admission['shed_overload']}, " \
+                    f"лимит на пользователя {admission['shed_per_user']}\n" \
+                    f"🔁 Повторов фото без второго анализа: {meal_handler.photo_flights.coalesced}\n" \
+                    f"📈 Графики: {charts['requests']}, из кэша {charts['hit_rate']:.0%}, " \
+                    f"отрисовок {charts['renders']} по {charts['render_avg'] * 1000:.0f} мс\n" \
+                    f"⏰ Напоминаний отправлено: {reminders['sent']}, пропущено: {reminders['skipped']}, " \
+                    f"ошибок: {reminders['failed']}\n"
+    
+    if meal_handler.hedge_policy:
+        hedging = meal_handler.hedge_policy.stats()
+        stats_message += f"🪃 Хеджирование OpenAI: {hedging['hedge_rate']:.1%} вызовов, " \
+                         f"второй запрос быстрее в {hedging['hedge_win_rate']:.0%}, " \
+                         f"p50 {hedging['p50']:.1f} с, p99 {hedging['p99']:.1f} с\n"
     
     bot.reply_to(message, stats_message)
 
+@bot.message_handler(commands=['broadcast'])
+def send_broadcast(message):
+    """Запуск рассылки: /broadcast [сегмент] текст"""
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "У вас нет прав для рассылки.")
+        return
+
+    parts = message.text.split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ''
+    segment = 'all'
+    first_word, _, rest = text.partition(' ')
+    if first_word in BROADCAST_SEGMENTS:
+        segment, text = first_word, rest.strip()
+
+    if not text:
+        bot.reply_to(
+            message,
+            "Использование: /broadcast [сегмент] текст\n"
+            f"Сегменты: {', '.join(BROADCAST_SEGMENTS)}"
+        )
+        return
+
+    broadcast_id = broadcast_service.start(text, segment)
+    bot.reply_to(message, f"📣 Рассылка {broadcast_id} запущена для сегмента {segment}")
+
+@bot.message_handler(commands=['costs'])
+def send_costs(message):
+    """Отчет о стоимости генераций в OpenAI"""
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "У вас нет прав для просмотра статистики.")
+        return
+
+    usage_ledger.flush()
+
+    def usd(micros):
+        return f"${(micros or 0) / 1_000_000:.4f}"
+
+    def per_generation(cost, analyses):
+        return usd(cost / analyses) if analyses else "—"
+
+    lines = ["💸 Расход OpenAI за 7 дней:\n"]
+    total_cost = total_analyses = 0
+    for day, requests, prompt, completion, cost, analyses, cached in db_manager.get_usage_by_day(7):
+        total_cost += cost or 0
+        total_analyses += analyses or 0
+        cached_share = (cached or 0) / prompt * 100 if prompt else 0
+        lines.append(f"{day}: {requests} запросов, {prompt}+{completion} токенов "
+                     f"({cached_share:.0f}% из кэша), {usd(cost)}, "
+                     f"{per_generation(cost, analyses)}/генерация")
+    lines.append(f"\nИтого: {usd(total_cost)}, в среднем {per_generation(total_cost, total_analyses)} за генерацию")
+
+    lines.append("\n📦 По тарифам за 30 дней:")
+    for plan, users, cost, analyses in db_manager.get_usage_by_plan(30):
+        revenue = ""
+        if plan in TARIFF_PLANS:
+            price = TARIFF_PLANS[plan]
+            revenue = f", выручка ${price['price'] / price['generations'] / USD_TO_RUB:.4f}/генерация"
+        lines.append(f"{plan or 'Без оплаты'}: {users} польз., {usd(cost)}, "
+                     f"{per_generation(cost, analyses)}/генерация{revenue}")
+
+    lines.append("\n👤 Самые затратные пользователи за 30 дней:")
+    for user_id, requests, cost, analyses in db_manager.get_usage_by_user(5, 30):
+        lines.append(f"{user_id}: {requests} запросов, {usd(cost)}")
+
+    bot.reply_to(message, "\n".join(lines))
+
+@bot.message_handler(commands=['recalc_calories'])
+def recalc_calories(message):
+    """Пересчет дневной нормы калорий всех пользователей после изменения формулы"""
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "У вас нет прав для пересчета.")
+        return
+
+    try:
+        updated = recompute_all(db_manager)
+        bot.reply_to(message, f"🔄 Норма калорий пересчитана для {updated} пользователей")
+    except Exception as e:
+        logger.error(f"Ошибка пересчета калорий: {e}")
+        bot.reply_to(message, "Ошибка пересчета калорий, подробности в логе.")
+
+@bot.message_handler(commands=['ledger'])
+def send_ledger(message):
+    """Сверка остатков генераций с книгой: /ledger или /ledger user_id"""
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "У вас нет прав для просмотра книги генераций.")
+        return
+
+    args = message.text.split()[1:]
+    if args:
+        user_id = int(args[0])
+        free_gens, paid_gens, used_gens = db_manager.get_balance(user_id)
+        lines = [f"📒 Пользователь {user_id}: бесплатных {free_gens}, оплаченных {paid_gens}, использовано {used_gens}"]
+        for created_at, kind, reference, account, amount in db_manager.get_ledger(user_id):
+            lines.append(f"{created_at} {kind} {account.rsplit(':', 1)[1]} {amount:+d} {reference or ''}")
+        bot.reply_to(message, "\n".join(lines))
+        return
+
+    mismatches = db_manager.find_balance_mismatches()
+    if not mismatches:
+        bot.reply_to(message, "✅ Остатки всех пользователей сходятся с книгой генераций")
+        return
+    lines = [f"⚠️ Расхождения у {len(mismatches)} пользователей (остаток / книга):"]
+    for user_id, free_gens, ledger_free, paid_gens, ledger_paid in mismatches[:20]:
+        lines.append(f"{user_id}: free {free_gens}/{ledger_free}, paid {paid_gens}/{ledger_paid}")
+    bot.reply_to(message, "\n".join(lines))
+
 def register_handlers():
     """Регистрация всех обработчиков сообщений"""
     try:
         meal_handler.register_handlers()
         profile_handler.register_handlers()
         progress_handler.register_handlers()
+        history_handler.register_handlers()
         payment_handler.register_handlers()
         logger.info("Все обработчики успешно зарегистрированы")
     except Exception as e:
         logger.error(f"Ошибка регистрации обработчиков: {e}")
 
+def shutdown(stop_receiving, receiver, acknowledge_updates=True):
+    """Остановка по SIGTERM: новые апдейты не принимаются, начатые анализы
+    дорабатывают до SHUTDOWN_DRAIN_TIMEOUT, буферы сбрасываются, база закрывается"""
+    started = time.monotonic()
+    health_monitor.stopping = True
+    logger.info("Получен сигнал остановки, новые апдейты не принимаются")
+    stop_receiving()
+    watchdog.stop_polling()
+    receiver.join(SHUTDOWN_DRAIN_TIMEOUT)
+
+    # Недособранные альбомы анализируются сразу, не дожидаясь окна
+    threading.Thread(target=meal_handler.media_groups.flush, daemon=True).start()
+    remaining_time = max(SHUTDOWN_DRAIN_TIMEOUT - (time.monotonic() - started), 0)
+    drained, abandoned = drain(meal_handler.in_flight, bot.worker_pool.tasks, remaining_time)
+
+    # Подтверждаем последние апдейты, чтобы Telegram не прислал их после перезапуска.
+    # Воркер апдейты не запрашивает, это делает роутер
+    if acknowledge_updates and bot.last_update_id:
+        try:
+            bot.get_updates(offset=bot.last_update_id + 1, limit=1, timeout=5, long_polling_timeout=0)
+        except Exception as e:
+            logger.error(f"Не удалось подтвердить апдейты: {e}")
+
+    broadcast_service.stop(timeout=5)
+    reminder_scheduler.stop(timeout=5)
+    watchdog.stop()
+    usage_ledger.close()
+    db_manager.close()
+
+    elapsed = time.monotonic() - started
+    if drained:
+        logger.info(f"Бот остановлен за {elapsed:.1f} с, завершено анализов: {meal_handler.in_flight.completed}")
+    else:
+        logger.error(f"Бот остановлен за {elapsed:.1f} с, не дождались {abandoned} анализов")
+
+def force_exit():
+    """Остановка зависла (например, close() ждет блокировку базы): выходим с ошибкой"""
+    logger.critical(f"Остановка не завершилась за {SHUTDOWN_EXIT_TIMEOUT} с\n{dump_stacks()}")
+    logging.shutdown()
+    os._exit(1)
+
 if __name__ == "__main__":
     try:
         # Регистрируем обработчики
         register_handlers()
+        startup_timer.mark("регистрация обработчиков")
+        if '--profile-startup' in sys.argv:
+            startup_timer.report()
+            sys.exit(0)
+
+        # Режим воркера: апдейты приходят от services.workers, а не из getUpdates
+        args = sys.argv[1:]
+        worker_port = int(args[args.index('--worker-port') + 1]) if '--worker-port' in args else None
+        worker_index = int(args[args.index('--worker-index') + 1]) if '--worker-index' in args else 0
+
+        # Продолжаем рассылки, прерванные перезапуском, и запускаем напоминания
+        # (один раз на все воркеры)
+        if worker_index == 0:
+            broadcast_service.resume_unfinished()
+            reminder_scheduler.start()
         
+        # Сигналы только будят главный поток, апдейты принимаются в фоновом
+        stop_requested = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.set())
+
+        # Зависший поток: стеки уже в логе, останавливаемся как по SIGTERM
+        # и выходим с ошибкой - скрипт запуска или роутер поднимут процесс заново
+        restart_requested = threading.Event()
+        if WATCHDOG_RESTART:
+            def restart_on_stall(stalled):
+                logger.critical("Перезапуск из-за зависших потоков")
+                restart_requested.set()
+                stop_requested.set()
+            watchdog.on_stall = restart_on_stall
+
         # Запускаем бота
-        logger.info("Бот запущен и ожидает сообщений...")
-        bot.polling(none_stop=True)
+        if worker_port:
+            server = make_worker_server(bot, worker_port, health=health_monitor)
+            receiver = threading.Thread(target=server.serve_forever, daemon=True)
+            stop_receiving = server.shutdown
+            logger.info(f"Воркер {worker_index} запущен")
+        else:
+            try:
+                health_server = make_health_server(health_monitor, HEALTH_PORT, HEALTH_HOST)
+                threading.Thread(target=health_server.serve_forever, name="health", daemon=True).start()
+            except OSError as e:
+                logger.error(f"Сервер проверок здоровья не запущен: {e}")
+            watchdog.start_polling()
+            receiver = threading.Thread(target=bot.polling, kwargs={'none_stop': True}, daemon=True)
+            stop_receiving = bot.stop_polling
+            logger.info("Бот запущен и ожидает сообщений...")
+        receiver.start()
+        health_monitor.set_receiver(receiver)
+        watchdog.start()
+
+        # Клиент OpenAI (и импорт openai) готовится в фоне, пока бот уже принимает апдейты
+        threading.Thread(target=lambda: meal_handler.client, name="openai-warmup", daemon=True).start()
+
+        stop_requested.wait()
+        exit_timer = threading.Timer(SHUTDOWN_EXIT_TIMEOUT, force_exit)
+        exit_timer.daemon = True
+        exit_timer.start()
+        shutdown(stop_receiving, receiver, acknowledge_updates=not worker_port)
+        if restart_requested.is_set():
+            # Зависший поток не даст интерпретатору завершиться штатно
+            logging.shutdown()
+            os._exit(1)
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
@@ -0,0 +1,112 @@
+# src/services/admission.py
+import math
+import queue
+import logging
+import threading
+from config.settings import (
+    ANALYSIS_CONCURRENCY, ADMISSION_MAX_WAIT, ADMISSION_PER_USER_LIMIT, ADMISSION_INITIAL_LATENCY
+)
+
+logger = logging.getLogger(__name__)
+
+SHED_OVERLOAD = 'overload'
+SHED_PER_USER = 'per_user'
+
+
+class AdmissionController:
+    """Допуск фото к анализу и очередь анализов.
+
+    Анализы выполняют concurrency потоков. Перед постановкой в очередь
+    ожидаемое время ответа оценивается по числу принятых анализов и
+    средней длительности последних; если оно больше max_wait или у
+    пользователя уже per_user_limit фото в работе, запрос отклоняется
+    сразу, до скачивания фото и списания генерации.
+    """
+
+    def __init__(self, in_flight, concurrency=ANALYSIS_CONCURRENCY, max_wait=ADMISSION_MAX_WAIT,
+                 per_user_limit=ADMISSION_PER_USER_LIMIT, initial_latency=ADMISSION_INITIAL_LATENCY,
+                 smoothing=0.2):
+        self.in_flight = in_flight
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.per_user_limit = per_user_limit
+        self.latency = initial_latency
+        self.smoothing = smoothing
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.per_user = {}
+        self.admitted = 0
+        self.shed = {SHED_OVERLOAD: 0, SHED_PER_USER: 0}
+        # Потоки-демоны: при остановке ждем анализы через drain, а не при выходе интерпретатора
+        self.workers = [
+            threading.Thread(target=self._work, name=f"analysis-{i}", daemon=True)
+            for i in range(concurrency)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def _estimate_wait(self, pending):
+        # Новый анализ начнется, когда освободится поток, и займет еще latency
+        return (pending // self.concurrency + 1) * self.latency
+
+    def estimate_wait(self):
+        """Ожидаемое время ответа на новое фото в секундах"""
+        with self.lock:
+            return self._estimate_wait(self.pending)
+
+    def submit(self, user_id, func, *args):
+        """Ставит анализ в очередь.
+
+        None, если принят; иначе (причина, через сколько секунд повторить).
+        """
+        with self.lock:
+            if self.per_user.get(user_id, 0) >= self.per_user_limit:
+                self.shed[SHED_PER_USER] += 1
+                return SHED_PER_USER, max(1, math.ceil(self.latency))
+            wait = self._estimate_wait(self.pending)
+            if wait > self.max_wait:
+                self.shed[SHED_OVERLOAD] += 1
+                logger.warning(f"Перегрузка: ожидание {wait:.0f} с, в работе {self.pending}, фото отклонено")
+                return SHED_OVERLOAD, max(1, math.ceil(wait - self.max_wait))
+            self.pending += 1
+            self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+            self.admitted += 1
+        self.in_flight.enter()
+        self.tasks.put((user_id, func, args))
+        return None
+
+    def observe(self, latency):
+        """Длительность завершенного анализа для оценки ожидания"""
+        with self.lock:
+            self.latency += self.smoothing * (latency - self.latency)
+
+    def _release(self, user_id):
+        with self.lock:
+            self.pending -= 1
+            remaining = self.per_user.pop(user_id) - 1
+            if remaining:
+                self.per_user[user_id] = remaining
+
+    def _work(self):
+        while True:
+            user_id, func, args = self.tasks.get()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Ошибка анализа пользователя {user_id}: {e}")
+            finally:
+                self._release(user_id)
+                self.in_flight.leave()
+
+    def stats(self):
+        """Метрики допуска для /stats"""
+        with self.lock:
+            return {
+                'pending': self.pending,
+                'admitted': self.admitted,
+                'shed_overload': self.shed[SHED_OVERLOAD],
+                'shed_per_user': self.shed[SHED_PER_USER],
+                'latency': self.latency,
+                'estimated_wait': self._estimate_wait(self.pending),
+            }
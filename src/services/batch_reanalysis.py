@@ -0,0 +1,299 @@
+# src/services/batch_reanalysis.py
+"""Офлайн-переанализ через OpenAI Batch API.
+
+Запросы строятся пачками по chunk_size: JSONL пишется во временный файл
+построчно, результаты читаются потоком и записываются пакетами, поэтому
+память не зависит от числа приемов пищи. Каждая пачка фиксируется в
+batch_chunks до загрузки файла и создания batch, и прерванное задание
+продолжается с того же места, не оплачивая пачку второй раз. Пачки,
+чей batch завершился со статусом failed, expired или cancelled,
+остаются неприменёнными: частичный результат expired и cancelled
+записывается сразу, а при --resume пачка отправляется заново целиком.
+
+Запуск из каталога src:
+    python -m services.batch_reanalysis                        # все приемы пищи из базы
+    python -m services.batch_reanalysis --resume JOB_ID
+    python -m services.batch_reanalysis --fixtures DIR --output results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import tempfile
+from handlers.meal_analysis import ANALYSIS_SYSTEM_PROMPT
+from services.meal_result import parse_model_analysis
+
+logger = logging.getLogger(__name__)
+
+BATCH_CHUNK_SIZE = 500
+RESULT_WRITE_SIZE = 200
+POLL_INTERVAL = 60
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+# Batch завершился без полного результата: пачку нужно отправить заново
+RETRY_STATUSES = ('failed', 'expired', 'cancelled')
+
+
+def build_request(custom_id, dish, base64_image, model="gpt-4o"):
+    """Строка JSONL для /v1/chat/completions с тем же промптом, что и в боте"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "max_tokens": 300,
+            "messages": [
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+                        {"type": "text", "text": f"Это блюдо '{dish}'"}
+                    ]
+                }
+            ]
+        }
+    }
+
+
+class MealSource:
+    """Приемы пищи из таблицы meals, фото скачиваются из Telegram по file_id"""
+
+    name = 'meals'
+
+    def __init__(self, db_manager, bot):
+        self.db_manager = db_manager
+        self.bot = bot
+
+    def page(self, after_key, limit):
+        """Список (ключ, блюдо, base64 первого фото) с ключом больше after_key"""
+        items = []
+        for meal_id, file_ids, dish in self.db_manager.get_meals_after(int(after_key or 0), limit):
+            try:
+                file_info = self.bot.get_file(file_ids.split()[0])
+                image = self.bot.download_file(file_info.file_path)
+            except Exception as e:
+                logger.error(f"Не удалось скачать фото приема пищи {meal_id}: {e}")
+                continue
+            items.append((str(meal_id), dish, base64.b64encode(image).decode('utf-8')))
+        return items
+
+    def save(self, results):
+        # Цифры из строки 'Итого' обновляются вместе с текстом; более уверенные
+        # цифры (справочник) и ответы без цифр база не перезаписывает
+        updated = self.db_manager.update_meal_analyses(
+            [(int(key), parse_model_analysis(None, text)) for key, text in results]
+        )
+        if updated < len(results):
+            logger.info(f"Переанализ: оставлено без изменений {len(results) - updated} из {len(results)} приемов пищи")
+
+
+class FixtureSource:
+    """Набор фикстур: DIR/<блюдо>/<фото>.jpg, результаты дописываются в JSONL-файл"""
+
+    def __init__(self, directory, output_path):
+        self.directory = directory
+        self.output_path = output_path
+        self.name = f"fixtures:{os.path.abspath(directory)}"
+
+    def page(self, after_key, limit):
+        """Следующие limit фото после after_key в порядке ключей.
+
+        Каталоги обходятся по порядку, и обход останавливается на limit фото:
+        полный список набора на каждой странице не строится. Каталог, все ключи
+        которого не больше after_key, пропускается без чтения.
+        """
+        items = []
+        # Сравнение с разделителем: порядок каталогов совпадает с порядком их ключей
+        prefixes = sorted(dish + os.sep for dish in os.listdir(self.directory)
+                          if os.path.isdir(os.path.join(self.directory, dish)))
+        for prefix in prefixes:
+            if after_key is not None and prefix < after_key and not after_key.startswith(prefix):
+                continue
+            for name in sorted(os.listdir(os.path.join(self.directory, prefix))):
+                key = prefix + name
+                if after_key is not None and key <= after_key:
+                    continue
+                with open(os.path.join(self.directory, key), 'rb') as image_file:
+                    items.append((key, prefix[:-1], base64.b64encode(image_file.read()).decode('utf-8')))
+                if len(items) >= limit:
+                    return items
+        return items
+
+    def save(self, results):
+        with open(self.output_path, 'a', encoding='utf-8') as output:
+            for key, text in results:
+                output.write(json.dumps({"path": key, "analysis": text}, ensure_ascii=False) + "\n")
+
+
+class BatchReanalysisJob:
+    """Задание переанализа: строит, отправляет, опрашивает и применяет пачки"""
+
+    def __init__(self, db_manager, client, source, chunk_size=BATCH_CHUNK_SIZE,
+                 poll_interval=POLL_INTERVAL, sleep=time.sleep):
+        self.db_manager = db_manager
+        self.client = client
+        self.source = source
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+
+    def run(self, job_id=None):
+        """Выполняет задание, возвращает его id.
+
+        Задание получает статус done, когда применены все пачки, иначе -
+        incomplete, и его нужно продолжить с --resume.
+        """
+        if job_id is None:
+            job_id = self.db_manager.create_batch_job(self.source.name)
+            logger.info(f"Создано задание переанализа {job_id} ({self.source.name})")
+
+        last_key = None
+        for chunk_id, first_key, chunk_last_key, requests, input_file_id, batch_id, status, applied in \
+                self.db_manager.get_batch_chunks(job_id):
+            if not applied:
+                self.resume_chunk(chunk_id, last_key, requests, input_file_id, batch_id, status)
+            last_key = chunk_last_key
+
+        while True:
+            items = self.source.page(last_key, self.chunk_size)
+            if not items:
+                break
+            last_key = items[-1][0]
+            chunk_id = self.db_manager.add_batch_chunk(job_id, items[0][0], last_key, len(items))
+            batch_id = self.submit(chunk_id, items)
+            logger.info(f"Задание {job_id}: пачка {chunk_id} ({len(items)} запросов) отправлена как {batch_id}")
+            self.finish_chunk(chunk_id, batch_id)
+
+        unapplied = [chunk[0] for chunk in self.db_manager.get_batch_chunks(job_id) if not chunk[-1]]
+        if unapplied:
+            self.db_manager.update_batch_job_status(job_id, 'incomplete')
+            logger.warning(f"Задание переанализа {job_id}: не применены пачки {unapplied}, "
+                           f"продолжите его с --resume {job_id}")
+        else:
+            self.db_manager.update_batch_job_status(job_id, 'done')
+            logger.info(f"Задание переанализа {job_id} завершено")
+        return job_id
+
+    def resume_chunk(self, chunk_id, after_key, requests, input_file_id, batch_id, status):
+        """Доводит до конца пачку прерванного задания; after_key - последний ключ предыдущей пачки"""
+        if batch_id and status not in RETRY_STATUSES:
+            self.finish_chunk(chunk_id, batch_id)
+            return
+        if input_file_id and status != 'failed':
+            # Файл уже загружен: batch мог быть создан перед падением, ищем его
+            batch_id = self.create_batch(chunk_id, input_file_id, look_up=status == 'uploaded')
+        else:
+            # Источник отдает ключи в стабильном порядке: пачка читается заново с того же места
+            items = self.source.page(after_key, requests)
+            if not items:
+                self.db_manager.update_batch_chunk(chunk_id, 'empty', 1)
+                return
+            batch_id = self.submit(chunk_id, items)
+        logger.info(f"Пачка {chunk_id} отправлена заново как {batch_id}")
+        self.finish_chunk(chunk_id, batch_id)
+
+    def submit(self, chunk_id, items):
+        """Пишет JSONL во временный файл, загружает его и создает batch"""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as jsonl:
+            for key, dish, base64_image in items:
+                jsonl.write(json.dumps(build_request(key, dish, base64_image), ensure_ascii=False) + "\n")
+            path = jsonl.name
+        try:
+            with open(path, 'rb') as jsonl:
+                input_file = self.client.files.create(file=jsonl, purpose='batch')
+        finally:
+            os.remove(path)
+        self.db_manager.set_batch_chunk_input(chunk_id, input_file.id)
+        return self.create_batch(chunk_id, input_file.id)
+
+    def create_batch(self, chunk_id, input_file_id, look_up=False):
+        """Создает batch из загруженного файла; с look_up сначала ищет уже созданный"""
+        batch_id = self.find_batch(input_file_id) if look_up else None
+        if batch_id is None:
+            batch_id = self.client.batches.create(
+                input_file_id=input_file_id,
+                endpoint='/v1/chat/completions',
+                completion_window='24h'
+            ).id
+        self.db_manager.set_batch_chunk_batch(chunk_id, batch_id)
+        return batch_id
+
+    def find_batch(self, input_file_id):
+        """Batch, созданный из input_file_id и не завершившийся неудачей, или None"""
+        for batch in self.client.batches.list(limit=100):
+            if batch.input_file_id == input_file_id and batch.status not in RETRY_STATUSES:
+                logger.info(f"Найден batch {batch.id}, созданный до перезапуска")
+                return batch.id
+        return None
+
+    def finish_chunk(self, chunk_id, batch_id):
+        """Ждет завершения batch и применяет его результаты"""
+        batch = self.client.batches.retrieve(batch_id)
+        while batch.status not in FINAL_STATUSES:
+            self.sleep(self.poll_interval)
+            batch = self.client.batches.retrieve(batch_id)
+
+        applied = 0
+        # У expired и cancelled бывает частичный результат - он тоже записывается
+        if batch.output_file_id:
+            applied = self.apply_results(batch.output_file_id)
+        if batch.status == 'completed':
+            self.db_manager.update_batch_chunk(chunk_id, batch.status, 1)
+        else:
+            logger.error(f"Batch {batch_id} завершился со статусом {batch.status}, "
+                         f"применено результатов: {applied}")
+            self.db_manager.update_batch_chunk(chunk_id, batch.status, 0)
+        return applied
+
+    def apply_results(self, output_file_id):
+        """Потоковое чтение выходного JSONL и пакетная запись результатов"""
+        applied = 0
+        buffer = []
+        with self.client.files.with_streaming_response.content(output_file_id) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                body = (result.get('response') or {}).get('body') or {}
+                if result.get('error') or not body.get('choices'):
+                    logger.error(f"Ошибка в результате {result.get('custom_id')}: {result.get('error')}")
+                    continue
+                buffer.append((result['custom_id'], body['choices'][0]['message']['content']))
+                if len(buffer) >= RESULT_WRITE_SIZE:
+                    self.source.save(buffer)
+                    applied += len(buffer)
+                    buffer = []
+        if buffer:
+            self.source.save(buffer)
+            applied += len(buffer)
+        return applied
+
+
+def main():
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    from telebot import TeleBot
+    from database.db_manager import DatabaseManager
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    load_dotenv(os.path.join(base_dir, '.env'))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    args = sys.argv[1:]
+    db_manager = DatabaseManager(os.path.join(base_dir, "user_profiles.db"))
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+    if '--fixtures' in args:
+        source = FixtureSource(args[args.index('--fixtures') + 1], args[args.index('--output') + 1])
+    else:
+        source = MealSource(db_manager, TeleBot(os.getenv('TELEGRAM_BOT_TOKEN')))
+
+    job_id = int(args[args.index('--resume') + 1]) if '--resume' in args else None
+    BatchReanalysisJob(db_manager, client, source).run(job_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# src/services/broadcast.py
+import logging
+import threading
+from telebot.apihelper import ApiTelegramException
+from services.rate_limiter import RateLimiter
+from config.settings import BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых писать пользователю бессмысленно (бот заблокирован, чат удален)
+UNDELIVERABLE_CODES = (400, 403)
+MAX_RETRIES = 5
+
+
+class BroadcastService:
+    """Массовая рассылка по сегменту пользователей с соблюдением лимитов Telegram.
+
+    Получатели читаются из users страницами по user_id, прогресс
+    сохраняется в broadcasts после каждой отправки, поэтому прерванная
+    рассылка продолжается с места остановки. Повторно сообщение может
+    получить только один пользователь - тот, кому его отправили прямо
+    перед падением, до записи прогресса.
+    """
+
+    def __init__(self, bot, db_manager, rate_limiter=None, page_size=BROADCAST_PAGE_SIZE):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.rate_limiter = rate_limiter or RateLimiter(BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE)
+        self.page_size = page_size
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self, text, segment='all'):
+        """Создает рассылку и запускает ее в фоновом потоке"""
+        broadcast_id = self.db_manager.create_broadcast(text, segment)
+        self.run_in_background(broadcast_id)
+        return broadcast_id
+
+    def run_in_background(self, broadcast_id):
+        thread = threading.Thread(target=self.run, args=(broadcast_id,), name=f"broadcast-{broadcast_id}", daemon=True)
+        thread.start()
+        self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+        return thread
+
+    def resume_unfinished(self):
+        """Продолжает рассылки, прерванные перезапуском"""
+        for broadcast_id in self.db_manager.get_unfinished_broadcasts():
+            logger.info(f"Возобновление рассылки {broadcast_id}")
+            self.run_in_background(broadcast_id)
+
+    def stop(self, timeout=None):
+        """Останавливает рассылки и ждет записи их прогресса"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def run(self, broadcast_id):
+        """Выполняет рассылку до конца сегмента, возвращает (sent, failed)"""
+        broadcast = self.db_manager.get_broadcast(broadcast_id)
+        if not broadcast:
+            logger.error(f"Рассылка {broadcast_id} не найдена")
+            return 0, 0
+
+        _, text, segment, status, last_user_id, sent, failed = broadcast
+        if status == 'done':
+            return sent, failed
+
+        logger.info(f"Рассылка {broadcast_id}: старт с user_id > {last_user_id}, отправлено {sent}")
+        while not self.stop_event.is_set():
+            recipients = self.db_manager.get_broadcast_recipients(segment, last_user_id, self.page_size)
+            if not recipients:
+                self.db_manager.update_broadcast_progress(broadcast_id, 'done', last_user_id, sent, failed)
+                logger.info(f"Рассылка {broadcast_id} завершена: отправлено {sent}, ошибок {failed}")
+                return sent, failed
+
+            for user_id in recipients:
+                if self.stop_event.is_set():
+                    break
+                if self.send(user_id, text):
+                    sent += 1
+                else:
+                    failed += 1
+                last_user_id = user_id
+                # Одна короткая запись на отправку: при лимите ~25 сообщений в секунду это дешево
+                self.db_manager.update_broadcast_progress(broadcast_id, 'running', last_user_id, sent, failed)
+
+        logger.info(f"Рассылка {broadcast_id} остановлена на user_id {last_user_id}")
+        return sent, failed
+
+    def send(self, chat_id, text):
+        """Отправка одного сообщения с повтором после 429"""
+        for _ in range(MAX_RETRIES):
+            self.rate_limiter.acquire(chat_id)
+            try:
+                self.bot.send_message(chat_id, text)
+                return True
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                    logger.warning(f"Flood limit при рассылке, пауза {retry_after} с")
+                    self.rate_limiter.backoff(retry_after)
+                    continue
+                if e.error_code in UNDELIVERABLE_CODES:
+                    return False
+                logger.error(f"Ошибка отправки рассылки пользователю {chat_id}: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Ошибка отправки рассылки пользователю {chat_id}: {e}")
+                return False
+        logger.error(f"Не удалось отправить рассылку пользователю {chat_id} после {MAX_RETRIES} попыток")
+        return False
@@ -0,0 +1,81 @@
+# src/services/calorie_engine.py
+"""Расчет дневной нормы калорий по формуле Миффлина-Сан Жеора.
+
+Единственный источник формулы и коэффициентов: скалярный расчет для
+одного пользователя и векторный на NumPy для пересчета всей базы.
+"""
+import logging
+from itertools import repeat
+
+logger = logging.getLogger(__name__)
+
+# Коэффициенты физической активности
+ACTIVITY_MULTIPLIERS = {
+    "Малоподвижный": 1.2,
+    "Умеренно активный": 1.375,
+    "Активный": 1.55,
+    "Очень активный": 1.725,
+    "Экстремально активный": 1.9
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.2
+
+# Дефицит или профицит калорий в зависимости от цели
+GOAL_ADJUSTMENTS = {
+    "Похудение": -500,
+    "Набор массы": 500,
+    "Поддержание веса": 0
+}
+
+# Константа формулы для мужчин (+5), для женщин было бы -161
+SEX_CONSTANT = 5
+
+RECOMPUTE_CHUNK_SIZE = 100000
+
+
+def calculate_daily_calories(weight, height, age, activity_level, goal):
+    """Дневная норма калорий для одного пользователя"""
+    bmr = 10 * weight + 6.25 * height - 5 * age + SEX_CONSTANT
+    maintenance = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, DEFAULT_ACTIVITY_MULTIPLIER)
+    return int(maintenance + GOAL_ADJUSTMENTS.get(goal, 0))
+
+
+def calculate_daily_calories_batch(weights, heights, ages, activity_levels, goals):
+    """Дневные нормы калорий для массивов профилей, возвращает int64-массив.
+
+    Результат совпадает с calculate_daily_calories поэлементно.
+    """
+    import numpy as np
+
+    weights = np.asarray(weights, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    ages = np.asarray(ages, dtype=np.float64)
+    # map(dict.get, ...) выполняется целиком на C, без генератора на Python
+    multipliers = np.fromiter(
+        map(ACTIVITY_MULTIPLIERS.get, activity_levels, repeat(DEFAULT_ACTIVITY_MULTIPLIER)),
+        dtype=np.float64,
+        count=len(weights)
+    )
+    adjustments = np.fromiter(
+        map(GOAL_ADJUSTMENTS.get, goals, repeat(0)),
+        dtype=np.float64,
+        count=len(weights)
+    )
+    bmr = 10 * weights + 6.25 * heights - 5 * ages + SEX_CONSTANT
+    # int() в скалярной версии отбрасывает дробную часть, trunc делает то же
+    return np.trunc(bmr * multipliers + adjustments).astype(np.int64)
+
+
+def recompute_all(db_manager, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """Пересчет daily_calories всех пользователей с заполненным профилем.
+
+    Профили читаются пачками по user_id, каждая пачка считается векторно
+    и записывается одним executemany. Возвращает число обновленных строк.
+    """
+    updated = 0
+    with db_manager.bulk_calories_update() as write:
+        for user_ids, ages, heights, weights, goals, activity_levels in db_manager.iter_complete_profiles(chunk_size):
+            calories = calculate_daily_calories_batch(weights, heights, ages, activity_levels, goals)
+            write(zip(calories.tolist(), user_ids))
+            updated += len(user_ids)
+    logger.info(f"Дневная норма калорий пересчитана для {updated} пользователей")
+    return updated
@@ -0,0 +1,149 @@
+# src/services/charts.py
+import io
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+# Цвета калорий и БЖУ на графиках
+KCAL_COLOR = "#f28e2b"
+NORM_COLOR = "#4e79a7"
+MACRO_COLORS = (("Белки", "#59a14f"), ("Жиры", "#edc948"), ("Углеводы", "#e15759"))
+
+_matplotlib_missing = False
+
+
+def fill_days(rows, first_day, days):
+    """Ряд за days суток начиная с first_day: пропущенные дни заполняются нулями"""
+    by_day = {row[0]: row for row in rows}
+    return [by_day.get(day, (day, 0, 0.0, 0.0, 0.0)) for day in range(first_day, first_day + days)]
+
+
+def data_version(series, daily_norm):
+    """Версия данных графика: хеш всех значений, которые на нем нарисованы"""
+    return hashlib.blake2b(repr((series, daily_norm)).encode(), digest_size=8).hexdigest()
+
+
+def render_intake_chart(series, daily_norm):
+    """PNG с калориями и БЖУ по дням; None, если matplotlib не установлен"""
+    global _matplotlib_missing
+    if _matplotlib_missing:
+        return None
+    try:
+        # Отрисовка нужна только при промахе кэша: не тянем matplotlib при старте
+        from matplotlib.figure import Figure
+    except ImportError as e:
+        # matplotlib есть в requirements.txt; без него ошибка пишется в лог один раз
+        _matplotlib_missing = True
+        logger.error(f"Графики прогресса отключены, нужен matplotlib: {e}")
+        return None
+
+    labels = []
+    for day, *_ in series:
+        date = datetime.fromtimestamp(day * 86400, timezone.utc)
+        labels.append(f"{WEEKDAYS[date.weekday()]}\n{date:%d.%m}")
+    positions = range(len(series))
+
+    # Figure без pyplot: нет глобального состояния, можно рисовать из разных потоков
+    figure = Figure(figsize=(7, 6), dpi=100)
+    calories, macros = figure.subplots(2, 1, sharex=True)
+    calories.bar(positions, [row[1] for row in series], color=KCAL_COLOR)
+    if daily_norm:
+        calories.axhline(daily_norm, color=NORM_COLOR, linestyle="--", label=f"Норма {daily_norm} ккал")
+        calories.legend(loc="upper left")
+    calories.set_title("Калории по дням")
+    calories.set_ylabel("ккал")
+
+    bottom = [0.0] * len(series)
+    for index, (name, color) in enumerate(MACRO_COLORS, start=2):
+        values = [row[index] for row in series]
+        macros.bar(positions, values, bottom=bottom, color=color, label=name)
+        bottom = [base + value for base, value in zip(bottom, values)]
+    macros.set_title("Белки, жиры и углеводы")
+    # Запас сверху, чтобы легенда не закрывала столбцы
+    macros.margins(y=0.25)
+    macros.set_ylabel("г")
+    macros.legend(loc="upper left", ncol=3)
+    macros.set_xticks(list(positions), labels)
+
+    # Поля заданы вручную: tight_layout рисует фигуру лишний раз и удваивает время
+    figure.subplots_adjust(left=0.11, right=0.97, top=0.94, bottom=0.1, hspace=0.25)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartService:
+    """Графики питания по дням с кэшем загруженных в Telegram картинок.
+
+    Версия графика - хеш суточных сводок и нормы. Если для (пользователь,
+    период, версия) уже есть file_id, фото отправляется по нему: без
+    отрисовки и без загрузки. Иначе график рисуется, отправляется файлом,
+    и file_id из ответа Telegram сохраняется в базе, общей для воркеров.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+        self.uploaded_bytes = 0
+
+    def send_intake_chart(self, bot, chat_id, user_id, days, daily_norm, caption=None):
+        """Отправляет график за последние days суток; False, если данных или matplotlib нет"""
+        today = int(time.time()) // 86400
+        first_day = today - days + 1
+        rows = self.db_manager.get_daily_intake(user_id, first_day * 86400)
+        if not rows:
+            return False
+
+        period = f"{days}d"
+        series = fill_days(rows, first_day, days)
+        version = data_version(series, daily_norm)
+        with self.lock:
+            self.requests += 1
+
+        file_id = self.db_manager.get_chart_file_id(user_id, period, version)
+        if file_id:
+            try:
+                bot.send_photo(chat_id, file_id, caption=caption)
+                with self.lock:
+                    self.hits += 1
+                return True
+            except ApiTelegramException as e:
+                # file_id мог стать недействительным: рисуем заново
+                logger.warning(f"Сохраненный график пользователя {user_id} не отправлен: {e}")
+                self.db_manager.delete_chart_file_id(user_id, period)
+
+        started = time.perf_counter()
+        image = render_intake_chart(series, daily_norm)
+        if image is None:
+            return False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.renders += 1
+            self.render_seconds += elapsed
+            self.uploaded_bytes += len(image)
+
+        sent = bot.send_photo(chat_id, image, caption=caption)
+        self.db_manager.save_chart_file_id(user_id, period, version, sent.photo[-1].file_id)
+        return True
+
+    def stats(self):
+        """Доля отправок из кэша, число отрисовок, их среднее время и загруженные байты"""
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hit_rate': self.hits / self.requests if self.requests else 0.0,
+                'renders': self.renders,
+                'render_avg': self.render_seconds / self.renders if self.renders else 0.0,
+                'uploaded_bytes': self.uploaded_bytes,
+            }
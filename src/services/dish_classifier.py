@@ -0,0 +1,103 @@
+# src/services/dish_classifier.py
+import io
+import os
+import logging
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from config.settings import DISH_CLASSIFIER_MODEL, DISH_CLASSIFIER_LABELS, DISH_CLASSIFIER_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+DishPrediction = namedtuple('DishPrediction', ['label', 'confidence'])
+
+# Нормализация ImageNet, на которой обучено большинство food-моделей
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class DishClassifier(ABC):
+    """Интерфейс локального определения блюда по фото"""
+
+    threshold = DISH_CLASSIFIER_THRESHOLD
+
+    @abstractmethod
+    def predict(self, image_bytes):
+        """Возвращает DishPrediction или None, если классификатор не уверен или недоступен"""
+
+    def confident(self, prediction):
+        return prediction is not None and prediction.confidence >= self.threshold
+
+
+class NullDishClassifier(DishClassifier):
+    """Заглушка: блюдо всегда определяется удаленной моделью"""
+
+    def predict(self, image_bytes):
+        return None
+
+
+class OnnxDishClassifier(DishClassifier):
+    """Классификатор на onnxruntime (CPU).
+
+    Модель принимает тензор NCHW float32 размера input_size и возвращает
+    логиты по классам из файла меток (одна метка на строку).
+    """
+
+    def __init__(self, model_path, labels_path, threshold=DISH_CLASSIFIER_THRESHOLD, input_size=224):
+        # Тяжелые зависимости нужны только при включенном классификаторе
+        import numpy as np
+        import onnxruntime as ort
+
+        self.np = np
+        self.threshold = threshold
+        self.input_size = input_size
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        with open(labels_path, encoding='utf-8') as labels_file:
+            self.labels = [line.strip() for line in labels_file if line.strip()]
+        classes = self.session.get_outputs()[0].shape[-1]
+        if isinstance(classes, int) and classes != len(self.labels):
+            raise ValueError(f"Модель возвращает {classes} классов, а в файле меток {len(self.labels)}")
+        self.mean = np.array(IMAGENET_MEAN, dtype=np.float32).reshape(3, 1, 1)
+        self.std = np.array(IMAGENET_STD, dtype=np.float32).reshape(3, 1, 1)
+        logger.info(f"Локальный классификатор блюд загружен: {len(self.labels)} классов")
+
+    def preprocess(self, image_bytes):
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_bytes))
+        # draft позволяет декодеру JPEG сразу уменьшить картинку
+        image.draft('RGB', (self.input_size * 2, self.input_size * 2))
+        image = image.convert('RGB').resize((self.input_size, self.input_size), Image.BILINEAR)
+        array = self.np.asarray(image, dtype=self.np.float32).transpose(2, 0, 1) / 255.0
+        return ((array - self.mean) / self.std)[self.np.newaxis]
+
+    def predict(self, image_bytes):
+        try:
+            logits = self.session.run(None, {self.input_name: self.preprocess(image_bytes)})[0][0]
+        except Exception as e:
+            logger.error(f"Ошибка локального определения блюда: {e}")
+            return None
+        exp = self.np.exp(logits - logits.max())
+        probabilities = exp / exp.sum()
+        index = int(probabilities.argmax())
+        return DishPrediction(self.labels[index], float(probabilities[index]))
+
+
+def load_dish_classifier():
+    """Классификатор из настроек или заглушка, если модель не настроена"""
+    if not DISH_CLASSIFIER_MODEL or not DISH_CLASSIFIER_LABELS:
+        return NullDishClassifier()
+    if not os.path.exists(DISH_CLASSIFIER_MODEL) or not os.path.exists(DISH_CLASSIFIER_LABELS):
+        logger.error(f"Файлы классификатора блюд не найдены: {DISH_CLASSIFIER_MODEL}, {DISH_CLASSIFIER_LABELS}")
+        return NullDishClassifier()
+    try:
+        return OnnxDishClassifier(DISH_CLASSIFIER_MODEL, DISH_CLASSIFIER_LABELS)
+    except ImportError as e:
+        logger.error(f"Для локального классификатора нужны onnxruntime, numpy и Pillow: {e}")
+        return NullDishClassifier()
+    except Exception as e:
+        # Поврежденная модель или метки от другой модели не должны мешать запуску бота
+        logger.error(f"Классификатор блюд не загружен, блюда определяет OpenAI: {e}")
+        return NullDishClassifier()
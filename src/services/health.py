@@ -0,0 +1,290 @@
+# src/services/health.py
+import sys
+import json
+import time
+import logging
+import threading
+import functools
+import traceback
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from config.settings import (
+    WATCHDOG_INTERVAL, WATCHDOG_STALL_TIMEOUT, POLL_STALL_TIMEOUT, WATCHDOG_RESTART,
+    OPENAI_FAILURE_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+
+def dump_stacks(highlight=()):
+    """Стеки всех потоков процесса; потоки из highlight помечаются как зависшие"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    parts = []
+    # Зависшие потоки - первыми
+    frames = sorted(sys._current_frames().items(), key=lambda item: item[0] not in highlight)
+    for ident, frame in frames:
+        mark = " [ЗАВИС]" if ident in highlight else ""
+        parts.append(f"--- {names.get(ident, '?')} ({ident}){mark}\n{''.join(traceback.format_stack(frame))}")
+    return "\n".join(parts)
+
+
+class CallHealth:
+    """Исход последних вызовов внешнего сервиса: ошибки подряд и время последнего успеха"""
+
+    def __init__(self, failure_threshold=OPENAI_FAILURE_THRESHOLD):
+        self.failure_threshold = failure_threshold
+        self.consecutive_failures = 0
+        self.last_success = None
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.last_success = time.monotonic()
+
+    def failure(self, error):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+
+    def report(self):
+        with self.lock:
+            return {
+                'state': 'failing' if self.consecutive_failures >= self.failure_threshold else 'ok',
+                'consecutive_failures': self.consecutive_failures,
+                'last_success_age': None if self.last_success is None
+                else round(time.monotonic() - self.last_success, 1),
+                'last_error': self.last_error,
+            }
+
+
+class Watchdog:
+    """Поиск зависших потоков внутри процесса.
+
+    Каждая задача обработчика бота и анализа фото отмечает, в каком
+    потоке и с какого момента она выполняется; цикл getUpdates отмечает
+    каждое возвращение. Раз в interval секунд проверяется, нет ли задачи
+    дольше stall_timeout или getUpdates дольше poll_timeout. Зависание
+    отличается от нагрузки: занятые потоки, у которых задачи сменяются,
+    не считаются зависшими. При первом обнаружении стеки всех потоков
+    пишутся в лог и вызывается on_stall - обычно перезапуск процесса.
+    """
+
+    def __init__(self, stall_timeout=WATCHDOG_STALL_TIMEOUT, poll_timeout=POLL_STALL_TIMEOUT,
+                 interval=WATCHDOG_INTERVAL, on_stall=None):
+        self.stall_timeout = stall_timeout
+        self.poll_timeout = poll_timeout
+        self.interval = interval
+        self.on_stall = on_stall
+        self.busy = {}
+        self.lock = threading.Lock()
+        self.poll_thread = None
+        self.last_poll = None
+        self.last_poll_error = None
+        self.last_update = None
+        self.reported = set()
+        self.stop_event = threading.Event()
+
+    def track(self, func, label=None):
+        """Обертка func: пока она выполняется, поток считается занятым этой задачей"""
+        label = label or getattr(func, '__qualname__', repr(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ident = threading.get_ident()
+            with self.lock:
+                previous = self.busy.get(ident)
+                self.busy[ident] = (label, time.monotonic())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    # Вложенные задачи в том же потоке восстанавливают внешнюю
+                    if previous is None:
+                        self.busy.pop(ident, None)
+                    else:
+                        self.busy[ident] = previous
+        return wrapper
+
+    def watch_bot(self, bot):
+        """Отслеживание задач пула обработчиков, цикла getUpdates и времени последнего апдейта"""
+        put = bot.worker_pool.put
+        bot.worker_pool.put = lambda task, *args, **kwargs: put(self.track(task), *args, **kwargs)
+
+        get_updates = bot.get_updates
+
+        def watched_get_updates(*args, **kwargs):
+            self.poll_thread = threading.get_ident()
+            try:
+                updates = get_updates(*args, **kwargs)
+                self.last_poll_error = None
+                return updates
+            except Exception as e:
+                # Сеть недоступна - цикл жив, просто ждет; перезапуск тут не поможет
+                self.last_poll_error = f"{type(e).__name__}: {e}"[:200]
+                raise
+            finally:
+                self.last_poll = time.monotonic()
+        bot.get_updates = watched_get_updates
+
+        process_new_updates = bot.process_new_updates
+
+        def watched_process(updates):
+            if updates:
+                self.last_update = time.monotonic()
+            return process_new_updates(updates)
+        bot.process_new_updates = watched_process
+
+    def start_polling(self):
+        """Цикл getUpdates запускается: отсчет его зависания идет с этого момента"""
+        self.last_poll = time.monotonic()
+
+    def stop_polling(self):
+        """Прием апдейтов остановлен: getUpdates больше не ждем"""
+        self.last_poll = None
+
+    def stalled(self, now=None):
+        """Зависшие потоки: [(ident, задача, секунд)]"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            stalled = [(ident, label, now - started) for ident, (label, started) in self.busy.items()
+                       if now - started > self.stall_timeout]
+        if self.last_poll is not None and now - self.last_poll > self.poll_timeout:
+            stalled.append((self.poll_thread, 'getUpdates', now - self.last_poll))
+        return stalled
+
+    def report(self):
+        now = time.monotonic()
+        with self.lock:
+            busy = len(self.busy)
+        return {
+            'busy_threads': busy,
+            'stalled': [{'task': label, 'seconds': round(seconds)} for _, label, seconds in self.stalled(now)],
+            'last_poll_age': None if self.last_poll is None else round(now - self.last_poll, 1),
+            'last_poll_error': self.last_poll_error,
+            'last_update_age': None if self.last_update is None else round(now - self.last_update, 1),
+        }
+
+    def check(self):
+        stalled = self.stalled()
+        fresh = [item for item in stalled if (item[0], item[1]) not in self.reported]
+        if not fresh:
+            return stalled
+        self.reported.update((ident, label) for ident, label, _ in fresh)
+        description = ", ".join(f"{label} {seconds:.0f} с" for _, label, seconds in fresh)
+        logger.critical(f"Зависшие потоки: {description}\n{dump_stacks({ident for ident, _, _ in fresh})}")
+        if self.on_stall:
+            self.on_stall(fresh)
+        return stalled
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Ошибка проверки зависаний: {e}")
+
+    def start(self):
+        threading.Thread(target=self.run, name="watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class HealthMonitor:
+    """Ответы /healthz (процесс жив) и /readyz (готов принимать апдейты).
+
+    /healthz - 503, если поток приема апдейтов завершился или watchdog
+    видит зависшие потоки: такой процесс нужно перезапускать. Во время
+    остановки /healthz отвечает 200: прием апдейтов закрыт намеренно, а
+    зависшую остановку завершает SHUTDOWN_EXIT_TIMEOUT. При выключенном
+    перезапуске (WATCHDOG_RESTART=0) зависание только отображается в теле
+    ответа со статусом 'stalled', а код остается 200, чтобы внешний
+    контроль тоже не перезапускал процесс. /readyz - 503 до
+    окончания запуска, во время остановки и если база недоступна.
+    Состояние OpenAI только отображается: без модели бот продолжает
+    работать с профилем, историей и оплатой.
+    """
+
+    def __init__(self, db_manager, watchdog, openai_health, restart_on_stall=WATCHDOG_RESTART):
+        self.db_manager = db_manager
+        self.restart_on_stall = restart_on_stall
+        self.watchdog = watchdog
+        self.openai_health = openai_health
+        self.receiver = None
+        self.ready = False
+        self.stopping = False
+        self.started = time.monotonic()
+
+    def set_receiver(self, receiver):
+        """Поток приема апдейтов запущен: процесс готов"""
+        self.receiver = receiver
+        self.ready = True
+
+    def liveness(self):
+        watchdog = self.watchdog.report()
+        receiver_alive = self.receiver is None or self.receiver.is_alive()
+        body = {
+            'status': 'ok',
+            'uptime': round(time.monotonic() - self.started),
+            'receiver_alive': receiver_alive,
+            **watchdog,
+            'openai': self.openai_health.report(),
+        }
+        if self.stopping:
+            body['status'] = 'stopping'
+            return True, body
+        if not receiver_alive:
+            body['status'] = 'unhealthy'
+            return False, body
+        if watchdog['stalled']:
+            body['status'] = 'unhealthy' if self.restart_on_stall else 'stalled'
+            return not self.restart_on_stall, body
+        return True, body
+
+    def readiness(self):
+        database = self.db_manager.ping()
+        ready = self.ready and not self.stopping and database
+        body = {
+            'status': 'ready' if ready else 'not_ready',
+            'started': self.ready,
+            'stopping': self.stopping,
+            'database': database,
+            'openai': self.openai_health.report()['state'],
+        }
+        return ready, body
+
+    def respond(self, path):
+        """(HTTP-статус, тело JSON) для пути проверки или None для чужого пути"""
+        checks = {'/healthz': self.liveness, '/readyz': self.readiness}
+        check = checks.get(path.split('?', 1)[0])
+        if check is None:
+            return None
+        ok, body = check()
+        return (200 if ok else 503), json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+def write_health_response(handler, monitor):
+    """Ответ на GET обработчика BaseHTTPRequestHandler: проверка здоровья или 404"""
+    response = monitor.respond(handler.path) if monitor else None
+    status, body = response or (404, b'')
+    handler.send_response(status)
+    handler.send_header('Content-Type', 'application/json')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def make_health_server(monitor, port, host):
+    """HTTP-сервер проверок здоровья для режима одного процесса"""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            write_health_response(self, monitor)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), HealthHandler)
+    logger.info(f"Проверки здоровья на http://{host}:{port}/healthz и /readyz")
+    return server
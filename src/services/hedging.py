@@ -0,0 +1,131 @@
+# src/services/hedging.py
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from config.settings import HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, fraction):
+    """Перцентиль по отсортированной копии, без интерполяции"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HedgePolicy:
+    """Хеджирование медленных запросов к модели.
+
+    Если запрос не вернулся за перцентиль percentile недавних задержек
+    запросов того же вида, отправляется второй такой же, и берется тот,
+    что ответит первым. Дополнительных запросов не больше budget от числа
+    вызовов. Прервать HTTP-запрос синхронного клиента OpenAI нельзя:
+    проигравший дорабатывает в фоне, его ответ отбрасывается и передается
+    в on_discard, чтобы расход попал в журнал.
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET,
+                 min_samples=HEDGE_MIN_SAMPLES, window=200):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.latencies = deque(maxlen=window)
+
+    def threshold(self, kind):
+        """Сколько секунд ждать ответа перед вторым запросом; None - пока не хеджируем"""
+        with self.lock:
+            samples = self.samples.get(kind)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            return percentile(samples, self.percentile)
+
+    def _observe(self, kind, latency):
+        with self.lock:
+            self.samples.setdefault(kind, deque(maxlen=self.window)).append(latency)
+
+    def _start(self, kind, func):
+        future = Future()
+
+        def run():
+            started = time.perf_counter()
+            try:
+                result = func()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self._observe(kind, time.perf_counter() - started)
+            future.set_result(result)
+
+        # Поток-демон: брошенный запрос не задерживает остановку бота
+        threading.Thread(target=run, name=f"hedge-{kind}", daemon=True).start()
+        return future
+
+    def _allow_hedge(self):
+        with self.lock:
+            if self.hedged + 1 > self.budget * self.calls:
+                return False
+            self.hedged += 1
+            return True
+
+    def call(self, kind, func, on_discard=None):
+        """Выполняет func() с хеджированием и возвращает первый успешный результат"""
+        started = time.perf_counter()
+        with self.lock:
+            self.calls += 1
+        threshold = self.threshold(kind)
+        primary = self._start(kind, func)
+        if threshold is None or wait([primary], timeout=threshold).done or not self._allow_hedge():
+            try:
+                return primary.result()
+            finally:
+                self._record(started)
+
+        logger.info(f"Запрос {kind} дольше {threshold:.2f} с, отправлен второй")
+        hedge = self._start(kind, func)
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = next((future for future in done if future.exception() is None), None)
+                if winner is not None or not pending:
+                    break
+            if winner is None:
+                # Оба запроса упали: пробрасываем ошибку основного
+                return primary.result()
+        finally:
+            self._record(started)
+
+        if winner is hedge:
+            with self.lock:
+                self.hedge_wins += 1
+        loser = primary if winner is hedge else hedge
+        if on_discard:
+            loser.add_done_callback(lambda future: future.exception() is None and on_discard(future.result()))
+        return winner.result()
+
+    def _record(self, started):
+        with self.lock:
+            self.latencies.append(time.perf_counter() - started)
+
+    def stats(self):
+        """Доля хеджированных вызовов, доля побед второго запроса и задержки вызовов"""
+        with self.lock:
+            latencies = list(self.latencies)
+            calls, hedged, wins = self.calls, self.hedged, self.hedge_wins
+        return {
+            'calls': calls,
+            'hedge_rate': hedged / calls if calls else 0.0,
+            'hedge_win_rate': wins / hedged if hedged else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+        }
@@ -0,0 +1,76 @@
+# src/services/http_session.py
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from telebot import apihelper
+from config.settings import (
+    TELEGRAM_POOL_SIZE, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT, TELEGRAM_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession(requests.Session):
+    """Общая keep-alive сессия для всех запросов бота к Telegram.
+
+    По умолчанию telebot держит отдельную сессию на каждый поток и
+    пересоздает ее каждые 10 минут, а файлы скачивает без таймаута.
+    Здесь один пул соединений на все потоки, таймауты на каждый запрос
+    и повтор при сбое соединения.
+    """
+
+    def __init__(self, pool_size=TELEGRAM_POOL_SIZE, connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+                 read_timeout=TELEGRAM_READ_TIMEOUT, retries=TELEGRAM_RETRIES):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        # Методы API telebot шлет GET-запросами, а с файлами - POST, поэтому
+        # для обоих повторяется только то, что Telegram точно не выполнил:
+        # неудачное подключение и 502/503 от балансировщика. Повтор после
+        # таймаута чтения или 504 мог бы отправить сообщение пользователю дважды
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            backoff_factor=0.3,
+            raise_on_status=False,
+            respect_retry_after_header=False
+        )
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+    def stats(self):
+        """(запросов, открыто соединений, доля запросов по уже открытому соединению)"""
+        requests_count = connections = 0
+        with self.lock:
+            pools = self.adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+        reused = 1 - connections / requests_count if requests_count else 0.0
+        return requests_count, connections, reused
+
+
+def install_telegram_session(**kwargs):
+    """Подключает PooledSession ко всем запросам telebot, включая download_file"""
+    session = PooledSession(**kwargs)
+    apihelper.session = session
+    # None - telebot не пересоздает сессию по времени
+    apihelper.SESSION_TIME_TO_LIVE = None
+    apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT = session.timeout
+    logger.info(f"HTTP-сессия Telegram: пул {session.pool_size}, таймауты {session.timeout}")
+    return session
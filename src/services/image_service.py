@@ -45,4 +45,25 @@ class ImageService:
                 os.remove(file_path)
                 logger.info("Временный файл удален")
         except Exception as e:
-            logger.error(f"Ошибка удаления файла: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка удаления файла: {e}")
+
+    @staticmethod
+    def jpeg_size(data):
+        """Размеры JPEG (ширина, высота) из маркера SOF без декодирования, None если не найден"""
+        index = 2
+        length = len(data)
+        while index + 9 < length:
+            if data[index] != 0xFF:
+                index += 1
+                continue
+            marker = data[index + 1]
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height = int.from_bytes(data[index + 5:index + 7], 'big')
+                width = int.from_bytes(data[index + 7:index + 9], 'big')
+                return width, height
+            if marker == 0xFF:
+                index += 1
+                continue
+            segment_length = int.from_bytes(data[index + 2:index + 4], 'big')
+            index += 2 + segment_length
+        return None
@@ -0,0 +1,74 @@
+# src/services/lifecycle.py
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class InFlight:
+    """Счетчик выполняющихся операций, которые нужно дождаться при остановке"""
+
+    def __init__(self):
+        self.count = 0
+        self.completed = 0
+        self.condition = threading.Condition()
+
+    def enter(self):
+        with self.condition:
+            self.count += 1
+
+    def leave(self):
+        with self.condition:
+            self.count -= 1
+            self.completed += 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def track(self):
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def wait_idle(self, timeout):
+        """Ждет, пока счетчик не обнулится; False, если не успели за timeout"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+
+def tracked(method):
+    """Декоратор метода обработчика: вызов учитывается в self.in_flight"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.in_flight.track():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def drain(in_flight, task_queue, timeout, poll_interval=0.1):
+    """Ждет завершения начатых операций и разбора очереди задач бота.
+
+    Возвращает (успели ли, сколько операций осталось незавершенными).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        # Задача могла уже выйти из очереди, но еще не войти в track():
+        # пустую очередь и нулевой счетчик проверяем дважды
+        if task_queue.empty() and in_flight.wait_idle(max(remaining, 0)):
+            time.sleep(poll_interval)
+            if task_queue.empty() and in_flight.count == 0:
+                return True, 0
+        if time.monotonic() >= deadline:
+            return False, in_flight.count + task_queue.qsize()
+        time.sleep(poll_interval)
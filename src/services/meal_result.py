@@ -0,0 +1,69 @@
+# src/services/meal_result.py
+import re
+from collections import namedtuple
+
+# Уверенность в цифрах: справочник с весом порции от модели или целиком оценка модели
+CONFIDENCE_REFERENCE = 0.9
+CONFIDENCE_MODEL = 0.6
+
+# Служебная строка ответа модели с оценкой порции, калорий и БЖУ
+NUTRITION_LINE_FORMAT = "'Итого: <вес> г, <калории> ккал, Б <г>, Ж <г>, У <г>'"
+
+_NUMBER = r'(\d+(?:[.,]\d+)?)'
+NUTRITION_LINE_PATTERN = re.compile(
+    rf'^\W*Итого\W*{_NUMBER}\s*г\W+{_NUMBER}\s*ккал\W+Б\W*{_NUMBER}\s*г?\W+Ж\W*{_NUMBER}\s*г?\W+У\W*{_NUMBER}\s*г?\W*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+class MealResult(namedtuple('MealResult', [
+        'dish', 'portion_g', 'kcal', 'protein_g', 'fat_g', 'carbs_g', 'confidence', 'text'])):
+    """Результат анализа приема пищи: цифры для базы и текст ответа.
+
+    Цифры None, если модель их не дала и блюда нет в справочнике.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_facts(cls, dish, facts, portion_g, confidence, text):
+        return cls(dish, portion_g, facts.kcal, facts.protein, facts.fat, facts.carbs, confidence, text)
+
+    @classmethod
+    def text_only(cls, dish, text):
+        return cls(dish, None, None, None, None, None, 0.0, text)
+
+    def columns(self):
+        """(portion_g, kcal, protein_dg, fat_dg, carbs_dg, confidence) для таблицы meals.
+
+        Все значения - целые: граммы БЖУ в десятых долях, уверенность в процентах.
+        """
+        def scaled(value, factor=1):
+            return None if value is None else round(value * factor)
+        return (
+            scaled(self.portion_g),
+            scaled(self.kcal),
+            scaled(self.protein_g, 10),
+            scaled(self.fat_g, 10),
+            scaled(self.carbs_g, 10),
+            scaled(self.confidence, 100)
+        )
+
+
+def render_nutrition(kcal, protein, fat, carbs, grams):
+    """Блок калорийности и БЖУ для ответа"""
+    return (
+        f"🔥 *Калорийность:* {kcal:g} ккал на {grams:g} г\n"
+        f"💪 Белки: {protein:g} г | Жиры: {fat:g} г | Углеводы: {carbs:g} г"
+    )
+
+
+def parse_model_analysis(dish, text):
+    """MealResult из ответа модели со строкой 'Итого'; без нее цифры не заполняются"""
+    match = NUTRITION_LINE_PATTERN.search(text)
+    if not match:
+        return MealResult.text_only(dish, text)
+
+    portion, kcal, protein, fat, carbs = (float(value.replace(',', '.')) for value in match.groups())
+    commentary = (text[:match.start()] + text[match.end():]).strip()
+    rendered = f"{render_nutrition(kcal, protein, fat, carbs, portion)}\n\n{commentary}"
+    return MealResult(dish, portion, kcal, protein, fat, carbs, CONFIDENCE_MODEL, rendered)
@@ -0,0 +1,61 @@
+# src/services/media_group.py
+import logging
+import threading
+from config.settings import MEDIA_GROUP_WINDOW
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGroupCollector:
+    """Собирает фото одного альбома Telegram в одну пачку.
+
+    Каждое фото альбома приходит отдельным апдейтом с общим media_group_id.
+    Сообщения копятся, пока в течение window секунд не придет новое фото
+    этой группы, после чего on_complete получает весь список разом.
+    """
+
+    def __init__(self, on_complete, window=MEDIA_GROUP_WINDOW):
+        self.on_complete = on_complete
+        self.window = window
+        self.groups = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def add(self, message):
+        """Кладет сообщение в буфер альбома. False, если сообщение не из альбома"""
+        group_id = getattr(message, 'media_group_id', None)
+        if not group_id:
+            return False
+
+        with self.lock:
+            self.groups.setdefault(group_id, []).append(message)
+            timer = self.timers.get(group_id)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(self.window, self._complete, args=(group_id,))
+            timer.daemon = True
+            self.timers[group_id] = timer
+            timer.start()
+        return True
+
+    def _complete(self, group_id):
+        with self.lock:
+            messages = self.groups.pop(group_id, [])
+            self.timers.pop(group_id, None)
+        if not messages:
+            return
+        messages.sort(key=lambda message: message.message_id)
+        logger.info(f"Альбом {group_id} собран: {len(messages)} фото")
+        try:
+            self.on_complete(messages)
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {group_id}: {e}")
+
+    def flush(self):
+        """Немедленно отдает все недособранные альбомы"""
+        with self.lock:
+            group_ids = list(self.groups)
+            for timer in self.timers.values():
+                timer.cancel()
+        for group_id in group_ids:
+            self._complete(group_id)
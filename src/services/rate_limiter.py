@@ -0,0 +1,87 @@
+# src/services/rate_limiter.py
+import time
+import threading
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now=None):
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления"""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def drain(self, seconds, now=None):
+        """Обнуляет бакет так, чтобы первый токен появился через seconds"""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """Ограничитель отправки: общий лимит бота и отдельный лимит на каждый чат.
+
+    Telegram допускает около 30 сообщений в секунду на бота и не больше
+    одного сообщения в секунду в один чат, при превышении отвечает 429
+    с параметром retry_after.
+    """
+
+    def __init__(self, global_rate=25, per_chat_rate=1, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.per_chat_rate = per_chat_rate
+        # Емкость 1 равномерно распределяет отправки: в любом окне в секунду
+        # их не больше global_rate + 1, без всплеска в начале
+        self.global_bucket = TokenBucket(global_rate, capacity=1, clock=clock)
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+        self._last_prune = clock()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1, clock=self.clock)
+        if now - self._last_prune > 60:
+            self._prune(now)
+        return bucket
+
+    def _prune(self, now):
+        # Полные бакеты ничем не отличаются от новых, их можно забыть
+        idle = [chat_id for chat_id, bucket in self.chat_buckets.items()
+                if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity]
+        for chat_id in idle:
+            del self.chat_buckets[chat_id]
+        self._last_prune = now
+
+    def acquire(self, chat_id):
+        """Блокирует поток, пока отправка в chat_id не уложится в оба лимита"""
+        with self.lock:
+            now = self.clock()
+            wait = max(self.global_bucket.reserve(now), self._chat_bucket(chat_id, now).reserve(now))
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def backoff(self, retry_after, chat_id=None):
+        """Учитывает retry_after из ответа 429: глобально или для одного чата"""
+        with self.lock:
+            now = self.clock()
+            if chat_id is None:
+                self.global_bucket.drain(retry_after, now)
+            else:
+                self._chat_bucket(chat_id, now).drain(retry_after, now)
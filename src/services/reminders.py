@@ -0,0 +1,223 @@
+# src/services/reminders.py
+import time
+import heapq
+import logging
+import threading
+from telebot.apihelper import ApiTelegramException
+from services.rate_limiter import RateLimiter
+from services.broadcast import UNDELIVERABLE_CODES, MAX_RETRIES
+from config.settings import (
+    REMINDER_UTC_OFFSET, REMINDER_HORIZON, REMINDER_GRACE, REMINDER_BATCH_SIZE,
+    BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE
+)
+
+logger = logging.getLogger(__name__)
+
+# Виды напоминаний: поесть по расписанию и "за сегодня нет ни одного блюда"
+KIND_MEAL = 'meal'
+KIND_NUDGE = 'nudge'
+
+REMINDER_TEXTS = {
+    KIND_MEAL: "🍽️ Время поесть! Пришлите фото блюда - посчитаю калории и БЖУ.",
+    KIND_NUDGE: "📸 Сегодня в дневнике еще нет ни одного блюда. Что было на тарелке?",
+}
+
+
+def parse_times(times):
+    """'09:00,13:00' -> минуты от местной полуночи по возрастанию"""
+    minutes = []
+    for value in times.split(','):
+        hours, _, mins = value.strip().partition(':')
+        minutes.append(int(hours) * 60 + int(mins or 0))
+    return sorted(minutes)
+
+
+def local_midnight(timestamp, utc_offset=REMINDER_UTC_OFFSET):
+    """Unix-время начала местных суток, в которые попадает timestamp"""
+    offset = utc_offset * 3600
+    return (timestamp + offset) // 86400 * 86400 - offset
+
+
+def next_due(times, after, utc_offset=REMINDER_UTC_OFFSET):
+    """Ближайшее время из расписания times строго позже unix-времени after"""
+    midnight = local_midnight(after, utc_offset)
+    minutes = parse_times(times)
+    for day in (0, 1):
+        for minute in minutes:
+            due = midnight + day * 86400 + minute * 60
+            if due > after:
+                return due
+
+
+class ReminderScheduler:
+    """Напоминания пользователям по расписанию из таблицы reminders.
+
+    В памяти - куча только тех напоминаний, что наступят в ближайшие
+    horizon секунд; окно перечитывается из индекса по due_at, когда
+    заканчивается. Поток спит до первого напоминания в куче или до конца
+    окна и просыпается только ради наступивших. Наступившие берутся
+    пачкой: в одной транзакции их due_at переносится на следующее время
+    (только если не изменился), и лишь затем сообщения отправляются через
+    RateLimiter. Поэтому после перезапуска напоминание не повторяется;
+    пачка, прерванная остановкой, теряется, а не дублируется.
+
+    Напоминания, просроченные больше чем на grace секунд, не отправляются.
+    Запускать нужно в одном процессе; schedule() можно звать из любого -
+    изменения из других процессов подхватываются при перечитывании окна.
+    """
+
+    def __init__(self, bot, db_manager, rate_limiter=None, horizon=REMINDER_HORIZON,
+                 grace=REMINDER_GRACE, batch_size=REMINDER_BATCH_SIZE, clock=time.time):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.rate_limiter = rate_limiter or RateLimiter(BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE)
+        self.horizon = horizon
+        self.grace = grace
+        self.batch_size = batch_size
+        self.clock = clock
+        self.heap = []
+        self.loaded_until = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.wakeups = 0
+        self.refills = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def schedule(self, user_id, kind, times):
+        """Сохраняет расписание пользователя; times None выключает напоминания этого вида"""
+        due_at = next_due(times, int(self.clock())) if times else None
+        self.db_manager.set_reminder(user_id, kind, times, due_at)
+        if due_at is not None:
+            self._push(due_at, user_id, kind)
+        return due_at
+
+    def _push(self, due_at, user_id, kind):
+        with self.condition:
+            # Позже окна - прочитается из базы вместе со следующим окном
+            if due_at >= self.loaded_until:
+                return
+            heapq.heappush(self.heap, (due_at, user_id, kind))
+            if self.heap[0][0] == due_at:
+                self.condition.notify()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="reminders", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self, timeout=None):
+        """Останавливает планировщик после текущей отправки"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        logger.info("Планировщик напоминаний запущен")
+        while True:
+            batch = self._wait_due()
+            if batch is None:
+                return
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error(f"Ошибка отправки напоминаний: {e}")
+
+    def _refill(self, now):
+        # Строки отсортированы по due_at, отсортированный список - готовая куча.
+        # Устаревшие записи не страшны: перенос в базе проверяет due_at.
+        # Вид заменяется общей строкой-константой вместо копии на каждую запись
+        kinds = {KIND_MEAL: KIND_MEAL, KIND_NUDGE: KIND_NUDGE}
+        self.heap = [(due_at, user_id, kinds.get(kind, kind))
+                     for due_at, user_id, kind in self.db_manager.get_due_reminders(now + self.horizon)]
+        self.loaded_until = now + self.horizon
+        self.refills += 1
+
+    def _wait_due(self):
+        """Ждет наступления напоминаний и возвращает их пачку; None после stop()"""
+        with self.condition:
+            while not self.stopped:
+                now = self.clock()
+                if now >= self.loaded_until:
+                    self._refill(now)
+                    continue
+                if self.heap and self.heap[0][0] <= now:
+                    batch = []
+                    while self.heap and self.heap[0][0] <= now and len(batch) < self.batch_size:
+                        batch.append(heapq.heappop(self.heap))
+                    return batch
+                wake_at = min(self.heap[0][0], self.loaded_until) if self.heap else self.loaded_until
+                self.condition.wait(wake_at - now)
+                self.wakeups += 1
+        return None
+
+    def _process(self, batch):
+        now = int(self.clock())
+        current = self.db_manager.get_reminders({(user_id, kind) for _, user_id, kind in batch})
+        moves = []
+        for (user_id, kind), (times, due_at) in current.items():
+            if due_at <= now:
+                moves.append((next_due(times, now), user_id, kind, due_at))
+        claimed = set(self.db_manager.advance_reminders(moves))
+
+        due = []
+        for next_at, user_id, kind, due_at in moves:
+            if (user_id, kind) not in claimed:
+                continue
+            self._push(next_at, user_id, kind)
+            if now - due_at > self.grace:
+                self.skipped += 1
+            else:
+                due.append((user_id, kind))
+
+        # "Нет блюд за сегодня" не отправляется тем, кто уже что-то сохранил
+        nudged = [user_id for user_id, kind in due if kind == KIND_NUDGE]
+        logged = self.db_manager.get_users_with_meals_since(nudged, local_midnight(now))
+        for user_id, kind in due:
+            if kind == KIND_NUDGE and user_id in logged:
+                self.skipped += 1
+            elif self.send(user_id, REMINDER_TEXTS[kind]):
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def send(self, chat_id, text):
+        """Отправка одного напоминания с повтором после 429"""
+        for _ in range(MAX_RETRIES):
+            self.rate_limiter.acquire(chat_id)
+            try:
+                self.bot.send_message(chat_id, text)
+                return True
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                    logger.warning(f"Flood limit при напоминаниях, пауза {retry_after} с")
+                    self.rate_limiter.backoff(retry_after)
+                    continue
+                if e.error_code in UNDELIVERABLE_CODES:
+                    # Бот заблокирован или чат удален: напоминания больше не нужны
+                    self.db_manager.delete_reminders(chat_id)
+                    return False
+                logger.error(f"Ошибка отправки напоминания пользователю {chat_id}: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Ошибка отправки напоминания пользователю {chat_id}: {e}")
+                return False
+        logger.error(f"Не удалось отправить напоминание пользователю {chat_id} после {MAX_RETRIES} попыток")
+        return False
+
+    def stats(self):
+        """Счетчики пробуждений, чтений окна и отправок"""
+        with self.condition:
+            return {
+                'scheduled': len(self.heap),
+                'wakeups': self.wakeups,
+                'refills': self.refills,
+                'sent': self.sent,
+                'failed': self.failed,
+                'skipped': self.skipped,
+            }
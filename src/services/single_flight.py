@@ -0,0 +1,37 @@
+# src/services/single_flight.py
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных операций.
+
+    Первый вызов с ключом становится ведущим и выполняет работу, повторы
+    с тем же ключом до ее окончания получают тот же Future и результат
+    ведущего. После finish ключ освобождается.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def begin(self, key):
+        """(future, ведущий ли вызов)"""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self.calls[key] = Future()
+            return future, True
+
+    def finish(self, key, result=None):
+        """Завершает операцию ведущего: ожидающие получают result"""
+        with self.lock:
+            future = self.calls.pop(key)
+        future.set_result(result)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.calls)
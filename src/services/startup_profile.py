@@ -0,0 +1,80 @@
+# src/services/startup_profile.py
+"""Профиль холодного старта: python src/main.py --profile-startup
+
+Бот перезапускается под python -X importtime, проходит весь запуск до
+готовности принимать апдейты и выходит, не подключаясь к Telegram.
+Печатается время этапов запуска и самые долгие импорты.
+"""
+import sys
+import json
+import time
+import subprocess
+
+PROFILE_MARKER = 'STARTUP_PROFILE '
+
+
+class StartupTimer:
+    """Отметки этапов запуска внутри main.py"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        """Строка для родительского процесса с длительностями этапов"""
+        print(PROFILE_MARKER + json.dumps(self.phases), flush=True)
+
+
+def parse_importtime(stderr):
+    """Импорты верхнего уровня из вывода -X importtime: [(cumulative_us, name)]"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Вложенные импорты выводятся с отступом, они уже учтены в cumulative родителя
+        if not name.startswith('  '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+
+def run_startup(main_path, env=None, cwd=None):
+    """Запускает main.py --profile-startup под -X importtime.
+
+    Возвращает (время до готовности в секундах, этапы, импорты).
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', main_path, '--profile-startup'],
+        capture_output=True, text=True, env=env, cwd=cwd
+    )
+    elapsed = time.perf_counter() - started
+    phases = None
+    for line in result.stdout.splitlines():
+        if line.startswith(PROFILE_MARKER):
+            phases = json.loads(line[len(PROFILE_MARKER):])
+    if phases is None:
+        raise RuntimeError(f"Бот не дошел до готовности (код {result.returncode}):\n{result.stderr[-2000:]}")
+    return elapsed, phases, parse_importtime(result.stderr)
+
+
+def print_report(elapsed, phases, imports, top=15):
+    print(f"Холодный старт до готовности: {elapsed:.3f} с (включая запуск интерпретатора)")
+    print("\nЭтапы main.py:")
+    for name, seconds in phases:
+        print(f"  {name:<24} {seconds * 1000:8.1f} мс")
+    print(f"\nСамые долгие импорты верхнего уровня:")
+    for cumulative, name in imports[:top]:
+        print(f"  {name:<40} {cumulative / 1000:8.1f} мс")
+
+
+def profile_startup(main_path):
+    elapsed, phases, imports = run_startup(main_path)
+    print_report(elapsed, phases, imports)
+    return 0
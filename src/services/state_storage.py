@@ -0,0 +1,125 @@
+# src/services/state_storage.py
+"""Хранилища состояния диалогов для TeleBot(state_storage=...).
+
+Шаг диалога и его данные живут вне процесса, поэтому пользователя может
+обслужить любой воркер, а перезапуск не теряет начатый ввод. Каждая
+запись живет CONVERSATION_STATE_TTL секунд с последнего изменения:
+брошенный на полпути шаг не перехватит сообщение через неделю.
+"""
+import json
+import logging
+from telebot import custom_filters, types
+from telebot.storage import StateStorageBase, StateContext, StateRedisStorage
+from config.settings import STATE_STORAGE, REDIS_URL, CONVERSATION_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class StateSQLiteStorage(StateStorageBase):
+    """Состояния в таблице conversation_state базы бота"""
+
+    def __init__(self, db_manager, ttl=CONVERSATION_STATE_TTL):
+        super().__init__()
+        self.db_manager = db_manager
+        self.ttl = ttl
+
+    def _load(self, chat_id, user_id):
+        row = self.db_manager.get_conversation(chat_id, user_id)
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _store(self, chat_id, user_id, state, data):
+        self.db_manager.save_conversation(
+            chat_id, user_id, state, json.dumps(data, ensure_ascii=False), self.ttl
+        )
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+        with self.db_manager.lock:
+            _, data = self._load(chat_id, user_id)
+            self._store(chat_id, user_id, state, data)
+        return True
+
+    def get_state(self, chat_id, user_id):
+        return self._load(chat_id, user_id)[0]
+
+    def delete_state(self, chat_id, user_id):
+        return self.db_manager.delete_conversation(chat_id, user_id)
+
+    def get_data(self, chat_id, user_id):
+        return self._load(chat_id, user_id)[1]
+
+    def set_data(self, chat_id, user_id, key, value):
+        with self.db_manager.lock:
+            state, data = self._load(chat_id, user_id)
+            data[key] = value
+            self._store(chat_id, user_id, state, data)
+        return True
+
+    def reset_data(self, chat_id, user_id):
+        with self.db_manager.lock:
+            state, _ = self._load(chat_id, user_id)
+            self._store(chat_id, user_id, state, {})
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        with self.db_manager.lock:
+            state, _ = self._load(chat_id, user_id)
+            self._store(chat_id, user_id, state, data)
+        return True
+
+
+class StateRedisTTLStorage(StateRedisStorage):
+    """StateRedisStorage, у которого каждая запись истекает через ttl секунд"""
+
+    def __init__(self, redis_url, ttl=CONVERSATION_STATE_TTL):
+        super().__init__(redis_url=redis_url)
+        self.ttl = ttl
+
+    def set_record(self, key, value):
+        from redis import Redis
+
+        connection = Redis(connection_pool=self.redis)
+        connection.set(self.prefix + str(key), json.dumps(value), ex=self.ttl)
+        connection.close()
+        return True
+
+
+class CachedStateFilter(custom_filters.StateFilter):
+    """StateFilter, читающий состояние из хранилища один раз на апдейт.
+
+    Штатный фильтр обращается к хранилищу в каждом обработчике с state=,
+    то есть по разу на каждый такой обработчик для любого текста.
+    """
+
+    def check(self, message, text):
+        if text == '*':
+            return True
+        if isinstance(message, types.CallbackQuery):
+            chat_id = message.message.chat.id
+        else:
+            chat_id = message.chat.id
+
+        state = getattr(message, '_conversation_state', _MISSING)
+        if state is _MISSING:
+            state = self.bot.current_states.get_state(chat_id, message.from_user.id)
+            message._conversation_state = state
+
+        if isinstance(text, list):
+            return state in [getattr(item, 'name', item) for item in text]
+        return state == getattr(text, 'name', text)
+
+
+def load_state_storage(db_manager):
+    """Хранилище состояний по настройке STATE_STORAGE"""
+    if STATE_STORAGE == 'redis':
+        logger.info(f"Состояния диалогов хранятся в Redis: {REDIS_URL}")
+        return StateRedisTTLStorage(REDIS_URL)
+    return StateSQLiteStorage(db_manager)
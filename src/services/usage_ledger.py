@@ -0,0 +1,119 @@
+# src/services/usage_ledger.py
+import math
+import time
+import logging
+import threading
+from config.settings import MODEL_PRICING, USAGE_BATCH_SIZE, USAGE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_image_tokens(size):
+    """Оценка токенов изображения для gpt-4o в режиме high detail.
+
+    API не выделяет токены картинки в usage, они входят в prompt_tokens.
+    Картинка вписывается в 2048x2048, короткая сторона ужимается до 768,
+    каждый тайл 512x512 стоит 170 токенов плюс 85 базовых.
+    """
+    if not size:
+        return 0
+    width, height = size
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def usage_cost_micros(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Стоимость запроса в микродолларах по MODEL_PRICING"""
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        return 0
+    # Цена за 1M токенов в долларах равна цене за токен в микродолларах.
+    # cached_tokens входят в prompt_tokens, но оплачиваются по сниженной цене.
+    cached_price = pricing.get('cached_input', pricing['input'])
+    return round(
+        (prompt_tokens - cached_tokens) * pricing['input']
+        + cached_tokens * cached_price
+        + completion_tokens * pricing['output']
+    )
+
+
+class UsageLedger:
+    """Буферизованная запись расхода токенов в usage_log.
+
+    Строки копятся в памяти и пишутся одним executemany, когда набирается
+    пачка или проходит flush_interval секунд.
+    """
+
+    def __init__(self, db_manager, batch_size=USAGE_BATCH_SIZE, flush_interval=USAGE_FLUSH_INTERVAL):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_periodically, name="usage-ledger", daemon=True)
+        self.flusher.start()
+
+    def record(self, user_id, kind, response, latency, image_tokens=0):
+        """Добавляет в буфер расход одного ответа OpenAI"""
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        model = getattr(response, 'model', None) or 'unknown'
+        row = (
+            int(time.time()),
+            user_id,
+            kind,
+            model,
+            prompt_tokens,
+            completion_tokens,
+            image_tokens,
+            int(latency * 1000),
+            usage_cost_micros(self._pricing_key(model), prompt_tokens, completion_tokens, cached_tokens),
+            cached_tokens
+        )
+        with self.lock:
+            self.buffer.append(row)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    @staticmethod
+    def _pricing_key(model):
+        # API возвращает версию модели, например gpt-4o-2024-08-06
+        for name in sorted(MODEL_PRICING, key=len, reverse=True):
+            if model == name or model.startswith(f"{name}-"):
+                return name
+        return model
+
+    def flush(self):
+        """Записывает накопленные строки в базу"""
+        with self.lock:
+            records, self.buffer = self.buffer, []
+        if not records:
+            return 0
+        try:
+            self.db_manager.insert_usage_records(records)
+        except Exception as e:
+            logger.error(f"Не удалось записать {len(records)} строк расхода токенов: {e}")
+            with self.lock:
+                self.buffer[:0] = records
+            return 0
+        return len(records)
+
+    def _flush_periodically(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self, timeout=5):
+        """Последняя запись буфера; фоновая запись к этому моменту уже закончена,
+        чтобы она не попала на закрытое соединение"""
+        self.stop_event.set()
+        self.flusher.join(timeout)
+        self.flush()
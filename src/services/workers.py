@@ -0,0 +1,321 @@
+# src/services/workers.py
+"""Несколько процессов бота за одним приемом апдейтов.
+
+Роутер получает апдейты (getUpdates или вебхук) и пересылает каждый
+воркеру user_id % N по HTTP на 127.0.0.1. Апдейты одного пользователя
+всегда попадают в один процесс в исходном порядке, поэтому альбомы и
+другие буферы в памяти воркера остаются корректными, а шаги диалогов
+лежат в общем state_storage и переживают смену числа воркеров.
+
+Запуск из каталога src:
+    python -m services.workers --workers 4
+    python -m services.workers --workers 4 --webhook-port 8443
+"""
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+import signal
+import subprocess
+import http.client
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from telebot import apihelper, types
+from services.health import write_health_response
+from config.settings import (
+    BOT_WORKERS, WORKER_BASE_PORT, SHUTDOWN_DRAIN_TIMEOUT, SHUTDOWN_EXIT_TIMEOUT,
+    WORKER_HEALTH_INTERVAL, WORKER_HEALTH_FAILURES, WORKER_START_GRACE
+)
+
+logger = logging.getLogger(__name__)
+
+WORKER_HOST = '127.0.0.1'
+RETRY_DELAY = 0.5
+
+
+def update_user_id(update):
+    """id пользователя из апдейта любого типа, 0 если его нет"""
+    for payload in update.values():
+        if isinstance(payload, dict):
+            sender = payload.get('from') or payload.get('user') or payload.get('chat')
+            if sender:
+                return sender.get('id', 0)
+    return 0
+
+
+def partition(update, workers):
+    return update_user_id(update) % workers
+
+
+class WorkerClient:
+    """Очередь апдейтов одного воркера и поток, отправляющий их по порядку"""
+
+    def __init__(self, port, host=WORKER_HOST):
+        self.host = host
+        self.port = port
+        self.queue = queue.Queue()
+        self.connection = None
+        threading.Thread(target=self._send_loop, daemon=True).start()
+
+    def put(self, body):
+        self.queue.put(body)
+
+    def _send_loop(self):
+        while True:
+            body = self.queue.get()
+            try:
+                self._send(body)
+            finally:
+                self.queue.task_done()
+
+    def _send(self, body):
+        # Воркер может перезапускаться: апдейт не теряем, ждем его возвращения
+        while True:
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self.connection.request('POST', '/update', body, {'Content-Type': 'application/json'})
+                response = self.connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    logger.error(f"Воркер на порту {self.port} ответил {response.status}")
+                return
+            except (OSError, http.client.HTTPException) as e:
+                logger.warning(f"Воркер на порту {self.port} недоступен: {e}")
+                if self.connection is not None:
+                    self.connection.close()
+                self.connection = None
+                time.sleep(RETRY_DELAY)
+
+
+class UpdateRouter:
+    """Раскладывает апдейты по воркерам по user_id"""
+
+    def __init__(self, ports, host=WORKER_HOST):
+        self.clients = [WorkerClient(port, host) for port in ports]
+
+    def route(self, update):
+        body = json.dumps(update, ensure_ascii=False).encode('utf-8')
+        self.clients[partition(update, len(self.clients))].put(body)
+
+    def join(self, timeout=None):
+        """Ждет, пока все разосланные апдейты будут приняты воркерами.
+
+        Возвращает число апдейтов, так и не отправленных за timeout.
+        """
+        if timeout is None:
+            for client in self.clients:
+                client.queue.join()
+            return 0
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = sum(client.queue.unfinished_tasks for client in self.clients)
+            if not pending:
+                return 0
+            time.sleep(0.1)
+        return sum(client.queue.unfinished_tasks for client in self.clients)
+
+
+def make_worker_server(bot, port, host=WORKER_HOST, health=None):
+    """HTTP-сервер, принимающий апдейты от роутера для обработчиков бота.
+
+    GET /healthz и /readyz отвечает health (services.health.HealthMonitor).
+    """
+
+    class UpdateHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            write_health_response(self, health)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                bot.process_new_updates([types.Update.de_json(body.decode('utf-8'))])
+                self.send_response(200)
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта: {e}")
+                self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    # Один поток на соединение роутера: апдейты принимаются строго по порядку
+    server = HTTPServer((host, port), UpdateHandler)
+    logger.info(f"Воркер принимает апдейты на {host}:{port}")
+    return server
+
+
+def serve_worker(bot, port, host=WORKER_HOST):
+    make_worker_server(bot, port, host).serve_forever()
+
+
+def make_webhook_server(router, port, secret_token=None):
+    """Вебхук Telegram: проверяет секрет и раскладывает апдейты по воркерам"""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if secret_token and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret_token:
+                self.send_response(403)
+            else:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                router.route(json.loads(body))
+                self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('0.0.0.0', port), WebhookHandler)
+    logger.info(f"Вебхук слушает порт {port}")
+    return server
+
+
+def poll(token, router, stop_event, long_polling_timeout=10):
+    """getUpdates в одном процессе, апдейты раскладываются по воркерам"""
+    offset = None
+    while not stop_event.is_set():
+        try:
+            updates = apihelper.get_updates(token, offset, 100, timeout=long_polling_timeout + 5,
+                                            long_polling_timeout=long_polling_timeout)
+        except Exception as e:
+            logger.error(f"Ошибка getUpdates: {e}")
+            time.sleep(RETRY_DELAY * 10)
+            continue
+        for update in updates:
+            router.route(update)
+            offset = update['update_id'] + 1
+    # Подтверждаем последнюю пачку, иначе после перезапуска Telegram пришлет ее снова
+    if offset is not None:
+        apihelper.get_updates(token, offset, 1, timeout=5, long_polling_timeout=0)
+
+
+def probe_health(port, host=WORKER_HOST, timeout=5):
+    """True, если воркер ответил 200 на GET /healthz"""
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('GET', '/healthz')
+        response = connection.getresponse()
+        response.read()
+        return response.status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+class WorkerPool:
+    """Процессы main.py в режиме воркера.
+
+    Упавший процесс запускается заново. Живой, но не отвечающий на
+    /healthz WORKER_HEALTH_FAILURES проверок подряд получает SIGKILL и
+    тоже перезапускается: так ловится зависание всего процесса, которое
+    его собственный watchdog обработать не может.
+    """
+
+    def __init__(self, count, base_port=WORKER_BASE_PORT, command=None):
+        main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+        self.command = command or [sys.executable, main_path]
+        self.ports = [base_port + index for index in range(count)]
+        self.started = [0.0] * count
+        self.failures = [0] * count
+        self.processes = [self._spawn(index) for index in range(count)]
+        self.stopping = False
+
+    def _spawn(self, index):
+        self.started[index] = time.monotonic()
+        self.failures[index] = 0
+        return subprocess.Popen(self.command + [
+            '--worker-port', str(self.ports[index]), '--worker-index', str(index)
+        ])
+
+    def supervise(self, interval=1.0, health_interval=WORKER_HEALTH_INTERVAL):
+        next_probe = time.monotonic() + health_interval
+        while not self.stopping:
+            for index, process in enumerate(self.processes):
+                if process.poll() is not None and not self.stopping:
+                    logger.error(f"Воркер {index} завершился с кодом {process.returncode}, перезапуск")
+                    self.processes[index] = self._spawn(index)
+            if time.monotonic() >= next_probe:
+                next_probe = time.monotonic() + health_interval
+                self.check_health()
+            time.sleep(interval)
+
+    def check_health(self):
+        """Проверка /healthz воркеров; зависший процесс убивается, supervise запустит его заново"""
+        now = time.monotonic()
+        for index, process in enumerate(self.processes):
+            if self.stopping or process.poll() is not None or now - self.started[index] < WORKER_START_GRACE:
+                continue
+            if probe_health(self.ports[index]):
+                self.failures[index] = 0
+                continue
+            self.failures[index] += 1
+            if self.failures[index] >= WORKER_HEALTH_FAILURES:
+                logger.error(f"Воркер {index} не отвечает на /healthz {self.failures[index]} раз подряд, SIGKILL")
+                process.kill()
+
+    def stop(self, timeout=SHUTDOWN_EXIT_TIMEOUT + 5):
+        """SIGTERM воркерам: они дожидаются начатых анализов и выходят сами"""
+        self.stopping = True
+        for process in self.processes:
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            try:
+                process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                logger.error(f"Воркер {index} не остановился за {timeout} с, SIGKILL")
+                process.kill()
+                process.wait()
+
+
+def main():
+    from dotenv import load_dotenv
+    from services.http_session import install_telegram_session
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    load_dotenv(os.path.join(base_dir, '.env'))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    install_telegram_session()
+
+    args = sys.argv[1:]
+    count = int(args[args.index('--workers') + 1]) if '--workers' in args else BOT_WORKERS
+    pool = WorkerPool(count)
+    router = UpdateRouter(pool.ports)
+    threading.Thread(target=pool.supervise, daemon=True).start()
+    logger.info(f"Запущено воркеров: {count}")
+
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        # Воркеры, которые завершаются во время остановки, больше не перезапускаются
+        pool.stopping = True
+        stop_event.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    server = None
+    if '--webhook-port' in args:
+        server = make_webhook_server(router, int(args[args.index('--webhook-port') + 1]), os.getenv('WEBHOOK_SECRET'))
+        receiver = threading.Thread(target=server.serve_forever, daemon=True)
+    else:
+        receiver = threading.Thread(target=poll, args=(os.getenv('TELEGRAM_BOT_TOKEN'), router, stop_event), daemon=True)
+    receiver.start()
+    stop_event.wait()
+
+    # Остановка: перестаем принимать апдейты, досылаем принятые, гасим воркеров
+    started = time.monotonic()
+    if server:
+        server.shutdown()
+    receiver.join(SHUTDOWN_DRAIN_TIMEOUT)
+    not_sent = router.join(SHUTDOWN_DRAIN_TIMEOUT)
+    pool.stop()
+    logger.info(f"Роутер остановлен за {time.monotonic() - started:.1f} с, не доставлено апдейтов: {not_sent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,147 @@
+import json
+import re
 from telebot import types
 
+
+class PrebuiltKeyboard(types.JsonSerializable):
+    """Клавиатура, сериализованная в JSON один раз.
+
+    TeleBot вызывает to_json() у reply_markup при каждой отправке сообщения,
+    поэтому статичные меню хранят готовую строку и не пересобираются.
+    """
+    __slots__ = ('_payload',)
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    @classmethod
+    def from_markup(cls, markup):
+        return cls(markup.to_json())
+
+    def to_json(self):
+        return self._payload
+
+
+class KeyboardTemplate:
+    """Шаблон динамической клавиатуры.
+
+    Разметка сериализуется один раз с маркерами @@name@@ на месте
+    изменяемых значений, при рендере только склеиваются готовые куски.
+    """
+    _MARKER = re.compile(r'@@(\w+)@@')
+
+    def __init__(self, markup):
+        parts = self._MARKER.split(markup.to_json())
+        self._chunks = parts[0::2]
+        self._fields = parts[1::2]
+
+    def render(self, **values):
+        pieces = [self._chunks[0]]
+        for field, chunk in zip(self._fields, self._chunks[1:]):
+            # json.dumps экранирует кавычки и спецсимволы внутри строки JSON
+            pieces.append(json.dumps(str(values[field]), ensure_ascii=False)[1:-1])
+            pieces.append(chunk)
+        return PrebuiltKeyboard(''.join(pieces))
+
+
+def _reply_keyboard(*buttons):
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    for text in buttons:
+        markup.add(types.KeyboardButton(text))
+    return PrebuiltKeyboard.from_markup(markup)
+
+
+def _correction_template():
+    markup = types.InlineKeyboardMarkup()
+    markup.row(
+        types.InlineKeyboardButton("Всё верно ✅", callback_data="meal_correct:@@meal_id@@"),
+        types.InlineKeyboardButton("Указать название 🍽️", callback_data="meal_rename:@@meal_id@@")
+    )
+    return KeyboardTemplate(markup)
+
+
+def _history_template():
+    markup = types.InlineKeyboardMarkup()
+    markup.row(types.InlineKeyboardButton("Раньше ▶️", callback_data="@@data@@"))
+    return KeyboardTemplate(markup)
+
+
+# Реестр статичных клавиатур, собирается один раз при импорте модуля
+KEYBOARDS = {
+    'main': _reply_keyboard(
+        "🔧 Настроить профиль",
+        "🍽️ Анализ блюда",
+        "📊 Мой прогресс",
+        "📜 История блюд",
+        "💰 Пополнить баланс"
+    ),
+    'profile': _reply_keyboard(
+        "Возраст",
+        "Рост",
+        "Вес",
+        "Талия",
+        "Цель",
+        "Уровень активности",
+        "Напоминания",
+        "Назад в меню"
+    ),
+    'goals': _reply_keyboard(
+        "Похудение",
+        "Набор массы",
+        "Поддержание веса",
+        "Назад в меню"
+    ),
+    'activity': _reply_keyboard(
+        "Малоподвижный",
+        "Умеренно активный",
+        "Активный",
+        "Очень активный",
+        "Экстремально активный",
+        "Назад в меню"
+    ),
+}
+
+CORRECTION_KEYBOARD = _correction_template()
+HISTORY_KEYBOARD = _history_template()
+
+
 def main_menu():
     """Главное меню"""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("🔧 Настроить профиль"))
-    markup.add(types.KeyboardButton("🍽️ Анализ блюда"))
-    markup.add(types.KeyboardButton("📊 Мой прогресс"))
-    markup.add(types.KeyboardButton("💰 Пополнить баланс"))
-    return markup
+    return KEYBOARDS['main']
 
 def profile_menu():
     """Меню настройки профиля"""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("Возраст"))
-    markup.add(types.KeyboardButton("Рост"))
-    markup.add(types.KeyboardButton("Вес"))
-    markup.add(types.KeyboardButton("Цель"))
-    markup.add(types.KeyboardButton("Уровень активности"))
-    markup.add(types.KeyboardButton("Назад в меню"))
-    return markup
+    return KEYBOARDS['profile']
 
 def goals_menu():
     """Меню выбора цели"""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("Похудение"))
-    markup.add(types.KeyboardButton("Набор массы"))
-    markup.add(types.KeyboardButton("Поддержание веса"))
-    markup.add(types.KeyboardButton("Назад в меню"))
-    return markup
+    return KEYBOARDS['goals']
 
 def activity_menu():
     """Меню выбора уровня активности"""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("Малоподвижный"))
-    markup.add(types.KeyboardButton("Умеренно активный"))
-    markup.add(types.KeyboardButton("Активный"))
-    markup.add(types.KeyboardButton("Очень активный"))
-    markup.add(types.KeyboardButton("Экстремально активный"))
-    markup.add(types.KeyboardButton("Назад в меню"))
-    return markup
+    return KEYBOARDS['activity']
+
+def tariff_menu(tariff_plans):
+    """Меню выбора тарифа, собирается один раз на набор тарифов"""
+    key = ('tariff',) + tuple((name, plan['price']) for name, plan in tariff_plans.items())
+    keyboard = KEYBOARDS.get(key)
+    if keyboard is None:
+        buttons = [f"{name} ({price} ₽)" for name, price in key[1:]]
+        keyboard = KEYBOARDS[key] = _reply_keyboard(*buttons, "Назад в меню")
+    return keyboard
+
+def reminders_menu(presets):
+    """Меню выбора напоминаний, собирается один раз на набор вариантов"""
+    key = ('reminders',) + tuple(presets)
+    keyboard = KEYBOARDS.get(key)
+    if keyboard is None:
+        keyboard = KEYBOARDS[key] = _reply_keyboard(*presets, "Назад в меню")
+    return keyboard
+
+def correction_keyboard(meal_id):
+    """Клавиатура для коррекции блюда"""
+    return CORRECTION_KEYBOARD.render(meal_id=meal_id)
+
+def history_keyboard(callback_data):
+    """Кнопка следующей страницы истории с курсором в callback_data"""
+    return HISTORY_KEYBOARD.render(data=callback_data)
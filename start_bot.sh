@@ -2,31 +2,95 @@
 cd /root/food_naked
 source new_venv/bin/activate
 
-# Более агрессивная очистка процессов
+BOT_PATTERN="src/main.py|services.workers"
+# Процесс, получающий SIGTERM: бот в режиме одного процесса или роутер.
+# Воркеров (main.py --worker-port) роутер останавливает сам, когда дошлет
+# им уже принятые апдейты
+ROUTER_PATTERN="services\.workers|src/main\.py$"
+BOT_PID=""
+# Сколько ждать завершения начатых анализов после SIGTERM: бот сам выходит
+# не позже SHUTDOWN_DRAIN_TIMEOUT + 15 с (SHUTDOWN_EXIT_TIMEOUT), плюс запас
+DRAIN_TIMEOUT=$(( ${SHUTDOWN_DRAIN_TIMEOUT:-60} + 25 ))
+
+# Корректная остановка: SIGTERM, бот дорабатывает начатые анализы и выходит сам.
+# SIGKILL только если он не уложился в DRAIN_TIMEOUT. Оставшиеся от прошлого
+# запуска воркеры без роутера получают SIGTERM напрямую
 cleanup() {
-    # Завершаем все процессы, связанные с ботом
-    pkill -9 -f "python3 src/main.py"
-    pkill -9 -f "start_bot.sh"
-    pkill -9 -f "telegram"
-    pkill -9 -f "telebot"
+    if [ -n "$BOT_PID" ] && kill -0 "$BOT_PID" 2> /dev/null; then
+        kill -TERM "$BOT_PID"
+    else
+        pkill -TERM -f "$ROUTER_PATTERN" || pkill -TERM -f "$BOT_PATTERN" || return 0
+    fi
+    for _ in $(seq "$DRAIN_TIMEOUT"); do
+        pgrep -f "$BOT_PATTERN" > /dev/null || return 0
+        sleep 1
+    done
+    echo "Бот не остановился за $DRAIN_TIMEOUT с, SIGKILL $(date)" >> /root/food_naked/bot_start.log
+    pkill -9 -f "$BOT_PATTERN"
+}
+
+shutdown() {
+    cleanup
+    exit 0
 }
 
 # Обработка сигналов завершения
-trap cleanup SIGINT SIGTERM
+trap shutdown SIGINT SIGTERM
 
 # Первоначальная очистка
 cleanup
 
-# Основной цикл запуска
+HEALTH_URL="http://127.0.0.1:${HEALTH_PORT:-8440}/healthz"
+# Сколько проверок /healthz подряд (раз в 10 с) может не ответить процесс
+HEALTH_FAILURES=6
+
+# Основной цикл запуска. Зависшие потоки бот находит сам (watchdog в
+# services/health.py): пишет их стеки в лог и выходит с ошибкой, а цикл
+# сразу запускает его заново. /healthz проверяется только на случай, когда
+# не отвечает весь процесс и watchdog сработать не может. Во время остановки
+# бот отвечает 200. Воркеров проверяет роутер, а не этот скрипт
 while true; do
-    # Проверяем, нет ли уже запущенных процессов
-    if ! pgrep -f "python3 src/main.py" > /dev/null; then
-        echo "Запуск бота $(date)" >> /root/food_naked/bot_start.log
-        python3 src/main.py > bot.log 2>&1
+    echo "Запуск бота $(date)" >> /root/food_naked/bot_start.log
+    # BOT_WORKERS > 1: роутер раскладывает апдейты по процессам-воркерам
+    # и сам перезапускает упавших, /healthz есть у каждого воркера на его порту
+    if [ "${BOT_WORKERS:-1}" -gt 1 ]; then
+        (cd src && exec python3 -m services.workers --workers "$BOT_WORKERS") > bot.log 2>&1 &
     else
-        echo "Бот уже запущен $(date)" >> /root/food_naked/bot_start.log
+        python3 src/main.py > bot.log 2>&1 &
     fi
-    
-    # Пауза перед возможным перезапуском
-    sleep 5
+    BOT_PID=$!
+
+    failures=0
+    no_listener=0
+    # sleep в фоне и wait прерываются сигналом, чтобы trap сработал сразу
+    while kill -0 "$BOT_PID" 2> /dev/null; do
+        sleep 10 &
+        wait $!
+        [ "${BOT_WORKERS:-1}" -gt 1 ] && continue
+        curl -sf -m 5 -o /dev/null "$HEALTH_URL"
+        case $? in
+            0) failures=0 ;;
+            # Соединение отклонено: бот еще запускается или не смог занять
+            # HEALTH_PORT. Это не зависание - зависший процесс порт не закрывает
+            7)
+                failures=0
+                no_listener=$((no_listener + 1))
+                if [ "$no_listener" -eq "$HEALTH_FAILURES" ]; then
+                    echo "Никто не слушает $HEALTH_URL, проверки здоровья не работают $(date)" >> /root/food_naked/bot_start.log
+                fi
+                ;;
+            # 503 (curl -f) или нет ответа за 5 с
+            *) failures=$((failures + 1)) ;;
+        esac
+        if [ "$failures" -ge "$HEALTH_FAILURES" ]; then
+            echo "Бот не отвечает на $HEALTH_URL, SIGKILL $(date)" >> /root/food_naked/bot_start.log
+            kill -9 "$BOT_PID"
+        fi
+    done
+    wait "$BOT_PID"
+    echo "Бот завершился с кодом $? $(date)" >> /root/food_naked/bot_start.log
+    BOT_PID=""
+
+    # Короткая пауза, чтобы не перезапускать в цикле при ошибке старта
+    sleep 1
 done
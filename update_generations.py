@@ -1,21 +1,26 @@
-import sqlite3
+import os
+import sys
 
-# Подключаемся к базе данных
-conn = sqlite3.connect('user_profiles.db')
-cursor = conn.cursor()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from database.db_manager import DatabaseManager
 
-# Выполняем обновление
-cursor.execute('UPDATE users SET free_generations = 5 WHERE free_generations > 5')
+# Подключаемся к базе данных
+db_manager = DatabaseManager('user_profiles.db')
 
-# Сохраняем изменения
-conn.commit()
+# Ограничиваем бесплатные генерации пятью корректирующими проводками,
+# чтобы остаток оставался согласован с книгой генераций
+users = db_manager.connection.execute(
+    'SELECT user_id, free_generations FROM users WHERE free_generations > 5'
+).fetchall()
+for user_id, free_gens in users:
+    db_manager.adjust_generations(user_id, 5 - free_gens, f"cap-free-5:{user_id}:{free_gens}")
 
 # Проверяем результат
-cursor.execute('SELECT user_id, free_generations FROM users')
-results = cursor.fetchall()
+results = db_manager.connection.execute('SELECT user_id, free_generations FROM users').fetchall()
 print("Обновленные данные пользователей:")
 for user_id, free_gens in results:
     print(f"Пользователь {user_id}: {free_gens} генераций")
 
 # Закрываем соединение
-conn.close()
\ No newline at end of file
+db_manager.connection.close()